@@ -1,7 +1,30 @@
 from django.contrib import admin
-from analyzer.models import Preset
+from analyzer.models import Preset, UploadJob, Statement
+from analyzer.presets import presets_changed
 
 @admin.register(Preset)
 class PresetAdmin(admin.ModelAdmin):
     list_display = ('name', 'preset_type')
-    search_fields = ('name',)
\ No newline at end of file
+    search_fields = ('name',)
+    
+    # the views serve presets from a per-process cache
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        presets_changed()
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        presets_changed()
+    
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        presets_changed()
+
+@admin.register(UploadJob)
+class UploadJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'file_count', 'attached', 'created_at')
+    list_filter = ('status',)
+
+@admin.register(Statement)
+class StatementAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'row_count', 'reference_count', 'created_at')
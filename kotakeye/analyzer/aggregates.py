@@ -0,0 +1,337 @@
+import hashlib
+from functools import lru_cache
+
+import pandas as pd
+
+from analyzer.amounts import AmountIndex
+from analyzer.categories import ensure_categories
+from analyzer.rollups import choose_bucket, rollup
+from analyzer.merge import row_keys, duplicate_masks, balance_breaks
+from analyzer.queries import (statement_transactions, date_range_query, amount_query, keyword_query,
+                              daily_summary, amount_summary, keyword_summary)
+from analyzer.schema import to_rupees, withdrawals, deposits
+from analyzer.store import load_statement, save_aggregate, statement_aggregate
+from analyzer.utils import (comparison_text, match_keywords, parse_keywords,
+                            plot_daily_totals, plot_keywords, plot_amount_histogram)
+
+
+# Merged aggregates kept per combination of statements (and keyword list).
+AGGREGATE_CACHE_SIZE = 32
+
+
+def daily_totals(df):
+    """Transaction count and withdrawal/deposit sums per day, in paise."""
+    return pd.DataFrame({
+        'Date': df['Date'].dt.normalize(),
+        'Withdrawal': withdrawals(df),
+        'Deposit': deposits(df),
+    }).groupby('Date').agg(
+        Count=('Withdrawal', 'size'),
+        Withdrawal=('Withdrawal', 'sum'),
+        Deposit=('Deposit', 'sum'),
+    ).reset_index()
+
+
+def amount_counts(df):
+    """Number of transactions per distinct signed amount.
+
+    Amount presets only look at the Amount column, so a comparison selects
+    exactly the amounts here that it would select on df.
+    """
+    return df.groupby('Amount').size().rename('Count').reset_index()
+
+
+def keyword_totals(df, keywords):
+    """Count and paise sums per matched keyword label, for one keyword list."""
+    hits, labels = match_keywords(df, keywords)
+    matched = hits.any(axis=1)
+    return pd.DataFrame({
+        'Keyword': labels[matched],
+        'Withdrawal': withdrawals(df)[matched],
+        'Deposit': deposits(df)[matched],
+    }).groupby('Keyword').agg(
+        Count=('Withdrawal', 'size'),
+        Withdrawal=('Withdrawal', 'sum'),
+        Deposit=('Deposit', 'sum'),
+    ).reset_index()
+
+
+def category_totals(df):
+    """Count and paise sums per category, from one groupby of the stored labels."""
+    df = ensure_categories(df)
+    totals = pd.DataFrame({
+        'Category': df['Category'],
+        'Withdrawal': withdrawals(df),
+        'Deposit': deposits(df),
+    }).groupby('Category', observed=True).agg(
+        Count=('Withdrawal', 'size'),
+        Withdrawal=('Withdrawal', 'sum'),
+        Deposit=('Deposit', 'sum'),
+    ).reset_index()
+    # plain strings, so statements with different category lists merge
+    return totals.assign(Category=totals['Category'].astype(str))
+
+
+# name: (builder, columns the per-statement frames are merged on)
+AGGREGATES = {
+    'daily': (daily_totals, ['Date']),
+    'amounts': (amount_counts, ['Amount']),
+    'categories': (category_totals, ['Category']),
+}
+
+# Part of every stored aggregate's name; bump when builders change so
+# aggregates saved by an older version are rebuilt instead of misread.
+AGGREGATE_VERSION = 2
+
+
+def _stored_name(name):
+    return f'{name}-v{AGGREGATE_VERSION}'
+
+
+def _row_keys_frame(df):
+    return pd.DataFrame({'Key': row_keys(df)})
+
+
+def save_aggregates(handle, df):
+    """Build the aggregates of a freshly saved statement."""
+    save_aggregate(handle, _stored_name('keys'), _row_keys_frame(df))
+    for name, (build, _) in AGGREGATES.items():
+        save_aggregate(handle, _stored_name(name), build(df))
+
+
+def _keywords_name(keywords):
+    return 'keywords-' + hashlib.sha1(','.join(keywords).encode()).hexdigest()[:16]
+
+
+@lru_cache(maxsize=AGGREGATE_CACHE_SIZE)
+def _duplicate_rows(handles):
+    keys = [statement_aggregate(handle, _stored_name('keys'), _row_keys_frame)['Key'].to_numpy()
+            for handle in handles]
+    return tuple(duplicate_masks(keys))
+
+
+def duplicate_rows(handles):
+    """Per statement, a boolean array of rows already seen in an earlier statement."""
+    return _duplicate_rows(tuple(handles))
+
+
+def merge_report(handles):
+    """Duplicate rows dropped from these statements and balance breaks left after."""
+    return _merge_report(tuple(handles))
+
+
+@lru_cache(maxsize=AGGREGATE_CACHE_SIZE)
+def _merge_report(handles):
+    masks = _duplicate_rows(handles)
+    columns = ['Date', 'Amount', 'Balance']
+    kept = pd.concat([load_statement(handle)[columns][~mask] for handle, mask in zip(handles, masks)],
+                     ignore_index=True)
+    return {
+        'duplicates': int(sum(mask.sum() for mask in masks)),
+        'balance_breaks': balance_breaks(kept),
+    }
+
+
+@lru_cache(maxsize=AGGREGATE_CACHE_SIZE)
+def _combined(handles, name, keywords=None, persist=True):
+    if keywords is not None:
+        build, keys = (lambda df: keyword_totals(df, keywords)), ['Keyword']
+        name = _keywords_name(keywords)
+    else:
+        build, keys = AGGREGATES[name]
+
+    # merging costs the size of the aggregates, not of the statements
+    if persist:
+        frames = [statement_aggregate(handle, _stored_name(name), build) for handle in handles]
+    else:
+        frames = [build(load_statement(handle)) for handle in handles]
+
+    # rows repeated from an earlier statement are counted once: their share
+    # is subtracted again, which only costs the size of the overlap
+    for handle, mask in zip(handles, _duplicate_rows(handles)):
+        if mask.any():
+            frames.append(_negated(build(load_statement(handle)[mask]), keys))
+
+    merged = pd.concat(frames, ignore_index=True).groupby(keys, as_index=False).sum()
+    return merged[merged['Count'] > 0].reset_index(drop=True)
+
+
+def _negated(aggregate, keys):
+    values = [column for column in aggregate.columns if column not in keys]
+    return aggregate.assign(**{column: -aggregate[column] for column in values})
+
+
+@lru_cache(maxsize=AGGREGATE_CACHE_SIZE)
+def _daily_by_date(handles):
+    # sorted by date, so any date range is a slice found by binary search
+    return _combined(handles, 'daily').set_index('Date').sort_index()
+
+
+def _date_range_days(handles, start_date, end_date):
+    # a missing date leaves that end of the range open, as in date_range_mask
+    start = pd.Timestamp(start_date) if start_date is not None else None
+    end = pd.Timestamp(end_date) if end_date is not None else None
+    return _daily_by_date(handles).loc[start:end]
+
+
+def _rolled_up(days, start_date, end_date):
+    """Daily totals rolled up to a bucket that keeps the chart small, and that bucket."""
+    bucket = choose_bucket(start_date or days.index.min(), end_date or days.index.max())
+    return rollup(days, bucket), bucket
+
+
+@lru_cache(maxsize=AGGREGATE_CACHE_SIZE)
+def _date_range_rollup(handles, start_date, end_date):
+    return _rolled_up(_date_range_days(handles, start_date, end_date), start_date, end_date)
+
+
+def combined_categories(handles):
+    return _combined(tuple(handles), 'categories')
+
+
+def combined_keywords(handles, keywords, persist=True):
+    """Keyword totals of the statements, stored per statement unless persist is false."""
+    return _combined(tuple(handles), 'keywords', tuple(keywords), persist)
+
+
+@lru_cache(maxsize=AGGREGATE_CACHE_SIZE)
+def _combined_amount_index(handles):
+    amounts = _combined(handles, 'amounts')
+    return amounts, AmountIndex(amounts['Amount'].to_numpy(), amounts['Count'].to_numpy())
+
+
+@lru_cache(maxsize=AGGREGATE_CACHE_SIZE)
+def statement_amount_index(handle):
+    """AmountIndex of one stored statement's rows, built once per process."""
+    return AmountIndex(load_statement(handle)['Amount'].to_numpy())
+
+
+def _amount_span(handles, preset):
+    amounts, index = _combined_amount_index(tuple(handles))
+    span = index.span(preset.amount_value, preset.comparison_type, preset.amount_max)
+    if span is None:
+        return None
+    return amounts, index, span, comparison_text(preset.amount_value, preset.comparison_type, preset.amount_max)
+
+
+def preset_totals(handles, preset):
+    """Count, withdrawal and deposit totals of a preset over stored statements.
+
+    Returns (count, withdrawal, deposit, extra) where extra holds the
+    preset's display details (keywords and keyword_stats, or
+    comparison_text), or None when the preset cannot be evaluated.
+    """
+    if preset.preset_type == 'date_range':
+        selected = _date_range_days(tuple(handles), preset.start_date, preset.end_date)
+        return (int(selected['Count'].sum()), to_rupees(selected['Withdrawal'].sum()),
+                to_rupees(selected['Deposit'].sum()), {})
+
+    elif preset.preset_type == 'keyword':
+        keyword_list = parse_keywords(preset.keywords)
+        if not keyword_list:
+            return None
+        # totals of saved presets are stored with the statements; inline API
+        # presets can name any keywords, so theirs are only kept in memory
+        groups = combined_keywords(handles, keyword_list, persist=preset.pk is not None)
+        labels = groups['Keyword'].str.split(', ')
+        keyword_stats = list()
+        for keyword in keyword_list:
+            selected = groups[labels.map(lambda label: keyword in label).to_numpy(dtype=bool)]
+            keyword_stats.append({
+                'keyword': keyword,
+                'count': int(selected['Count'].sum()),
+                'withdrawal': to_rupees(selected['Withdrawal'].sum()),
+                'deposit': to_rupees(selected['Deposit'].sum()),
+            })
+        return (int(groups['Count'].sum()), to_rupees(groups['Withdrawal'].sum()),
+                to_rupees(groups['Deposit'].sum()), {'keywords': keyword_list, 'keyword_stats': keyword_stats})
+
+    elif preset.preset_type == 'amount_filter':
+        matched = _amount_span(handles, preset)
+        if matched is None:
+            return None
+        amounts, index, span, text = matched
+        selected = amounts.iloc[index.order[span]]
+        counts = selected['Count'].to_numpy()
+        return (int(counts.sum()), to_rupees((withdrawals(selected) * counts).sum()),
+                to_rupees((deposits(selected) * counts).sum()), {'comparison_text': text})
+
+    return None
+
+
+def _in_rupees(totals):
+    return pd.DataFrame({
+        'Withdrawal': to_rupees(totals['Withdrawal']),
+        'Deposit': to_rupees(totals['Deposit']),
+    }, index=totals.index)
+
+
+def render_aggregate_chart(handles, preset, chart_format='png'):
+    """render_preset_chart for stored statements, drawn from their aggregates."""
+    if preset.preset_type == 'date_range':
+        rolled, bucket = _date_range_rollup(tuple(handles), preset.start_date, preset.end_date)
+        if rolled.empty:
+            return None
+        return plot_daily_totals(_in_rupees(rolled), bucket, chart_format)
+
+    elif preset.preset_type == 'keyword':
+        keyword_list = parse_keywords(preset.keywords)
+        if not keyword_list:
+            return None
+        groups = combined_keywords(handles, keyword_list)
+        if groups.empty:
+            return None
+        return plot_keywords(_in_rupees(groups.set_index('Keyword')), chart_format)
+
+    elif preset.preset_type == 'amount_filter':
+        matched = _amount_span(handles, preset)
+        if matched is None:
+            return None
+        _, index, span, text = matched
+        if span.start == span.stop:
+            return None
+        return plot_amount_histogram(*index.histogram(span), preset.amount_value, text, chart_format)
+
+    return None
+
+
+def render_query_chart(handles, preset, chart_format='png'):
+    """render_aggregate_chart for statements too large to load, drawn from GROUP BY queries.
+
+    Only the aggregated rows (days, keyword combinations or distinct
+    amounts) leave the database, never the matching transactions.
+    """
+    transactions = statement_transactions(handles)
+    if preset.preset_type == 'date_range':
+        rows = daily_summary(date_range_query(transactions, preset.start_date, preset.end_date))
+        if not rows:
+            return None
+        dates, counts, withdrawal, deposit = zip(*rows)
+        days = pd.DataFrame({'Count': counts, 'Withdrawal': withdrawal, 'Deposit': deposit},
+                            index=pd.to_datetime(dates)).sort_index()
+        rolled, bucket = _rolled_up(days, preset.start_date, preset.end_date)
+        return plot_daily_totals(_in_rupees(rolled), bucket, chart_format)
+
+    elif preset.preset_type == 'keyword':
+        keyword_list = parse_keywords(preset.keywords)
+        if not keyword_list:
+            return None
+        rows = [(', '.join(keyword for keyword, flag in zip(keyword_list, flags) if flag), withdrawal, deposit)
+                for flags, _, withdrawal, deposit in keyword_summary(keyword_query(transactions, keyword_list),
+                                                                    keyword_list) if any(flags)]
+        if not rows:
+            return None
+        groups = pd.DataFrame(rows, columns=['Keyword', 'Withdrawal', 'Deposit']).groupby('Keyword').sum()
+        return plot_keywords(_in_rupees(groups), chart_format)
+
+    elif preset.preset_type == 'amount_filter':
+        queryset = amount_query(transactions, preset.amount_value, preset.comparison_type, preset.amount_max)
+        rows = amount_summary(queryset) if queryset is not None else []
+        if not rows:
+            return None
+        amounts, counts = zip(*rows)
+        index = AmountIndex(amounts, counts)
+        text = comparison_text(preset.amount_value, preset.comparison_type, preset.amount_max)
+        return plot_amount_histogram(*index.histogram(slice(0, len(index))), preset.amount_value, text, chart_format)
+
+    return None
@@ -0,0 +1,80 @@
+import numpy as np
+
+from analyzer.schema import to_paise, to_rupees
+
+
+# Bins of the amount distribution chart.
+HISTOGRAM_BINS = 20
+
+# Comparisons an amount preset can use. '=' is what the preset form stores;
+# 'eq' is accepted as the same comparison.
+EQUAL = ('=', 'eq')
+COMPARISONS = EQUAL + ('lt', 'gt', 'between')
+
+
+def histogram(amounts, weights=None, bins=HISTOGRAM_BINS):
+    """Counts and rupee bin edges of the non-zero paise amounts given."""
+    amounts = np.asarray(amounts)
+    moving = amounts != 0
+    if weights is not None:
+        weights = np.asarray(weights)[moving]
+    return np.histogram(to_rupees(amounts[moving]), bins=bins, weights=weights)
+
+
+class AmountIndex:
+    """Rows ordered by the amount they move, for answering comparisons by slicing.
+
+    A transaction is either a withdrawal or a deposit, so comparing "either
+    side" with an amount is comparing the absolute value of the signed paise
+    Amount column. Those values are sorted once per data set; every
+    comparison is then a pair of binary searches selecting a contiguous
+    run of the sorted rows. counts, if given, weights each row (for the
+    amounts aggregate, which holds one row per distinct amount).
+    """
+
+    def __init__(self, amounts, counts=None):
+        magnitudes = np.abs(np.asarray(amounts, dtype=np.int64))
+        self.order = np.argsort(magnitudes, kind='stable')
+        self.sorted = magnitudes[self.order]
+        self.counts = np.asarray(counts)[self.order] if counts is not None else None
+        # rows before this one move nothing on either side
+        self.moving = int(np.searchsorted(self.sorted, 0, side='right'))
+
+    def __len__(self):
+        return len(self.order)
+
+    def _search(self, amount, side):
+        return int(np.searchsorted(self.sorted, to_paise(amount), side=side))
+
+    def span(self, amount, comparison_type, amount_max=None):
+        """The slice of sorted rows matching a comparison, or None if it cannot be evaluated."""
+        if comparison_type not in COMPARISONS or amount is None:
+            return None
+
+        if comparison_type in EQUAL:
+            # the other side of every transaction is 0, so 0 matches them all
+            if not amount:
+                return slice(0, len(self))
+            start, stop = self._search(amount, 'left'), self._search(amount, 'right')
+        elif comparison_type == 'lt':
+            start, stop = self.moving, self._search(amount, 'left')
+        elif comparison_type == 'gt':
+            start, stop = self._search(amount, 'right'), len(self)
+        else:
+            if amount_max is None:
+                return None
+            start, stop = self._search(amount, 'left'), self._search(amount_max, 'right')
+        return slice(start, max(start, stop))
+
+    def rows(self, span):
+        """Positions of the rows in span, in their original order."""
+        return np.sort(self.order[span])
+
+    def mask(self, span):
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.order[span]] = True
+        return mask
+
+    def histogram(self, span, bins=HISTOGRAM_BINS):
+        weights = self.counts[span] if self.counts is not None else None
+        return histogram(self.sorted[span], weights, bins)
@@ -0,0 +1,66 @@
+import hashlib
+import os
+
+from analyzer.columnar import write_frame, read_frame, frame_size, remove_frame
+from analyzer.extraction import PARSER_VERSION
+
+
+class ParseCache:
+    """On-disk cache of parsed statements keyed by the PDF's content hash.
+
+    Entries are column directories written by analyzer.columnar. The least
+    recently used entries are evicted once the cache grows past max_bytes;
+    directory mtimes record when an entry was last read or written.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+
+    def key(self, data, password=None):
+        # the password is part of the key so an encrypted statement is never
+        # served to someone who could not have opened it
+        digest = hashlib.sha256()
+        digest.update(f'v{PARSER_VERSION}:{password or ""}:'.encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            df = read_frame(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return df
+
+    def put(self, key, df):
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            write_frame(self._path(key), df)
+        except OSError:
+            # another process stored the same statement first
+            return
+        self.evict()
+
+    def evict(self):
+        entries = list()
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and not entry.name.endswith('.tmp'):
+                try:
+                    entries.append((entry.stat().st_mtime, frame_size(entry.path), entry.path))
+                except OSError:
+                    continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                remove_frame(path)
+            except OSError:
+                continue
+            total -= size
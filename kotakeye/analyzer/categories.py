@@ -0,0 +1,212 @@
+import csv
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from analyzer.matching import KeywordMatcher
+from analyzer.schema import to_paise
+
+
+UNCATEGORIZED = 'Uncategorized'
+
+# Rules tried in order; the first one matching a transaction gives its
+# category. A rule matches when one of its keywords occurs in the narration
+# as a whole word (case-insensitively, as plain text, so 'rent' does not
+# match 'CURRENT A/C'; a rule without keywords matches every narration),
+# the amount moved lies within min_amount..max_amount rupees (both
+# included, either may be left out) and, if debit is set, the transaction
+# is a withdrawal (True) or a deposit (False).
+DEFAULT_RULES = [
+    {'category': 'Salary', 'keywords': ['salary', 'payroll'], 'debit': False},
+    {'category': 'Interest', 'keywords': ['int.pd', 'interest paid'], 'debit': False},
+    {'category': 'Bank charges', 'keywords': ['charges', 'chrg', 'sms alert'], 'max_amount': 1000, 'debit': True},
+    {'category': 'Cash', 'keywords': ['atm wdl', 'cash wdl', 'atm/', 'cash withdrawal']},
+    {'category': 'Food', 'keywords': ['swiggy', 'zomato', 'dominos', 'mcdonald', 'starbucks', 'eatsure']},
+    {'category': 'Groceries', 'keywords': ['bigbasket', 'blinkit', 'zepto', 'dmart', 'grofers', 'instamart']},
+    {'category': 'Shopping', 'keywords': ['amazon', 'flipkart', 'myntra', 'ajio', 'nykaa', 'meesho']},
+    {'category': 'Transport', 'keywords': ['uber', 'olacabs', 'rapido', 'irctc', 'fastag', 'metro rail']},
+    {'category': 'Fuel', 'keywords': ['petrol', 'indian oil', 'hpcl', 'bpcl', 'fuel']},
+    {'category': 'Entertainment', 'keywords': ['netflix', 'spotify', 'hotstar', 'bookmyshow', 'youtube']},
+    {'category': 'Bills', 'keywords': ['electricity', 'bescom', 'airtel', 'jio', 'broadband', 'billdesk',
+                                       'recharge']},
+    {'category': 'Rent', 'keywords': ['rent'], 'min_amount': 2000, 'debit': True},
+    {'category': 'Investments', 'keywords': ['zerodha', 'groww', 'upstox', 'mutual fund', 'nps trust']},
+    {'category': 'Insurance', 'keywords': ['insurance', 'lic of india']},
+    {'category': 'Loans', 'keywords': ['loan', 'emi/', 'nach']},
+]
+
+# Share of the classifier's probability its best category needs before a
+# transaction is labelled with it rather than left uncategorized.
+MIN_CONFIDENCE = 0.6
+
+TOKEN_PATTERN = re.compile(r'[a-z]{3,}')
+
+
+class Rule:
+    def __init__(self, category, keywords=(), min_amount=None, max_amount=None, debit=None):
+        self.category = category
+        self.keywords = tuple(keyword.lower() for keyword in keywords)
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.debit = debit
+
+
+class RuleSet:
+    """Category rules compiled for labelling whole frames at once.
+
+    The keywords of every rule go into one KeywordMatcher, so each distinct
+    narration is scanned once whatever the number of rules. A keyword-by-rule
+    matrix turns keyword hits into rule hits, and amount and direction
+    bounds are applied to all rows as array comparisons.
+    """
+
+    def __init__(self, rules):
+        self.rules = [rule if isinstance(rule, Rule) else Rule(**rule) for rule in rules]
+        self.categories = list(dict.fromkeys(rule.category for rule in self.rules))
+
+        keywords = list(dict.fromkeys(keyword for rule in self.rules for keyword in rule.keywords))
+        self.matcher = KeywordMatcher(keywords, whole_words=True)
+        positions = {keyword: index for index, keyword in enumerate(keywords)}
+        self.rule_keywords = np.zeros((len(keywords), len(self.rules)), dtype=bool)
+        for index, rule in enumerate(self.rules):
+            self.rule_keywords[[positions[keyword] for keyword in rule.keywords], index] = True
+        self.any_narration = np.array([not rule.keywords for rule in self.rules], dtype=bool)
+
+        self.lower = np.array([to_paise(rule.min_amount) if rule.min_amount is not None else 0
+                               for rule in self.rules], dtype=np.int64)
+        self.upper = np.array([to_paise(rule.max_amount) if rule.max_amount is not None else np.iinfo(np.int64).max
+                               for rule in self.rules], dtype=np.int64)
+        self.withdrawals = np.array([rule.debit is not False for rule in self.rules], dtype=bool)
+        self.deposits = np.array([rule.debit is not True for rule in self.rules], dtype=bool)
+
+    def apply(self, df):
+        """Position in rules of the first rule each row of df matches, -1 where none does."""
+        if not self.rules:
+            return np.full(len(df), -1)
+
+        hits, _ = self.matcher.match(df['Narration'])
+        # boolean matrix product: a rule matches if any of its keywords does
+        matched = (hits @ self.rule_keywords) | self.any_narration
+
+        magnitudes = np.abs(df['Amount'].to_numpy())[:, None]
+        debits = df['Debit'].to_numpy()[:, None]
+        matched &= (magnitudes >= self.lower) & (magnitudes <= self.upper)
+        matched &= np.where(debits, self.withdrawals, self.deposits)
+        return np.where(matched.any(axis=1), matched.argmax(axis=1), -1)
+
+
+def tokens(narration):
+    return TOKEN_PATTERN.findall(narration.lower())
+
+
+class NarrationClassifier:
+    """Multinomial naive Bayes over the words of narrations.
+
+    Trained offline from labelled narrations (see load_classifier), it
+    labels the transactions no rule matches. Words are runs of three or
+    more letters, so UPI ids and reference numbers are ignored.
+    """
+
+    def __init__(self, narrations, categories, min_confidence=MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self.classes, labels = np.unique(np.asarray(categories, dtype=str), return_inverse=True)
+
+        self.vocabulary = dict()
+        rows, columns = list(), list()
+        for label, narration in zip(labels, narrations):
+            for token in tokens(narration):
+                rows.append(label)
+                columns.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+        counts = np.zeros((len(self.classes), len(self.vocabulary)))
+        np.add.at(counts, (rows, columns), 1)
+
+        self.log_prior = np.log(np.bincount(labels, minlength=len(self.classes)) / len(labels))
+        # add-one smoothing, so a word never seen with a category does not rule it out
+        self.log_likelihood = np.log((counts + 1) / (counts.sum(axis=1, keepdims=True) + len(self.vocabulary)))
+
+    def predict(self, narrations):
+        """Position in classes of each narration's category, -1 where the classifier is unsure."""
+        narrations = pd.Series(narrations, copy=False)
+        if (isinstance(narrations.dtype, pd.CategoricalDtype)
+                and len(narrations.cat.categories) <= len(narrations)):
+            codes, uniques = narrations.cat.codes.to_numpy(), narrations.cat.categories
+        else:
+            codes, uniques = pd.factorize(narrations.to_numpy(dtype=object))
+
+        ids, offsets = list(), list()
+        known = np.zeros(len(uniques), dtype=bool)
+        for row, narration in enumerate(uniques):
+            found = [self.vocabulary[token] for token in tokens(narration) if token in self.vocabulary]
+            if found:
+                known[row] = True
+                offsets.append(len(ids))
+                ids += found
+
+        # one column of summed word log likelihoods per narration
+        predicted = np.full(len(uniques) + 1, -1)
+        if ids:
+            scores = np.add.reduceat(self.log_likelihood[:, ids], offsets, axis=1).T + self.log_prior
+            probabilities = np.exp(scores - scores.max(axis=1, keepdims=True))
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            best = probabilities.argmax(axis=1)
+            confident = probabilities[np.arange(len(best)), best] >= self.min_confidence
+            predicted[np.flatnonzero(known)] = np.where(confident, best, -1)
+        # factorize marks missing narrations with -1, which picks the
+        # unlabelled entry appended above
+        return predicted[codes]
+
+
+@lru_cache(maxsize=None)
+def load_classifier(path, min_confidence=MIN_CONFIDENCE):
+    """NarrationClassifier trained on a CSV file with narration and category columns."""
+    with open(path, newline='') as f:
+        rows = [(row['narration'], row['category']) for row in csv.DictReader(f) if row.get('category')]
+    if not rows:
+        raise ValueError(f'No labelled narrations in {path}')
+    narrations, categories = zip(*rows)
+    return NarrationClassifier(narrations, categories, min_confidence)
+
+
+@lru_cache(maxsize=1)
+def default_rules():
+    return RuleSet(getattr(settings, 'CATEGORY_RULES', None) or DEFAULT_RULES)
+
+
+def default_classifier():
+    path = getattr(settings, 'CATEGORY_TRAINING_FILE', None)
+    return load_classifier(str(path)) if path else None
+
+
+def categorize(df, rules=None, classifier=None):
+    """Category of every transaction of df, as a categorical.
+
+    The first matching rule labels a transaction. The classifier, if there
+    is one, labels those no rule matches; what is left is UNCATEGORIZED.
+    Both default to the ones configured in settings.
+    """
+    rules = default_rules() if rules is None else rules
+    classifier = default_classifier() if classifier is None else classifier
+    classes = classifier.classes.tolist() if classifier is not None else []
+    categories = list(dict.fromkeys(rules.categories + classes + [UNCATEGORIZED]))
+
+    # rule and class positions mapped to category codes; -1 picks the last entry
+    rule_codes = np.array([categories.index(rule.category) for rule in rules.rules]
+                          + [categories.index(UNCATEGORIZED)], dtype=np.int64)
+    codes = rule_codes[rules.apply(df)]
+
+    unmatched = np.flatnonzero(codes == categories.index(UNCATEGORIZED))
+    if classifier is not None and len(unmatched):
+        class_codes = np.array([categories.index(name) for name in classes]
+                               + [categories.index(UNCATEGORIZED)], dtype=np.int64)
+        codes[unmatched] = class_codes[classifier.predict(df['Narration'].iloc[unmatched])]
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def ensure_categories(df):
+    """df with a Category column, labelled here unless it has one already."""
+    if df is None or 'Category' in df.columns:
+        return df
+    return df.assign(Category=categorize(df))
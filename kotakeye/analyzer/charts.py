@@ -0,0 +1,214 @@
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from io import BytesIO
+from queue import Queue, Empty
+from threading import Lock
+
+from analyzer.instrumentation import stage
+
+
+FIGSIZE = (10, 5)
+
+# Chart titles per date bucket (see analyzer.rollups).
+PERIODS = {'day': 'Daily', 'week': 'Weekly', 'month': 'Monthly', 'quarter': 'Quarterly'}
+
+# Figures kept for reuse; also the most charts rendered at the same time.
+RENDER_POOL_SIZE = 4
+
+
+class FigurePool:
+    """A fixed set of Agg figures handed out to one renderer at a time.
+
+    Figures are created with the object-oriented API and never registered
+    with pyplot, so nothing global keeps them alive. Each figure is cleared
+    before it goes back to the pool, and a thread only ever draws on a
+    figure it holds exclusively.
+    """
+
+    def __init__(self, size=RENDER_POOL_SIZE, figsize=FIGSIZE):
+        self.size = size
+        self.figsize = figsize
+        self.created = 0
+        self.idle = Queue()
+        self.lock = Lock()
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            pass
+
+        with self.lock:
+            if self.created < self.size:
+                from matplotlib.figure import Figure
+                from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+                self.created += 1
+                figure = Figure(figsize=self.figsize, layout='tight')
+                FigureCanvasAgg(figure)
+                return figure
+        return self.idle.get()
+
+    @contextmanager
+    def figure(self):
+        figure = self._acquire()
+        try:
+            yield figure
+        finally:
+            figure.clear()
+            self.idle.put(figure)
+
+
+figure_pool = FigurePool()
+
+
+def render_png(draw, *args, dpi=None):
+    """Call draw(ax, *args) on a pooled figure and return the PNG bytes."""
+    with stage('matplotlib'), figure_pool.figure() as figure:
+        draw(figure.add_subplot(), *args)
+        buffer = BytesIO()
+        figure.savefig(buffer, format='png', dpi=dpi)
+        return buffer.getvalue()
+
+
+def _grouped_bars(ax, labels, withdrawals, deposits, colors=(None, None)):
+    import numpy as np
+
+    positions = np.arange(len(labels))
+    width = 0.4
+    ax.bar(positions - width / 2, withdrawals, width, alpha=0.6, color=colors[0], label='Withdrawals')
+    ax.bar(positions + width / 2, deposits, width, alpha=0.6, color=colors[1], label='Deposits')
+    ax.set_xticks(positions, [str(label) for label in labels], rotation=90)
+    ax.legend()
+
+
+def draw_daily_totals(ax, daily_totals, bucket='day'):
+    _grouped_bars(ax, daily_totals.index, daily_totals['Withdrawal'], daily_totals['Deposit'])
+    ax.set_title(f'{PERIODS[bucket]} Transaction Flow')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Amount')
+
+
+def draw_keyword_distribution(ax, distribution):
+    _grouped_bars(ax, distribution.index, distribution['Withdrawal'], distribution['Deposit'],
+                  colors=('red', 'blue'))
+    ax.set_title('Transaction Flow by Keyword')
+    ax.set_xlabel('Keyword')
+    ax.set_ylabel('Amount')
+
+
+def draw_amount_histogram(ax, counts, edges, amount, comparison_text):
+    # counts and edges come from np.histogram; one weighted sample per bin
+    # draws the same bars as passing every amount to ax.hist
+    ax.hist(edges[:-1], bins=edges, weights=counts, alpha=0.7)
+    ax.axvline(x=amount, color='r', linestyle='--', label=f'Filter amount: {amount}')
+    ax.set_title(f'Distribution of Transaction Amounts {comparison_text}')
+    ax.set_xlabel('Amount')
+    ax.set_ylabel('Frequency')
+    ax.legend()
+
+
+def _series(values):
+    import numpy as np
+
+    return np.round(np.asarray(values, dtype=np.float64), 2).tolist()
+
+
+def daily_totals_data(daily_totals, bucket='day'):
+    return {
+        'type': 'daily',
+        'bucket': bucket,
+        'labels': [str(label) for label in daily_totals.index],
+        'withdrawal': _series(daily_totals['Withdrawal']),
+        'deposit': _series(daily_totals['Deposit']),
+    }
+
+
+def keyword_distribution_data(distribution):
+    return {
+        'type': 'keywords',
+        'labels': [str(label) for label in distribution.index],
+        'withdrawal': _series(distribution['Withdrawal']),
+        'deposit': _series(distribution['Deposit']),
+    }
+
+
+def amount_histogram_data(counts, edges, amount, comparison_text):
+    return {
+        'type': 'amounts',
+        'counts': [int(round(count)) for count in counts],
+        'edges': _series(edges),
+        'amount': amount,
+        'comparison_text': comparison_text,
+    }
+
+
+# The JSON series behind each chart, for drawing it in the browser instead.
+CHART_DATA = {
+    draw_daily_totals: daily_totals_data,
+    draw_keyword_distribution: keyword_distribution_data,
+    draw_amount_histogram: amount_histogram_data,
+}
+
+CHART_FORMATS = ['png', 'json']
+
+
+def render_chart(draw, *args, chart_format='png'):
+    """PNG bytes of the chart draw(ax, *args) plots.
+
+    With chart_format 'json' the series it is drawn from are returned
+    instead, as a dict ready for JSON encoding.
+    """
+    if chart_format == 'json':
+        return CHART_DATA[draw](*args)
+    return render_png(draw, *args)
+
+
+def preset_fingerprint(preset):
+    """Short hash of the fields that change what a preset's chart looks like."""
+    fields = [preset.preset_type, preset.start_date, preset.end_date,
+              preset.keywords, preset.amount_value, preset.comparison_type, preset.amount_max]
+    return hashlib.sha1('|'.join(str(field) for field in fields).encode()).hexdigest()[:12]
+
+
+def chart_key(dataset, preset, chart_format='png'):
+    return (dataset, preset.pk, preset_fingerprint(preset), chart_format)
+
+
+class ChartCache:
+    """Per-process LRU cache of rendered charts: PNGs or encoded JSON series.
+
+    Keys are (dataset fingerprint, preset id, preset fingerprint, format)
+    tuples, so new statements or an edited preset never hit a stale chart. Entries can
+    also be dropped explicitly when a preset or a dataset goes away.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            png = self.entries.get(key)
+            if png is not None:
+                self.entries.move_to_end(key)
+            return png
+
+    def put(self, key, png):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = png
+            self.size += len(png)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, dataset=None, preset_id=None):
+        with self.lock:
+            for key in list(self.entries):
+                if (dataset is not None and key[0] == dataset) or (preset_id is not None and key[1] == preset_id):
+                    self.size -= len(self.entries.pop(key))
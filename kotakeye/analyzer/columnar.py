@@ -0,0 +1,80 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+MANIFEST = 'columns.json'
+
+
+def write_frame(path, df):
+    """Write df as one .npy file per column into a new directory at path.
+
+    The directory is built under a temporary name and moved into place, so
+    readers never see a half-written frame. Raises OSError if path exists.
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    os.makedirs(tmp_path)
+
+    categorical = [column for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)]
+    try:
+        for column in df.columns:
+            if column in categorical:
+                # codes and categories are stored apart and reassembled on read
+                _save(tmp_path, f'{column}.categories', np.asarray(df[column].cat.categories, dtype=str))
+                _save(tmp_path, column, df[column].cat.codes.to_numpy())
+                continue
+            values = df[column].to_numpy()
+            if values.dtype == object:
+                # fixed-width unicode keeps string columns loadable without pickle
+                values = values.astype(str)
+            elif values.dtype.metadata is not None:
+                # arrays unpickled from worker processes can carry an empty
+                # metadata dict, which .npy cannot store
+                values = values.view(np.dtype(values.dtype.str))
+            _save(tmp_path, column, values)
+
+        with open(os.path.join(tmp_path, MANIFEST), 'w') as f:
+            json.dump({'columns': list(df.columns), 'categorical': categorical}, f)
+
+        os.rename(tmp_path, path)
+    except OSError:
+        remove_frame(tmp_path)
+        raise
+
+
+def _save(path, name, values):
+    np.save(os.path.join(path, f'{name}.npy'), values, allow_pickle=False)
+
+
+def _load(path, name):
+    return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+
+
+def read_frame(path):
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        # written before categorical columns were supported
+        manifest = {'columns': manifest, 'categorical': []}
+
+    data = dict()
+    for column in manifest['columns']:
+        if column in manifest['categorical']:
+            data[column] = pd.Categorical.from_codes(
+                _load(path, column), categories=_load(path, f'{column}.categories').astype(object)
+            )
+        else:
+            data[column] = _load(path, column)
+    return pd.DataFrame(data, columns=manifest['columns'], copy=False)
+
+
+def frame_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path))
+
+
+def remove_frame(path):
+    for entry in os.scandir(path):
+        os.remove(entry.path)
+    os.rmdir(path)
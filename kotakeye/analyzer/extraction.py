@@ -0,0 +1,161 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from analyzer.parser import match_lines, build_frame
+from analyzer.schema import concat_frames
+
+
+# Bump whenever parsing output changes so cached results are not reused.
+PARSER_VERSION = 4
+
+# Pages handed to one worker at a time. Small enough to spread a single long
+# statement over several processes, large enough to amortise reopening the PDF.
+PAGES_PER_TASK = 8
+
+# Rows collected from consecutive pages before they are turned into a frame.
+BATCH_ROWS = 5000
+
+
+def build_df(batches):
+    return concat_frames(batches)
+
+
+def iter_transactions(pdf_file, password=None, start=0, stop=None, batch_rows=BATCH_ROWS):
+    """Yield DataFrames of parsed transactions, at most about batch_rows each.
+
+    Pages are read one at a time and their pdfplumber caches released as soon
+    as their lines are matched, so memory use does not grow with the page
+    count. pdf_file may be a path, a file object or the raw PDF bytes.
+    """
+    import pdfplumber
+
+    if isinstance(pdf_file, bytes):
+        pdf_file = BytesIO(pdf_file)
+
+    rows = list()
+    with pdfplumber.open(pdf_file, password=password) as pdf:
+        for page in pdf.pages[start:stop]:
+            try:
+                rows.extend(match_lines(page.extract_text()))
+            finally:
+                page.close()
+            if len(rows) >= batch_rows:
+                yield build_frame(rows)
+                rows = list()
+
+    if rows:
+        yield build_frame(rows)
+
+
+def read_source(source):
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source.read()
+
+
+def _page_count(data, password):
+    import pdfplumber
+
+    with pdfplumber.open(BytesIO(data), password=password) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_pages(data, password, start, stop):
+    return build_df(iter_transactions(data, password, start, stop))
+
+
+def _pool_context():
+    # uploads are parsed from worker threads of the web process; forking a
+    # threaded process can copy locks other threads hold, so workers start
+    # from a clean forkserver (or spawn, where there is none) instead
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _run_tasks(tasks, workers):
+    """Run (data, password, start, stop) tasks and return their results in order.
+
+    Each result is either a DataFrame (None for ranges without transactions)
+    or the exception raised by
+    that task. Falls back to running in-process when a pool is not worth it
+    or cannot be started on this platform.
+    """
+    if workers > 1 and len(tasks) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=_pool_context()) as pool:
+                futures = [pool.submit(_extract_pages, *task) for task in tasks]
+                results = list()
+                for future in futures:
+                    try:
+                        results.append(future.result())
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        results.append(e)
+                return results
+        except (BrokenProcessPool, OSError, NotImplementedError):
+            pass
+
+    results = list()
+    for task in tasks:
+        try:
+            results.append(_extract_pages(*task))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def extract_statements(sources, password=None, workers=1, cache=None):
+    """Parse several statement PDFs, fanning pages out over a process pool.
+
+    Returns one (df, error) pair per source, in the order the sources were
+    given. df is None when nothing could be extracted; error is the exception
+    that stopped the file from being parsed, if any. When a ParseCache is
+    given, statements seen before are loaded from it instead of re-parsed.
+    """
+    workers = workers or os.cpu_count() or 1
+    outcomes = [[None, None] for _ in sources]
+    keys = [None for _ in sources]
+    tasks = list()
+    owners = list()
+
+    for index, source in enumerate(sources):
+        try:
+            data = read_source(source)
+            if cache is not None:
+                keys[index] = cache.key(data, password)
+                outcomes[index][0] = cache.get(keys[index])
+                if outcomes[index][0] is not None:
+                    continue
+            page_count = _page_count(data, password)
+        except Exception as e:
+            outcomes[index][1] = e
+            continue
+
+        for start in range(0, page_count, PAGES_PER_TASK):
+            tasks.append((data, password, start, start + PAGES_PER_TASK))
+            owners.append(index)
+
+    batches = [list() for _ in sources]
+    for index, result in zip(owners, _run_tasks(tasks, workers)):
+        if isinstance(result, Exception):
+            outcomes[index][1] = outcomes[index][1] or result
+        else:
+            batches[index].append(result)
+
+    parsed = set(owners)
+    for index, frames in enumerate(batches):
+        if index in parsed and outcomes[index][1] is None:
+            outcomes[index][0] = build_df(frames)
+            if cache is not None and outcomes[index][0] is not None:
+                cache.put(keys[index], outcomes[index][0])
+
+    return [tuple(outcome) for outcome in outcomes]
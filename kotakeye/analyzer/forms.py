@@ -5,7 +5,7 @@ import datetime
 class DateRangePresetForm(forms.ModelForm):
     class Meta:
         model = Preset
-        fields = ['name', 'start_date', 'end_date', 'image']
+        fields = ['name', 'start_date', 'end_date', 'chart_mode', 'image']
         widgets = {
             'start_date': forms.DateInput(attrs={
                 'class': 'form-control',
@@ -19,6 +19,9 @@ class DateRangePresetForm(forms.ModelForm):
                 'class': 'form-control',
                 'placeholder': 'Preset Name'
             }),
+            'chart_mode': forms.Select(attrs={
+                'class': 'form-select'
+            }),
             'image': forms.ClearableFileInput(attrs={
                 'class': 'form-control'
             }),
@@ -36,12 +39,15 @@ class DateRangePresetForm(forms.ModelForm):
 class KeywordSearchPresetForm(forms.ModelForm):
     class Meta:
         model = Preset
-        fields = ['name', 'keywords', 'image']
+        fields = ['name', 'keywords', 'chart_mode', 'image']
         widgets = {
             'keywords': forms.Textarea(attrs={
                 'class': 'form-control',
                 'placeholder': 'Comma-seperared values e.g., Amazon, Netflix, Salary'
             }),
+            'chart_mode': forms.Select(attrs={
+                'class': 'form-select'
+            }),
             'image': forms.ClearableFileInput(attrs={
                 'class': 'form-control'
             }),
@@ -61,10 +67,11 @@ class KeywordSearchPresetForm(forms.ModelForm):
 class AmountFilterPresetForm(forms.ModelForm):
     class Meta:
         model = Preset
-        fields = ['name', 'amount_value', 'comparison_type', 'image']
+        fields = ['name', 'amount_value', 'comparison_type', 'amount_max', 'chart_mode', 'image']
         help_texts = {
             'amount_value': 'Amount for comparison',
-            'comparison_type': 'Select a comparison type'
+            'comparison_type': 'Select a comparison type',
+            'amount_max': 'Upper amount, for Between (both amounts included)'
         }
         widgets = {
             'name': forms.TextInput(attrs={
@@ -78,6 +85,13 @@ class AmountFilterPresetForm(forms.ModelForm):
             'comparison_type': forms.Select(attrs={
                 'class': 'form-select'
             }, ),
+            'amount_max': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'e.g., 5000'
+            }),
+            'chart_mode': forms.Select(attrs={
+                'class': 'form-select'
+            }),
             'image': forms.ClearableFileInput(attrs={
                 'class': 'form-control'
             }),
@@ -89,4 +103,17 @@ class AmountFilterPresetForm(forms.ModelForm):
         self.initial['preset_type'] = 'amount_filter'
         self.fields['comparison_type'].required = True
         self.fields['amount_value'].required = True
+
+    def clean(self):
+        cleaned_data = super().clean()
+        amount = cleaned_data.get('amount_value')
+        amount_max = cleaned_data.get('amount_max')
+        if cleaned_data.get('comparison_type') == 'between':
+            if amount_max is None:
+                self.add_error('amount_max', 'Enter the upper amount of the range')
+            elif amount is not None and amount_max < amount:
+                self.add_error('amount_max', 'The upper amount must not be less than the amount')
+        else:
+            cleaned_data['amount_max'] = None
+        return cleaned_data
         
\ No newline at end of file
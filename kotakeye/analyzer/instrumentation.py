@@ -0,0 +1,176 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds spent per stage in the request being handled, or None outside an
+# instrumented request. Background threads start without it.
+_timings = ContextVar('analyzer_timings', default=None)
+
+_untimed = nullcontext()
+
+
+class _Stage:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+def stage(name):
+    """Context manager adding the time spent inside it to stage name.
+
+    Outside an instrumented request this is a shared no-op, so stages can
+    be left in hot code.
+    """
+    timings = _timings.get()
+    if timings is None:
+        return _untimed
+    return _Stage(timings, name)
+
+
+def timed(name):
+    """Decorator recording every call of a function as stage name."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = _timings.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            with _Stage(timings, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def server_timing(timings, total):
+    entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items()]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class _CProfiler:
+    suffix = 'prof'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+class _PyInstrumentProfiler:
+    suffix = 'html'
+
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.profiler = Profiler()
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.profiler.output_html())
+
+
+def _profiler():
+    if settings.PROFILER == 'pyinstrument':
+        try:
+            return _PyInstrumentProfiler()
+        except ImportError:
+            logger.warning('pyinstrument is not installed; profiling with cProfile')
+    return _CProfiler()
+
+
+def _profile_path(request, suffix):
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'index'
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    return os.path.join(settings.PROFILE_DIR, f'{stamp}-{request.method.lower()}-{slug}.{suffix}')
+
+
+class InstrumentationMiddleware:
+    """Time the stages of each request when INSTRUMENTATION_ENABLED is set.
+
+    Every response gets a Server-Timing header and one JSON log line on the
+    analyzer.instrumentation logger. A PROFILE_SAMPLE_RATE share of
+    requests is also profiled, with the profile written to PROFILE_DIR.
+    When disabled the middleware removes itself at startup.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = dict()
+        token = _timings.set(timings)
+
+        profiler = None
+        if random.random() < settings.PROFILE_SAMPLE_RATE:
+            profiler = _profiler()
+            try:
+                profiler.start()
+            except ValueError:
+                # another profiler is already running in this process
+                profiler = None
+
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - start
+            if profiler is not None:
+                profiler.stop()
+            _timings.reset(token)
+
+        profile_path = None
+        if profiler is not None:
+            profile_path = _profile_path(request, profiler.suffix)
+            try:
+                os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+                profiler.dump(profile_path)
+            except OSError:
+                logger.exception('Could not write profile to %s', profile_path)
+                profile_path = None
+
+        response['Server-Timing'] = server_timing(timings, total)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'stages_ms': {name: round(seconds * 1000, 1) for name, seconds in timings.items()},
+            'profile': profile_path,
+        }))
+        return response
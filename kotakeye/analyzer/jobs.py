@@ -0,0 +1,169 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from analyzer.models import UploadJob
+
+
+_parse_cache = None
+_parse_cache_lock = Lock()
+
+_executor = None
+_executor_lock = Lock()
+
+STALE_JOB_ERROR = 'Processing of this upload was interrupted. Please upload the statement again.'
+DISCARDED_JOB_ERROR = 'The session was cleared before this upload was processed.'
+
+
+def get_parse_cache():
+    global _parse_cache
+    if settings.PARSE_CACHE_DIR is None:
+        return None
+    with _parse_cache_lock:
+        if _parse_cache is None:
+            from analyzer.cache import ParseCache
+            _parse_cache = ParseCache(settings.PARSE_CACHE_DIR, settings.PARSE_CACHE_MAX_BYTES)
+        return _parse_cache
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.UPLOAD_JOB_THREADS,
+                                           thread_name_prefix='upload-job')
+        return _executor
+
+
+def run_upload(job_id, files, password=None):
+    """Parse (name, bytes) pairs for an UploadJob and record the saved statement handles."""
+    from analyzer.extraction import extract_statements
+    from analyzer.aggregates import save_aggregates
+    from analyzer.categories import ensure_categories
+    from analyzer.store import save_statement, delete_statements
+
+    handles = list()
+    try:
+        # a job given up on by fail_stale_jobs or discard_jobs while it was
+        # queued stays failed
+        if not UploadJob.objects.filter(pk=job_id, status='pending').update(status='running'):
+            return
+        errors = list()
+
+        extracted = extract_statements([data for _, data in files], password,
+                                       settings.EXTRACTION_WORKERS, get_parse_cache())
+        for (name, _), (df, error) in zip(files, extracted):
+            handle = None
+            try:
+                if error is not None:
+                    raise error
+                if df is not None:
+                    # labelled once, for the stored statement and its aggregates
+                    df = ensure_categories(df)
+                    handle = save_statement(df)
+                    save_aggregates(handle, df)
+                    handles.append(handle)
+            except Exception as e:
+                if handle is not None:
+                    delete_statements([handle])
+                errors.append(f'Error processing {name}: {str(e)}\nDid you enter the correct password?')
+
+        if not UploadJob.objects.filter(pk=job_id, status='running').update(
+                status='done', statements=handles, errors=errors):
+            # failed meanwhile, so no session will attach the statements
+            delete_statements(handles)
+    except Exception as e:
+        UploadJob.objects.filter(pk=job_id, status='running').update(
+            status='failed', errors=[f'Error processing upload: {str(e)}'])
+        delete_statements(handles)
+    finally:
+        close_old_connections()
+
+
+def submit_upload(uploaded_files, password=None):
+    """Queue uploaded PDFs for parsing and return the UploadJob tracking them.
+
+    The files are read here because Django closes uploads once the request
+    ends. With UPLOAD_JOB_THREADS set to 0 the job runs before returning.
+    """
+    files = [(f.name, f.read()) for f in uploaded_files]
+    job = UploadJob.objects.create(file_count=len(files))
+
+    if settings.UPLOAD_JOB_THREADS:
+        _get_executor().submit(run_upload, job.pk, files, password)
+    else:
+        run_upload(job.pk, files, password)
+        job.refresh_from_db()
+    return job
+
+
+def fail_stale_jobs(job_ids):
+    """Mark jobs still unfinished UPLOAD_JOB_TIMEOUT seconds after their upload as failed.
+
+    Jobs run in threads of the process that took the upload, so when that
+    process restarts they are lost while their rows stay pending or running.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_JOB_TIMEOUT)
+    UploadJob.objects.filter(pk__in=job_ids, status__in=['pending', 'running'], created_at__lt=cutoff).update(
+        status='failed', errors=[STALE_JOB_ERROR])
+
+
+def discard_jobs(job_ids):
+    """Give up on jobs whose session was cleared, releasing their statements.
+
+    Unfinished jobs are failed first, so run_upload releases what they save
+    itself; jobs that finish in between are claimed like attach_finished_jobs
+    does and their statements released here.
+    """
+    from analyzer.store import delete_statements
+    UploadJob.objects.filter(pk__in=job_ids, status__in=['pending', 'running']).update(
+        status='failed', attached=True, errors=[DISCARDED_JOB_ERROR])
+    released = list()
+    for job in UploadJob.objects.filter(pk__in=job_ids, attached=False):
+        if UploadJob.objects.filter(pk=job.pk, attached=False).update(attached=True):
+            released += job.statements
+    delete_statements(released)
+
+
+def attach_finished_jobs(session):
+    """Move statements of the session's finished jobs into the session.
+
+    Returns the jobs that were attached by this call, so the caller can
+    report their outcome exactly once.
+    """
+    job_ids = session.get('upload_jobs', [])
+    if not job_ids:
+        return []
+
+    fail_stale_jobs(job_ids)
+    finished = UploadJob.objects.filter(pk__in=job_ids, status__in=['done', 'failed'], attached=False)
+    # claim each job with a conditional update so concurrent requests from
+    # the same session never attach its statements twice
+    jobs = [
+        job for job in finished
+        if UploadJob.objects.filter(pk=job.pk, attached=False).update(attached=True)
+    ]
+    if not jobs:
+        return []
+
+    attached_ids = {str(job.pk) for job in jobs}
+
+    # a statement uploaded again is held once; the extra reference its
+    # upload took is given back
+    statements = list(session.get('statements', []))
+    repeated = list()
+    for handle in [handle for job in jobs for handle in job.statements]:
+        if handle in statements:
+            repeated.append(handle)
+        else:
+            statements.append(handle)
+    if repeated:
+        from analyzer.store import delete_statements
+        delete_statements(repeated)
+    session['statements'] = statements
+    session['upload_jobs'] = [job_id for job_id in job_ids if job_id not in attached_ids]
+    return jobs
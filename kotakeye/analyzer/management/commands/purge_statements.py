@@ -0,0 +1,41 @@
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from analyzer.models import UploadJob
+
+
+class Command(BaseCommand):
+    help = ('Delete stored statements and upload jobs that no live session holds. '
+            'Run it after clearsessions, e.g. from the same daily cron job.')
+
+    def live_sessions(self):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        try:
+            model = store.get_model_class()
+        except AttributeError:
+            raise CommandError(f'{settings.SESSION_ENGINE} sessions cannot be listed; '
+                               'purge_statements needs a database-backed session engine')
+        for session in model.objects.filter(expire_date__gt=timezone.now()).iterator():
+            yield store().decode(session.session_data)
+
+    def handle(self, *args, **options):
+        from analyzer.store import purge_statements
+
+        held = set()
+        job_ids = set()
+        for session in self.live_sessions():
+            held.update(session.get('statements', []))
+            job_ids.update(session.get('upload_jobs', []))
+        for statements in UploadJob.objects.filter(pk__in=job_ids).values_list('statements', flat=True):
+            held.update(statements)
+
+        # jobs unfinished by then are failed by fail_stale_jobs anyway, so
+        # older uploads no longer need to reach a session
+        cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_JOB_TIMEOUT)
+        removed = purge_statements(held, cutoff)
+        jobs, _ = UploadJob.objects.filter(created_at__lt=cutoff).exclude(pk__in=job_ids).delete()
+        self.stdout.write(f'Removed {removed} statement(s) and {jobs} upload job(s)')
@@ -0,0 +1,141 @@
+import re
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+# Compiled matchers kept around, one per distinct keyword list.
+MATCHER_CACHE_SIZE = 64
+
+# Up to this many keywords, testing each one with `in` beats walking the
+# automaton character by character once a narration is known to match.
+DIRECT_SCAN_KEYWORDS = 32
+
+
+def _trie_pattern(goto, ends, state):
+    # a keyword ending here is enough to locate the leftmost match, so
+    # longer keywords sharing this prefix can be left out
+    if state in ends:
+        return ''
+    branches = [re.escape(char) + _trie_pattern(goto, ends, child) for char, child in goto[state].items()]
+    return branches[0] if len(branches) == 1 else f'(?:{"|".join(branches)})'
+
+
+def _bounded_pattern(keyword):
+    start = r'(?<![a-z0-9])' if keyword[:1].isalnum() else ''
+    end = r'(?![a-z0-9])' if keyword[-1:].isalnum() else ''
+    return start + re.escape(keyword) + end
+
+
+class KeywordMatcher:
+    """Aho–Corasick automaton matching many keywords in one scan of a text.
+
+    Keywords are matched case-insensitively as plain substrings, so they
+    never need escaping. Overlapping keywords ('amazon' and 'amazon pay')
+    are all reported. With whole_words, a keyword only counts where it is
+    not part of a longer word: 'rent' matches 'UPI/RENT/MAY' but not
+    'CURRENT A/C'.
+    """
+
+    def __init__(self, keywords, whole_words=False):
+        self.keywords = tuple(keywords)
+        self._lowered = tuple(keyword.lower() for keyword in self.keywords)
+        # the automaton finds candidates; these confirm one of them stands
+        # alone wherever the keyword begins or ends with a letter or digit
+        self._bounded = tuple(re.compile(_bounded_pattern(keyword)) for keyword in self._lowered) \
+            if whole_words else None
+        goto = [{}]
+        fail = [0]
+        ends = set()
+        self._output = [()]
+
+        for index in range(len(self.keywords)):
+            state = 0
+            for char in self._lowered[index]:
+                if char not in goto[state]:
+                    goto.append({})
+                    fail.append(0)
+                    self._output.append(())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            self._output[state] += (index,)
+            ends.add(state)
+
+        # Resolve fail links into a full transition table, breadth-first so a
+        # state's fallback is complete before it is copied. Scanning is then
+        # one dict lookup per character.
+        self._delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in goto[state].items():
+                queue.append(child)
+                fail[child] = self._delta[fail[state]].get(char, 0)
+            self._delta[state] = {**self._delta[fail[state]], **goto[state]}
+            self._output[state] += self._output[fail[state]]
+
+        # Narrations without any keyword are the common case; a C-level
+        # search rules them out and tells the automaton where to start. The
+        # pattern follows the trie, since a flat 'a|b|c' alternation makes re
+        # try every keyword at every position.
+        self._first_match = re.compile(_trie_pattern(goto, ends, 0) if self.keywords else '(?!)')
+
+    def find(self, text):
+        """Sorted indices of the keywords occurring in text."""
+        text = text.lower()
+        first = self._first_match.search(text)
+        if first is None:
+            return []
+        if len(self._lowered) <= DIRECT_SCAN_KEYWORDS:
+            found = [index for index, keyword in enumerate(self._lowered) if keyword in text]
+        else:
+            delta, output = self._delta, self._output
+            found = list()
+            state = 0
+            # no keyword can start before the leftmost match
+            for char in text[first.start():]:
+                state = delta[state].get(char, 0)
+                if output[state]:
+                    found += output[state]
+            found = sorted(set(found))
+
+        if self._bounded is not None:
+            found = [index for index in found if self._bounded[index].search(text)]
+        return found
+
+    def match(self, narrations):
+        """Match every narration and return (hits, labels).
+
+        hits is a boolean array with one row per narration and one column per
+        keyword; labels holds the matched keywords of each narration joined
+        with ', ' ('' when none matched). Statements repeat the same
+        narrations a lot, so each distinct narration is scanned only once.
+        """
+        narrations = pd.Series(narrations, copy=False)
+        if (isinstance(narrations.dtype, pd.CategoricalDtype)
+                and len(narrations.cat.categories) <= len(narrations)):
+            # already factorized; unused categories are scanned too, which is
+            # why small slices of a large frame go through factorize instead
+            codes, uniques = narrations.cat.codes.to_numpy(), narrations.cat.categories
+        else:
+            codes, uniques = pd.factorize(narrations.to_numpy(dtype=object))
+        unique_hits = np.zeros((len(uniques) + 1, len(self.keywords)), dtype=bool)
+        unique_labels = np.full(len(uniques) + 1, '', dtype=object)
+
+        for row, narration in enumerate(uniques):
+            found = self.find(narration)
+            if found:
+                unique_hits[row, found] = True
+                unique_labels[row] = ', '.join(self.keywords[index] for index in found)
+
+        # factorize marks missing narrations with -1, which picks the
+        # all-False row appended above
+        return unique_hits[codes], unique_labels[codes]
+
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def keyword_matcher(keywords):
+    """Compiled KeywordMatcher for a tuple of keywords, built once and reused."""
+    return KeywordMatcher(keywords)
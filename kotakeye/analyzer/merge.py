@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+
+def row_keys(df):
+    """64-bit identity of each transaction, used to spot overlapping statements.
+
+    A transaction is identified by its date, reference, signed amount in
+    paise and balance, plus how many identical rows precede it in the same
+    statement, so repeated rows within one statement keep distinct keys.
+    """
+    identity = pd.util.hash_pandas_object(pd.DataFrame({
+        'Date': df['Date'].to_numpy(dtype='datetime64[ns]').view(np.int64),
+        'Reference': df['Reference'].astype(str).to_numpy(dtype=object),
+        'Amount': df['Amount'].to_numpy(dtype=np.int64),
+        'Balance': df['Balance'].to_numpy(dtype=np.int64),
+    }), index=False)
+    occurrence = identity.groupby(identity.to_numpy()).cumcount()
+
+    keys = pd.util.hash_pandas_object(pd.DataFrame({
+        'identity': identity.to_numpy(),
+        'occurrence': occurrence.to_numpy(),
+    }), index=False)
+    # signed, so the keys fit an SQL integer column
+    return keys.to_numpy().view(np.int64)
+
+
+def duplicate_masks(key_arrays):
+    """Mark rows whose key already appeared in an earlier statement.
+
+    One hash-table pass over all keys, so merging stays linear in the number
+    of transactions. Returns one boolean array per statement.
+    """
+    if not key_arrays:
+        return []
+    duplicated = pd.Series(np.concatenate(key_arrays)).duplicated(keep='first').to_numpy()
+    return np.split(duplicated, np.cumsum([len(keys) for keys in key_arrays])[:-1])
+
+
+def balance_breaks(df):
+    """Transactions whose balance does not follow from the one before them.
+
+    Rows are taken in date order (ties keep their order in df). Balances are
+    compared without sign since statements print them as Cr/Dr amounts.
+    """
+    if len(df) < 2:
+        return 0
+    order = np.argsort(df['Date'].to_numpy(), kind='stable')
+    balances = df['Balance'].to_numpy(dtype=np.int64)[order]
+    change = df['Amount'].to_numpy(dtype=np.int64)[order]
+    follows = ((np.abs(balances[:-1] + change[1:]) == balances[1:])
+               | (np.abs(balances[:-1] - change[1:]) == balances[1:]))
+    return int((~follows).sum())
+
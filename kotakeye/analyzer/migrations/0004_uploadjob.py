@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 13:43
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0003_alter_preset_comparison_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('file_count', models.PositiveIntegerField(default=0)),
+                ('statements', models.JSONField(blank=True, default=list, help_text='Handles of the statements saved by this job')),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('attached', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
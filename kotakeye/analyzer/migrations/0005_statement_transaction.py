@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 14:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0004_uploadjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Statement',
+            fields=[
+                ('content_hash', models.CharField(help_text='Hash of the parsed transactions, also the statement handle', max_length=32, primary_key=True, serialize=False)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('reference_count', models.PositiveIntegerField(default=0, help_text='Uploads still holding this statement')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(help_text='Row number within the statement')),
+                ('date', models.DateField(db_index=True)),
+                ('narration', models.TextField()),
+                ('reference', models.CharField(max_length=100)),
+                ('withdrawal', models.FloatField(default=0)),
+                ('deposit', models.FloatField(default=0)),
+                ('amount', models.FloatField(db_index=True, help_text='Withdrawal or deposit, whichever the transaction has')),
+                ('balance', models.FloatField()),
+                ('statement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='analyzer.statement')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('statement', 'position'), name='unique_statement_position')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, OperationalError
+
+
+# Full-text index over Transaction.narration. The trigram tokenizer makes
+# MATCH behave like a case-insensitive substring search, which is what
+# keyword presets need. Triggers keep it in step with the table.
+#
+# SQLite rebuilds the table for most ALTERs, which drops the triggers, so
+# later migrations that alter analyzer_transaction must call
+# drop_narration_index and create_narration_index again afterwards.
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE analyzer_transaction_fts USING fts5(
+        narration, content='analyzer_transaction', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER analyzer_transaction_fts_insert AFTER INSERT ON analyzer_transaction BEGIN
+        INSERT INTO analyzer_transaction_fts(rowid, narration) VALUES (new.id, new.narration);
+    END""",
+    """CREATE TRIGGER analyzer_transaction_fts_delete AFTER DELETE ON analyzer_transaction BEGIN
+        INSERT INTO analyzer_transaction_fts(analyzer_transaction_fts, rowid, narration)
+        VALUES ('delete', old.id, old.narration);
+    END""",
+    """CREATE TRIGGER analyzer_transaction_fts_update AFTER UPDATE OF narration ON analyzer_transaction BEGIN
+        INSERT INTO analyzer_transaction_fts(analyzer_transaction_fts, rowid, narration)
+        VALUES ('delete', old.id, old.narration);
+        INSERT INTO analyzer_transaction_fts(rowid, narration) VALUES (new.id, new.narration);
+    END""",
+    "INSERT INTO analyzer_transaction_fts(analyzer_transaction_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS analyzer_transaction_fts_update",
+    "DROP TRIGGER IF EXISTS analyzer_transaction_fts_delete",
+    "DROP TRIGGER IF EXISTS analyzer_transaction_fts_insert",
+    "DROP TABLE IF EXISTS analyzer_transaction_fts",
+]
+
+
+def create_narration_index(apps, schema_editor):
+    # other databases, and SQLite builds without FTS5 trigram support,
+    # fall back to plain LIKE queries on narration
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            for statement in CREATE_SQL:
+                cursor.execute(statement)
+    except OperationalError:
+        drop_narration_index(apps, schema_editor)
+
+
+def drop_narration_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP_SQL:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0005_statement_transaction'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_narration_index, drop_narration_index),
+    ]
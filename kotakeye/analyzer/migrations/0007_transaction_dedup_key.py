@@ -0,0 +1,73 @@
+# Generated by Django 5.2 on 2026-10-18 14:10
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+narration_index = import_module('analyzer.migrations.0006_transaction_narration_fts')
+
+
+def rebuild_narration_index(apps, schema_editor):
+    # adding the column rebuilt the table, and with it dropped the triggers
+    narration_index.drop_narration_index(apps, schema_editor)
+    narration_index.create_narration_index(apps, schema_editor)
+
+
+def row_keys(transactions):
+    """analyzer.merge.row_keys of a statement's rupee Transaction rows.
+
+    A copy of the code as it was when this migration was written, so the
+    keys it fills in do not change with the app, and pandas is only
+    imported when the migration runs.
+    """
+    import numpy as np
+    import pandas as pd
+
+    def paise(values):
+        return np.round(np.asarray(values, dtype=np.float64) * 100).astype(np.int64)
+
+    withdrawals = paise([t.withdrawal for t in transactions])
+    deposits = paise([t.deposit for t in transactions])
+    identity = pd.util.hash_pandas_object(pd.DataFrame({
+        'Date': pd.to_datetime([t.date for t in transactions]).to_numpy(dtype='datetime64[ns]').view(np.int64),
+        'Reference': np.array([str(t.reference) for t in transactions], dtype=object),
+        'Amount': np.where(withdrawals > 0, -withdrawals, deposits),
+        'Balance': paise([t.balance for t in transactions]),
+    }), index=False)
+    occurrence = identity.groupby(identity.to_numpy()).cumcount()
+
+    keys = pd.util.hash_pandas_object(pd.DataFrame({
+        'identity': identity.to_numpy(),
+        'occurrence': occurrence.to_numpy(),
+    }), index=False)
+    return keys.to_numpy().view(np.int64)
+
+
+def fill_dedup_keys(apps, schema_editor):
+    Statement = apps.get_model('analyzer', 'Statement')
+    Transaction = apps.get_model('analyzer', 'Transaction')
+
+    for statement in Statement.objects.all():
+        transactions = list(Transaction.objects.filter(statement=statement).order_by('position'))
+        if not transactions:
+            continue
+        for transaction, key in zip(transactions, row_keys(transactions).tolist()):
+            transaction.dedup_key = key
+        Transaction.objects.bulk_update(transactions, ['dedup_key'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0006_transaction_narration_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='dedup_key',
+            field=models.BigIntegerField(db_index=True, default=0, help_text='Identity shared with copies of this row in overlapping statements'),
+        ),
+        migrations.RunPython(rebuild_narration_index, migrations.RunPython.noop),
+        migrations.RunPython(fill_dedup_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0007_transaction_dedup_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preset',
+            name='amount_max',
+            field=models.FloatField(blank=True, help_text='Upper bound of a between comparison', null=True),
+        ),
+        migrations.AlterField(
+            model_name='preset',
+            name='comparison_type',
+            field=models.CharField(blank=True, choices=[('=', 'Equals'), ('gt', 'Greater Than'), ('lt', 'Less Than'), ('between', 'Between')], null=True),
+        ),
+    ]
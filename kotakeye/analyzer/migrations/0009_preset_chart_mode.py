@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0008_preset_amount_max'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preset',
+            name='chart_mode',
+            field=models.CharField(blank=True, choices=[('png', 'Image'), ('json', 'Interactive')], default='', help_text='How results show the chart; leave blank for the site default'),
+        ),
+    ]
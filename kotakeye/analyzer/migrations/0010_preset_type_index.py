@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0009_preset_chart_mode'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='preset',
+            name='preset_type',
+            field=models.CharField(choices=[('date_range', 'Date Range'), ('amount_filter', 'Amount Filter'), ('keyword', 'Keyword')], db_index=True),
+        ),
+    ]
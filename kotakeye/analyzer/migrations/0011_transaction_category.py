@@ -0,0 +1,91 @@
+# Generated by Django 5.2 on 2026-10-18 14:49
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+narration_index = import_module('analyzer.migrations.0006_transaction_narration_fts')
+
+
+def rebuild_narration_index(apps, schema_editor):
+    # adding the column rebuilt the table, and with it dropped the triggers
+    narration_index.drop_narration_index(apps, schema_editor)
+    narration_index.create_narration_index(apps, schema_editor)
+
+
+# analyzer.categories.DEFAULT_RULES as they were when this migration was
+# written. Existing rows are labelled with these rules alone (no
+# CATEGORY_RULES or classifier from settings), so the migration gives the
+# same labels whatever the app code and settings it runs with.
+RULES = [
+    {'category': 'Salary', 'keywords': ['salary', 'payroll'], 'debit': False},
+    {'category': 'Interest', 'keywords': ['int.pd', 'interest paid'], 'debit': False},
+    {'category': 'Bank charges', 'keywords': ['charges', 'chrg', 'sms alert'], 'max_amount': 1000, 'debit': True},
+    {'category': 'Cash', 'keywords': ['atm wdl', 'cash wdl', 'atm/', 'cash withdrawal']},
+    {'category': 'Food', 'keywords': ['swiggy', 'zomato', 'dominos', 'mcdonald', 'starbucks', 'eatsure']},
+    {'category': 'Groceries', 'keywords': ['bigbasket', 'blinkit', 'zepto', 'dmart', 'grofers', 'instamart']},
+    {'category': 'Shopping', 'keywords': ['amazon', 'flipkart', 'myntra', 'ajio', 'nykaa', 'meesho']},
+    {'category': 'Transport', 'keywords': ['uber', 'olacabs', 'rapido', 'irctc', 'fastag', 'metro rail']},
+    {'category': 'Fuel', 'keywords': ['petrol', 'indian oil', 'hpcl', 'bpcl', 'fuel']},
+    {'category': 'Entertainment', 'keywords': ['netflix', 'spotify', 'hotstar', 'bookmyshow', 'youtube']},
+    {'category': 'Bills', 'keywords': ['electricity', 'bescom', 'airtel', 'jio', 'broadband', 'billdesk',
+                                       'recharge']},
+    {'category': 'Rent', 'keywords': ['rent'], 'min_amount': 2000, 'debit': True},
+    {'category': 'Investments', 'keywords': ['zerodha', 'groww', 'upstox', 'mutual fund', 'nps trust']},
+    {'category': 'Insurance', 'keywords': ['insurance', 'lic of india']},
+    {'category': 'Loans', 'keywords': ['loan', 'emi/', 'nach']},
+]
+
+UNCATEGORIZED = 'Uncategorized'
+
+
+def keyword_pattern(keywords):
+    # keywords count as whole words, as in analyzer.matching
+    import re
+    return re.compile('|'.join((r'(?<![a-z0-9])' if keyword[0].isalnum() else '') + re.escape(keyword)
+                               + (r'(?![a-z0-9])' if keyword[-1].isalnum() else '') for keyword in keywords))
+
+
+def rule_applies(rule, paise, debit):
+    if rule.get('min_amount') is not None and paise < round(rule['min_amount'] * 100):
+        return False
+    if rule.get('max_amount') is not None and paise > round(rule['max_amount'] * 100):
+        return False
+    return rule.get('debit') is None or rule['debit'] == debit
+
+
+def fill_categories(apps, schema_editor):
+    Statement = apps.get_model('analyzer', 'Statement')
+    Transaction = apps.get_model('analyzer', 'Transaction')
+    patterns = [keyword_pattern(rule['keywords']) for rule in RULES]
+    # rules whose keywords occur in each distinct narration
+    candidates = dict()
+
+    for statement in Statement.objects.all():
+        transactions = list(Transaction.objects.filter(statement=statement).order_by('position'))
+        for transaction in transactions:
+            narration = transaction.narration.lower()
+            if narration not in candidates:
+                candidates[narration] = [rule for rule, pattern in zip(RULES, patterns) if pattern.search(narration)]
+            debit = transaction.withdrawal > 0
+            paise = round((transaction.withdrawal if debit else transaction.deposit) * 100)
+            transaction.category = next((rule['category'] for rule in candidates[narration]
+                                         if rule_applies(rule, paise, debit)), UNCATEGORIZED)
+        Transaction.objects.bulk_update(transactions, ['category'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0010_preset_type_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='category',
+            field=models.CharField(db_index=True, default='', help_text='Category the transaction was labelled with when stored', max_length=50),
+        ),
+        migrations.RunPython(rebuild_narration_index, migrations.RunPython.noop),
+        migrations.RunPython(fill_categories, migrations.RunPython.noop),
+    ]
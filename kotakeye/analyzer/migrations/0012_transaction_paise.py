@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 15:21
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Round
+
+narration_index = import_module('analyzer.migrations.0006_transaction_narration_fts')
+
+AMOUNT_FIELDS = ['withdrawal', 'deposit', 'amount', 'balance']
+
+
+def rebuild_narration_index(apps, schema_editor):
+    # altering the columns rebuilt the table, and with it dropped the triggers
+    narration_index.drop_narration_index(apps, schema_editor)
+    narration_index.create_narration_index(apps, schema_editor)
+
+
+def rupees_to_paise(apps, schema_editor):
+    # still float columns here; whole numbers survive the type change exactly
+    Transaction = apps.get_model('analyzer', 'Transaction')
+    Transaction.objects.update(**{field: Round(F(field) * 100) for field in AMOUNT_FIELDS})
+
+
+def paise_to_rupees(apps, schema_editor):
+    Transaction = apps.get_model('analyzer', 'Transaction')
+    Transaction.objects.update(**{field: F(field) / 100.0 for field in AMOUNT_FIELDS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0011_transaction_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, rebuild_narration_index),
+        migrations.RunPython(rupees_to_paise, paise_to_rupees),
+        migrations.AlterField(
+            model_name='transaction',
+            name='amount',
+            field=models.BigIntegerField(db_index=True, help_text='Withdrawal or deposit, whichever the transaction has, in paise'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='balance',
+            field=models.BigIntegerField(help_text='Paise'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='deposit',
+            field=models.BigIntegerField(default=0, help_text='Paise'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='withdrawal',
+            field=models.BigIntegerField(default=0, help_text='Paise'),
+        ),
+        migrations.RunPython(rebuild_narration_index, migrations.RunPython.noop),
+    ]
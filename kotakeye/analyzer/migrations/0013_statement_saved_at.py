@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 15:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0012_transaction_paise'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statement',
+            name='saved_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When an upload last saved this statement'),
+        ),
+    ]
@@ -1,4 +1,6 @@
+import uuid
 from django.db import models
+from django.utils import timezone
 
 class Preset(models.Model):
     PRESET_TYPES = [
@@ -11,13 +13,19 @@ class Preset(models.Model):
         ('=', "Equals"),
         ('gt', "Greater Than"),
         ('lt', "Less Than"),
+        ('between', "Between"),
+    ]
+    
+    CHART_MODES = [
+        ('png', "Image"),
+        ('json', "Interactive"),
     ]
     
     DEFAULT_IMAGE = 'images/default.png'
     
     name = models.CharField(max_length=30)
     image = models.ImageField(upload_to='images/', null=False, blank=False, default=DEFAULT_IMAGE)
-    preset_type = models.CharField(choices=PRESET_TYPES)
+    preset_type = models.CharField(choices=PRESET_TYPES, db_index=True)
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
     
@@ -25,7 +33,77 @@ class Preset(models.Model):
                                 help_text='Comma-seperated keywords')
     
     amount_value = models.FloatField(null=True, blank=True)
+    amount_max = models.FloatField(null=True, blank=True,
+                                   help_text='Upper bound of a between comparison')
     comparison_type = models.CharField(choices=COMPARISONS, null=True, blank=True)
     
+    chart_mode = models.CharField(choices=CHART_MODES, blank=True, default='',
+                                  help_text='How results show the chart; leave blank for the site default')
+    
+    def __str__(self):
+        return self.name
+
+
+class UploadJob(models.Model):
+    STATUSES = [
+        ('pending', "Pending"),
+        ('running', "Running"),
+        ('done', "Done"),
+        ('failed', "Failed"),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(choices=STATUSES, max_length=10, default='pending')
+    file_count = models.PositiveIntegerField(default=0)
+    statements = models.JSONField(default=list, blank=True,
+                                  help_text='Handles of the statements saved by this job')
+    errors = models.JSONField(default=list, blank=True)
+    attached = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+    
+    def __str__(self):
+        return f'{self.file_count} file(s) - {self.status}'
+
+
+class Statement(models.Model):
+    content_hash = models.CharField(max_length=32, primary_key=True,
+                                    help_text='Hash of the parsed transactions, also the statement handle')
+    row_count = models.PositiveIntegerField(default=0)
+    reference_count = models.PositiveIntegerField(default=0,
+                                                  help_text='Uploads still holding this statement')
+    created_at = models.DateTimeField(auto_now_add=True)
+    saved_at = models.DateTimeField(default=timezone.now,
+                                    help_text='When an upload last saved this statement')
+    
+    def __str__(self):
+        return f'{self.content_hash} ({self.row_count} transactions)'
+
+
+class Transaction(models.Model):
+    statement = models.ForeignKey(Statement, on_delete=models.CASCADE, related_name='transactions')
+    position = models.PositiveIntegerField(help_text='Row number within the statement')
+    date = models.DateField(db_index=True)
+    narration = models.TextField()
+    reference = models.CharField(max_length=100)
+    # amounts are whole paise, so sums in the database are exact
+    withdrawal = models.BigIntegerField(default=0, help_text='Paise')
+    deposit = models.BigIntegerField(default=0, help_text='Paise')
+    amount = models.BigIntegerField(db_index=True,
+                                    help_text='Withdrawal or deposit, whichever the transaction has, in paise')
+    balance = models.BigIntegerField(help_text='Paise')
+    dedup_key = models.BigIntegerField(default=0, db_index=True,
+                                       help_text='Identity shared with copies of this row in overlapping statements')
+    category = models.CharField(max_length=50, default='', db_index=True,
+                                help_text='Category the transaction was labelled with when stored')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['statement', 'position'], name='unique_statement_position'),
+        ]
+    
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f'{self.date} {self.narration}'
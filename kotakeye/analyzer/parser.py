@@ -0,0 +1,58 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from analyzer.schema import to_paise, compact_frame
+
+
+# A line break inside a narration, unless the next line starts a transaction
+# of its own (an optional serial number, then a date).
+_WRAP = r'[ \t]*\n\s*(?!(?:\d+[ \t]+)?\d\d-\d\d-\d{4}\s)'
+
+# One transaction: optional serial number, date, narration, reference,
+# amount(Dr|Cr) and balance(Dr|Cr). It starts at the beginning of a line;
+# fields may wrap onto the following lines, as long narrations do. Words
+# and the whitespace between them never overlap, so a line that does not
+# match is given up after one pass over its words.
+LINE_PATTERN = re.compile(
+    r'^(?:\d+[ \t]+)?(\d\d-\d\d-\d{4})'
+    r'\s+(\S+(?:(?:[ \t]+|' + _WRAP + r')\S+)*?)'
+    r'\s+(\S+)'
+    r'\s+(-?\d[\d,.]*)\((Dr|Cr)\)'
+    r'\s+(-?\d[\d,.]*)\((?:Dr|Cr)\)',
+    re.MULTILINE
+)
+
+def match_lines(text):
+    """Split statement text into (date, narration, reference, amount, flag, balance) tuples."""
+    return LINE_PATTERN.findall(text or '')
+
+
+def _to_numbers(values):
+    # one C-level conversion for the whole column instead of float() per row
+    return np.array(' '.join(values).replace(',', '').split(), dtype=np.float64)
+
+
+def build_frame(rows):
+    """Build the transaction DataFrame from match_lines output, one column at a time."""
+    if not rows:
+        return None
+
+    dates, narrations, references, amounts, flags, balances = zip(*rows)
+    # a wrapped narration is joined back into one line
+    narrations = [' '.join(narration.split()) if '\n' in narration else narration for narration in narrations]
+
+    return compact_frame(
+        pd.to_datetime(np.array(dates, dtype=object), format='%d-%m-%Y'),
+        narrations,
+        references,
+        # the direction is in the Dr/Cr flag, whatever sign the amount has
+        to_paise(np.abs(_to_numbers(amounts))),
+        np.array(flags) == 'Dr',
+        to_paise(_to_numbers(balances)),
+    )
+
+
+def parse_text(text):
+    return build_frame(match_lines(text))
@@ -0,0 +1,427 @@
+import numpy as np
+import pandas as pd
+
+from analyzer.aggregates import preset_totals, duplicate_rows, statement_amount_index, combined_categories
+from analyzer.categories import UNCATEGORIZED
+from analyzer.instrumentation import stage
+from analyzer.schema import to_rupees, records, display_frame
+from analyzer.queries import (statement_transactions, date_range_query, amount_query, keyword_query,
+                              summarize, category_summary, to_frame, to_page, after_row)
+from analyzer.store import load_statement, should_push_down
+from analyzer.utils import date_range_mask, amount_mask, comparison_text, parse_keywords, match_keywords
+
+
+SAMPLE_SIZE = 10
+
+# Rows per page of a transaction listing, and per chunk of a CSV export.
+PAGE_SIZE = 50
+
+EXPORT_PAGE_SIZE = 5000
+
+# Rows whose narrations are matched at a time when collecting sample rows of
+# keyword presets; matching stops once every preset has its samples.
+SAMPLE_CHUNK_ROWS = 2000
+
+
+def _empty_result(**extra):
+    return {
+        'transaction_count': 0,
+        'total_withdrawal': 0,
+        'total_deposit': 0,
+        'net_flow': 0,
+        'transactions': [],
+        'chart': None,
+        **extra
+    }
+
+
+class _Plan:
+    """Mask and display details for one preset, before aggregation."""
+
+    def __init__(self, mask, extra=None, keyword_labels=None):
+        self.mask = mask
+        self.extra = extra or {}
+        self.keyword_labels = keyword_labels
+
+
+def _plan_preset(df, preset, handle=None):
+    if preset.preset_type == 'date_range':
+        return _Plan(date_range_mask(df, preset.start_date, preset.end_date))
+
+    elif preset.preset_type == 'keyword':
+        keyword_list = parse_keywords(preset.keywords)
+        if not keyword_list:
+            return None
+        hits, labels = match_keywords(df, keyword_list)
+        return _Plan(hits.any(axis=1), {'keywords': keyword_list}, labels)
+
+    elif preset.preset_type == 'amount_filter':
+        # a stored statement's amounts are sorted once and reused
+        index = statement_amount_index(handle) if handle is not None else None
+        masked = amount_mask(df, preset.amount_value, preset.comparison_type, preset.amount_max, index)
+        if masked is None:
+            return None
+        mask, comparison_text = masked
+        return _Plan(mask, {'comparison_text': comparison_text})
+
+    return None
+
+
+def _keyword_records(sample, labels):
+    sample = sample.drop(['Reference', 'Balance'], axis=1)
+    sample['Keyword'] = labels
+    return records(sample)
+
+
+def _query_preset(transactions, preset):
+    if preset.preset_type == 'date_range':
+        return date_range_query(transactions, preset.start_date, preset.end_date), {}
+
+    elif preset.preset_type == 'keyword':
+        keyword_list = parse_keywords(preset.keywords)
+        if not keyword_list:
+            return None
+        return keyword_query(transactions, keyword_list), {'keywords': keyword_list}
+
+    elif preset.preset_type == 'amount_filter':
+        queryset = amount_query(transactions, preset.amount_value, preset.comparison_type, preset.amount_max)
+        if queryset is None:
+            return None
+        text = comparison_text(preset.amount_value, preset.comparison_type, preset.amount_max)
+        return queryset, {'comparison_text': text}
+
+    return None
+
+
+def _failed_result(error):
+    return {'error': str(error) or type(error).__name__}
+
+
+def _evaluate_in_db(transactions, preset, sample_size):
+    query = _query_preset(transactions, preset)
+    if query is None:
+        return None
+
+    queryset, extra = query
+    count, withdrawal, deposit = summarize(queryset)
+    if not count:
+        return _empty_result(**extra)
+    withdrawal, deposit = to_rupees(withdrawal), to_rupees(deposit)
+
+    sample = to_frame(queryset[:sample_size])
+    result = {
+        'transaction_count': count,
+        'total_withdrawal': withdrawal,
+        'total_deposit': deposit,
+        'net_flow': deposit - withdrawal,
+        'transactions': records(sample),
+        'chart': None,
+        **extra
+    }
+
+    if 'keywords' in extra:
+        _, labels = match_keywords(sample, extra['keywords'])
+        result['transactions'] = _keyword_records(sample, labels)
+        result['keyword_stats'] = list()
+        for keyword in extra['keywords']:
+            keyword_count, keyword_withdrawal, keyword_deposit = summarize(keyword_query(transactions, [keyword]))
+            result['keyword_stats'].append({
+                'keyword': keyword,
+                'count': keyword_count,
+                'withdrawal': to_rupees(keyword_withdrawal),
+                'deposit': to_rupees(keyword_deposit),
+            })
+
+    return result
+
+
+def evaluate_presets_in_db(handles, presets, sample_size=SAMPLE_SIZE):
+    """Evaluate several presets over statements too large to load, as indexed SQL.
+
+    Returns a list aligned with presets holding analyze_*-style result
+    dicts (without charts), or None for presets that cannot be evaluated.
+    Counts and totals are aggregated by the database and only the sample
+    rows are fetched. A preset that fails gets {'error': message} and the
+    others are still evaluated.
+    """
+    transactions = statement_transactions(handles)
+    results = list()
+
+    for preset in presets:
+        try:
+            results.append(_evaluate_in_db(transactions, preset, sample_size))
+        except OSError:
+            raise
+        except Exception as e:
+            results.append(_failed_result(e))
+
+    return results
+
+
+def _keyword_sample_rows(df, presets, duplicates, wanted):
+    """First wanted[i] rows matching each keyword preset, and their keyword labels.
+
+    The keywords of all presets go into one matcher, and narrations are
+    matched a chunk at a time only until every preset has its rows.
+    """
+    keyword_lists = [parse_keywords(preset.keywords) for preset in presets]
+    keywords = list(dict.fromkeys(keyword for keyword_list in keyword_lists for keyword in keyword_list))
+    columns = [[keywords.index(keyword) for keyword in keyword_list] for keyword_list in keyword_lists]
+    rows = [list() for _ in presets]
+    labels = [list() for _ in presets]
+    pending = [index for index in range(len(presets)) if wanted[index] > 0]
+
+    for start in range(0, len(df), SAMPLE_CHUNK_ROWS):
+        if not pending:
+            break
+        chunk = slice(start, start + SAMPLE_CHUNK_ROWS)
+        hits, _ = match_keywords(df.iloc[chunk], keywords)
+        kept = ~duplicates[chunk]
+        for index in pending:
+            preset_hits = hits[:, columns[index]]
+            found = np.flatnonzero(preset_hits.any(axis=1) & kept)[:wanted[index] - len(rows[index])]
+            rows[index] += (found + start).tolist()
+            # labelled as match_keywords labels them for this preset alone
+            labels[index] += [', '.join(keyword for keyword, hit in zip(keyword_lists[index], row) if hit)
+                              for row in preset_hits[found]]
+        pending = [index for index in pending if len(rows[index]) < wanted[index]]
+
+    return [(np.array(preset_rows, dtype=np.intp), np.array(preset_labels, dtype=object))
+            for preset_rows, preset_labels in zip(rows, labels)]
+
+
+def _sample_records(df, samples):
+    """Records of several presets' sample rows, converting each row of df once.
+
+    samples maps preset positions to (rows, keyword labels or None).
+    """
+    if not samples:
+        return {}
+    union = np.unique(np.concatenate([rows for rows, _ in samples.values()]))
+    converted = records(df.iloc[union])
+
+    found = dict()
+    for index, (rows, labels) in samples.items():
+        positions = np.searchsorted(union, rows)
+        if labels is None:
+            found[index] = [dict(converted[position]) for position in positions]
+        else:
+            found[index] = [{**{column: value for column, value in converted[position].items()
+                                if column not in ('Reference', 'Balance')}, 'Keyword': label}
+                            for position, label in zip(positions, labels)]
+    return found
+
+
+def _stored_samples(handles, presets, sample_size):
+    # statements are scanned in order only until every preset has its rows;
+    # per statement, keyword presets share one scan of the narrations and
+    # all sample rows are converted to records together
+    samples = [list() for _ in presets]
+    errors = dict()
+    pending = list(range(len(presets))) if sample_size > 0 else []
+    for handle, duplicates in zip(handles, duplicate_rows(handles)):
+        if not pending:
+            break
+        df = load_statement(handle)
+        found = dict()
+
+        keyword_presets = [index for index in pending if presets[index].preset_type == 'keyword']
+        if keyword_presets:
+            try:
+                keyword_rows = _keyword_sample_rows(df, [presets[index] for index in keyword_presets], duplicates,
+                                                    [sample_size - len(samples[index]) for index in keyword_presets])
+            except OSError:
+                raise
+            except Exception as e:
+                errors.update(dict.fromkeys(keyword_presets, e))
+            else:
+                found.update(zip(keyword_presets, keyword_rows))
+
+        for index in pending:
+            if index in keyword_presets:
+                continue
+            try:
+                plan = _plan_preset(df, presets[index], handle)
+            except OSError:
+                raise
+            except Exception as e:
+                errors[index] = e
+                continue
+            if plan is not None:
+                found[index] = np.flatnonzero(plan.mask & ~duplicates)[:sample_size - len(samples[index])], None
+
+        for index, sample in _sample_records(df, found).items():
+            samples[index] += sample
+        pending = [index for index in pending if index not in errors and len(samples[index]) < sample_size]
+    return [errors.get(index, sample) for index, sample in enumerate(samples)]
+
+
+def evaluate_stored_presets(handles, presets, sample_size=SAMPLE_SIZE):
+    """evaluate_presets_in_db for saved statements, without loading them whole.
+
+    Counts and totals come from the per-statement aggregates kept by
+    analyzer.aggregates, so their cost follows the number of days and
+    distinct amounts rather than transactions. Only the sample rows are read
+    from the statements themselves. A preset that fails gets
+    {'error': message} and the others are still evaluated.
+    """
+    totals = list()
+    with stage('aggregates'):
+        for preset in presets:
+            try:
+                totals.append(preset_totals(handles, preset))
+            except OSError:
+                raise
+            except Exception as e:
+                totals.append(e)
+    matched = [preset for preset, total in zip(presets, totals)
+               if isinstance(total, tuple) and total[0]]
+    with stage('samples'):
+        samples = iter(_stored_samples(handles, matched, sample_size))
+
+    results = list()
+    for total in totals:
+        if total is None:
+            results.append(None)
+            continue
+        if isinstance(total, Exception):
+            results.append(_failed_result(total))
+            continue
+
+        count, withdrawal, deposit, extra = total
+        if not count:
+            extra.pop('keyword_stats', None)
+            results.append(_empty_result(**extra))
+            continue
+
+        sample = next(samples)
+        if isinstance(sample, Exception):
+            results.append(_failed_result(sample))
+            continue
+
+        results.append({
+            'transaction_count': count,
+            'total_withdrawal': withdrawal,
+            'total_deposit': deposit,
+            'net_flow': deposit - withdrawal,
+            'transactions': sample,
+            'chart': None,
+            **extra
+        })
+
+    return results
+
+
+def category_breakdown(handles):
+    """Count and withdrawal/deposit totals per category of the statements, most spent first.
+
+    Transactions are labelled when they are stored, so this is a single
+    GROUP BY in the database for large data sets and otherwise a merge of
+    the per-statement category aggregates.
+    """
+    if should_push_down(handles):
+        rows = category_summary(statement_transactions(handles))
+    else:
+        totals = combined_categories(handles)
+        rows = zip(totals['Category'], totals['Count'].tolist(),
+                   totals['Withdrawal'].tolist(), totals['Deposit'].tolist())
+
+    breakdown = dict()
+    for category, count, withdrawal, deposit in rows:
+        # rows stored before categories were kept have none
+        stats = breakdown.setdefault(category or UNCATEGORIZED, {
+            'category': category or UNCATEGORIZED, 'count': 0, 'withdrawal': 0, 'deposit': 0,
+        })
+        stats['count'] += int(count)
+        stats['withdrawal'] += withdrawal or 0
+        stats['deposit'] += deposit or 0
+    # summed in paise, shown in rupees
+    for stats in breakdown.values():
+        stats['withdrawal'] = to_rupees(stats['withdrawal'])
+        stats['deposit'] = to_rupees(stats['deposit'])
+    return sorted(breakdown.values(), key=lambda stats: (-stats['withdrawal'], -stats['deposit']))
+
+
+def _page_frame(df, plan, rows):
+    page = df.iloc[rows]
+    if plan.keyword_labels is not None:
+        page = page.assign(Keyword=plan.keyword_labels[rows])
+    return display_frame(page)
+
+
+def _stored_page(handles, preset, after, size):
+    start, position = after if after is not None else (0, -1)
+    duplicates = duplicate_rows(handles)
+    frames = list()
+    taken = 0
+    last = None
+
+    for index in range(start, len(handles)):
+        df = load_statement(handles[index])
+        plan = _plan_preset(df, preset, handles[index])
+        if plan is None:
+            return None
+        rows = np.flatnonzero(plan.mask & ~duplicates[index])
+        if index == start:
+            rows = rows[rows > position]
+        rows = rows[:size - taken]
+
+        frames.append(_page_frame(df, plan, rows))
+        taken += len(rows)
+        if len(rows):
+            last = (index, int(rows[-1]))
+        if taken == size:
+            break
+
+    return pd.concat(frames, ignore_index=True), last
+
+
+def _db_page(handles, preset, after, size):
+    query = _query_preset(statement_transactions(handles), preset)
+    if query is None:
+        return None
+    queryset, extra = query
+    if after is not None:
+        queryset = after_row(queryset, handles, *after)
+
+    page, last = to_page(queryset, size)
+    if 'keywords' in extra:
+        _, labels = match_keywords(page, extra['keywords'])
+        page = page.assign(Keyword=labels)
+    return display_frame(page), (handles.index(last[0]), last[1]) if last is not None else None
+
+
+def transaction_page(handles, preset, after=None, size=PAGE_SIZE):
+    """One page of the transactions a preset matches, in session then row order.
+
+    Pages are cut by key rather than offset: after is the (statement index,
+    row position) of the last row of the previous page, so no page reads
+    the rows before it. Returns (frame, next) where frame is in the display
+    layout (with a Keyword column for keyword presets) and next is the
+    cursor for the following page, or None after the last one. Returns None
+    when the preset cannot be evaluated.
+    """
+    if after is not None and not 0 <= after[0] < len(handles):
+        raise ValueError(f'Invalid page cursor: {after!r}')
+
+    if should_push_down(handles):
+        page = _db_page(handles, preset, after, size)
+    else:
+        page = _stored_page(handles, preset, after, size)
+    if page is None:
+        return None
+    frame, last = page
+    return frame, last if len(frame) == size else None
+
+
+def iter_transaction_pages(handles, preset, size=EXPORT_PAGE_SIZE):
+    """Every transaction a preset matches, as consecutive transaction_page frames."""
+    after = None
+    while True:
+        page = transaction_page(handles, preset, after, size)
+        if page is None:
+            return
+        frame, after = page
+        yield frame
+        if after is None:
+            return
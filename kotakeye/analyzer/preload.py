@@ -0,0 +1,37 @@
+"""Load the analyzer's heavy dependencies before the first request.
+
+The views import pandas, matplotlib and pdfplumber only when a request
+needs them, which keeps management commands and the index page fast but
+makes the first upload or results page of each worker slow. Production
+servers call preload() once at startup instead: kotakeye.wsgi does so when
+PRELOAD_ANALYZER is set, and a server that forks its workers after loading
+the application (gunicorn --preload) shares the loaded modules between them.
+"""
+import importlib
+
+
+MODULES = [
+    'analyzer.extraction',
+    'analyzer.cache',
+    'analyzer.store',
+    'analyzer.aggregates',
+    'analyzer.planner',
+    'analyzer.utils',
+    'pdfplumber',
+]
+
+
+def _axes_only(ax):
+    ax.set_title('')
+
+
+def preload():
+    for module in MODULES:
+        importlib.import_module(module)
+
+    from analyzer.charts import render_png
+    from analyzer.jobs import get_parse_cache
+
+    # the first figure drawn builds matplotlib's font cache and Agg renderer
+    render_png(_axes_only, dpi=10)
+    get_parse_cache()
@@ -0,0 +1,103 @@
+import uuid
+from threading import Lock
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+from analyzer.models import Preset
+
+
+# Cache key of the stamp that changes whenever presets are created, edited
+# or deleted.
+VERSION_KEY = 'analyzer:presets:version'
+
+
+class PresetCache:
+    """Per-process copy of every preset, keyed by id.
+
+    The index and results pages read presets on every request but they
+    rarely change, so each process loads all of them with one query and
+    serves lookups from memory. Changes set a new version stamp in Django's
+    cache, which every process can see; a process holding presets loaded
+    under another stamp loads them again.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.presets = None
+        self.lock = Lock()
+
+    def _load(self):
+        version = cache.get(VERSION_KEY)
+        with self.lock:
+            if self.presets is None or self.version != version:
+                self.presets = Preset.objects.in_bulk()
+                self.version = version
+            return self.presets
+
+    def get(self, preset_id):
+        return self._load().get(preset_id)
+
+    def in_bulk(self, preset_ids):
+        """{id: preset} for the ids that exist, in the order given."""
+        presets = self._load()
+        return {preset_id: presets[preset_id] for preset_id in preset_ids if preset_id in presets}
+
+    def by_type(self):
+        """{preset_type: presets of that type sorted by name} for every type."""
+        grouped = {preset_type: list() for preset_type, _ in Preset.PRESET_TYPES}
+        for preset in sorted(self._load().values(), key=lambda preset: preset.name):
+            grouped.setdefault(preset.preset_type, list()).append(preset)
+        return grouped
+
+    def clear(self):
+        with self.lock:
+            self.presets = None
+            self.version = None
+
+
+def presets_changed():
+    """Make every process reload its presets on its next lookup."""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+preset_cache = PresetCache()
+
+
+# Fields an inline preset definition may set.
+DEFINITION_FIELDS = ('name', 'preset_type', 'start_date', 'end_date', 'keywords',
+                     'amount_value', 'amount_max', 'comparison_type')
+
+# Fields an inline definition of each preset type has to set; the model
+# leaves them optional because each type only uses some of them.
+REQUIRED_FIELDS = {
+    'date_range': ('start_date', 'end_date'),
+    'keyword': ('keywords',),
+    'amount_filter': ('amount_value', 'comparison_type'),
+}
+
+
+def preset_from_definition(definition):
+    """An unsaved Preset from a dict of its fields, validated like the preset forms.
+
+    Raises ValidationError if the definition is not a dict, sets a field
+    that is not in DEFINITION_FIELDS, holds an invalid value or leaves out
+    a field its preset type needs.
+    """
+    if not isinstance(definition, dict):
+        raise ValidationError('A preset is either the id of a saved preset or an object of preset fields')
+    unknown = set(definition) - set(DEFINITION_FIELDS)
+    if unknown:
+        raise ValidationError(f'Unknown preset field(s): {", ".join(sorted(unknown))}')
+    preset = Preset(**definition)
+    preset.full_clean(exclude=['name', 'image', 'chart_mode'])
+
+    missing = [field for field in REQUIRED_FIELDS[preset.preset_type]
+               if getattr(preset, field) is None or not str(getattr(preset, field)).strip()]
+    if preset.comparison_type == 'between' and preset.amount_max is None:
+        missing.append('amount_max')
+    if missing:
+        raise ValidationError(f'A {preset.preset_type} preset needs {", ".join(missing)}')
+    if preset.comparison_type == 'between' and preset.amount_max < preset.amount_value:
+        raise ValidationError('amount_max must not be less than amount_value')
+    return preset
@@ -0,0 +1,180 @@
+import numpy as np
+from django.db import connection
+from django.db.models import Case, When, Count, Sum, Q, Value, IntegerField, Exists, OuterRef
+from django.db.models.expressions import RawSQL
+
+from analyzer.amounts import EQUAL
+from analyzer.models import Transaction
+from analyzer.schema import to_paise, compact_frame, compact_strings
+
+
+FTS_TABLE = 'analyzer_transaction_fts'
+
+# The trigram tokenizer cannot match anything shorter than three characters.
+FTS_MIN_LENGTH = 3
+
+_has_fts = None
+
+
+def has_narration_index():
+    global _has_fts
+    if _has_fts is None:
+        _has_fts = FTS_TABLE in connection.introspection.table_names()
+    return _has_fts
+
+
+def statement_transactions(handles):
+    """Transactions of the given statements, in session order then row order.
+
+    Rows already present in an earlier statement of the list (overlapping
+    statement periods) are left out, matching analyzer.merge.
+    """
+    order = Case(*[When(statement_id=handle, then=Value(index)) for index, handle in enumerate(handles)],
+                 output_field=IntegerField())
+    condition = Q()
+    for index, handle in enumerate(handles):
+        rows = Q(statement_id=handle)
+        if handles[:index]:
+            rows &= ~Exists(Transaction.objects.filter(
+                statement_id__in=handles[:index], dedup_key=OuterRef('dedup_key')
+            ))
+        condition |= rows
+    return (Transaction.objects
+            .filter(condition)
+            .annotate(statement_order=order)
+            .order_by('statement_order', 'position'))
+
+
+def date_range_query(queryset, start_date, end_date):
+    # a missing date leaves that end of the range open, as in date_range_mask
+    if start_date is not None:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date is not None:
+        queryset = queryset.filter(date__lte=end_date)
+    return queryset
+
+
+def amount_query(queryset, amount, comparison_type, amount_max=None):
+    # A transaction is either a withdrawal or a deposit, so comparing the
+    # indexed amount column is the same as comparing whichever side is set.
+    if comparison_type in EQUAL:
+        # the other side of every transaction is 0, so 0 matches them all
+        return queryset.filter(amount=int(to_paise(amount))) if amount else queryset
+    elif comparison_type == 'lt':
+        return queryset.filter(amount__gt=0, amount__lt=int(to_paise(amount)))
+    elif comparison_type == 'gt':
+        return queryset.filter(amount__gt=int(to_paise(amount)))
+    elif comparison_type == 'between' and amount_max is not None:
+        return queryset.filter(amount__range=(int(to_paise(amount)), int(to_paise(amount_max))))
+    else:
+        return None
+
+
+def _fts_phrase(keyword):
+    return '"' + keyword.replace('"', '""') + '"'
+
+
+def keyword_query(queryset, keywords):
+    indexed = [k for k in keywords if len(k) >= FTS_MIN_LENGTH] if has_narration_index() else []
+    condition = Q()
+    if indexed:
+        condition |= Q(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [' OR '.join(_fts_phrase(k) for k in indexed)]
+        ))
+    for keyword in keywords:
+        if keyword not in indexed:
+            condition |= Q(narration__icontains=keyword)
+    return queryset.filter(condition)
+
+
+def summarize(queryset):
+    """Count and withdrawal/deposit totals in paise of a query, computed in the database."""
+    totals = queryset.order_by().aggregate(
+        count=Count('id'), withdrawal=Sum('withdrawal'), deposit=Sum('deposit')
+    )
+    return totals['count'], totals['withdrawal'] or 0, totals['deposit'] or 0
+
+
+def category_summary(queryset):
+    """(category, count, withdrawal, deposit) in paise for each category of a query, in one GROUP BY."""
+    return list(queryset.order_by().values('category').annotate(
+        count=Count('id'), withdrawal=Sum('withdrawal'), deposit=Sum('deposit')
+    ).values_list('category', 'count', 'withdrawal', 'deposit'))
+
+
+def daily_summary(queryset):
+    """(date, count, withdrawal, deposit) in paise for each day of a query, in one GROUP BY."""
+    return list(queryset.order_by().values('date').annotate(
+        count=Count('id'), withdrawal=Sum('withdrawal'), deposit=Sum('deposit')
+    ).values_list('date', 'count', 'withdrawal', 'deposit'))
+
+
+def amount_summary(queryset):
+    """(amount, count) for each distinct paise amount of a query, in one GROUP BY."""
+    return list(queryset.order_by().values('amount').annotate(count=Count('id')).values_list('amount', 'count'))
+
+
+def keyword_summary(queryset, keywords):
+    """(flags, count, withdrawal, deposit) in paise per combination of keywords in a query's narrations.
+
+    flags holds a 0 or 1 per keyword. Grouping by them returns one row per
+    combination that occurs, however many transactions match.
+    """
+    flags = {
+        f'keyword_{index}': Case(When(narration__icontains=keyword, then=Value(1)),
+                                 default=Value(0), output_field=IntegerField())
+        for index, keyword in enumerate(keywords)
+    }
+    rows = queryset.order_by().annotate(**flags).values(*flags).annotate(
+        count=Count('id'), withdrawal=Sum('withdrawal'), deposit=Sum('deposit')
+    ).values_list(*flags, 'count', 'withdrawal', 'deposit')
+    return [(row[:len(flags)], *row[len(flags):]) for row in rows]
+
+
+def after_row(queryset, handles, index, position):
+    """Rows of a statement_transactions query that come after the given row.
+
+    The row is identified by its statement's index in handles and its
+    position in that statement, which keeps the filter on indexed columns.
+    A statement listed twice is only read at its first index, so later
+    copies of it (or of any statement before the row) are left out.
+    """
+    seen = set(handles[:index + 1])
+    later = [handle for handle in handles[index + 1:] if handle not in seen]
+    return queryset.filter(Q(statement_id__in=later)
+                           | Q(statement_id=handles[index], position__gt=position))
+
+
+FRAME_FIELDS = ['date', 'narration', 'reference', 'withdrawal', 'deposit', 'balance', 'category']
+
+
+def to_frame(queryset):
+    """DataFrame with the same columns as stored statements."""
+    return _frame(list(queryset.values_list(*FRAME_FIELDS)))
+
+
+def to_page(queryset, size):
+    """to_frame of the first size rows, and (statement_id, position) of the last one."""
+    rows = list(queryset.values_list('statement_id', 'position', *FRAME_FIELDS)[:size])
+    last = tuple(rows[-1][:2]) if rows else None
+    return _frame([row[2:] for row in rows]), last
+
+
+def _frame(rows):
+    if not rows:
+        columns = [[] for _ in range(7)]
+    else:
+        columns = list(zip(*rows))
+    dates, narrations, references, withdrawals, deposits, balances, categories = columns
+
+    withdrawals = np.asarray(withdrawals, dtype=np.int64)
+    debits = withdrawals > 0
+    return compact_frame(
+        np.array(dates, dtype='datetime64[D]').astype('datetime64[ns]'),
+        narrations,
+        references,
+        np.where(debits, withdrawals, np.asarray(deposits, dtype=np.int64)),
+        debits,
+        np.asarray(balances, dtype=np.int64),
+    ).assign(Category=compact_strings(categories))
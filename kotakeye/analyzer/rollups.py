@@ -0,0 +1,49 @@
+import pandas as pd
+
+
+# Bars a date range chart may have before its days are rolled up into
+# weeks, months or quarters. Two months still show one bar per day.
+MAX_POINTS = 62
+
+# bucket: (resample rule, approximate length in days)
+BUCKETS = {
+    'day': ('D', 1),
+    'week': ('W-MON', 7),
+    'month': ('MS', 30.44),
+    'quarter': ('QS', 91.31),
+}
+
+
+def choose_bucket(start, end, max_points=MAX_POINTS):
+    """The finest bucket that splits start..end into at most max_points periods.
+
+    Spans too long even for quarters still get quarters.
+    """
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    for bucket, (_, length) in BUCKETS.items():
+        if days / length <= max_points:
+            return bucket
+    return 'quarter'
+
+
+def _labels(index, bucket):
+    if bucket == 'month':
+        return index.strftime('%Y-%m')
+    if bucket == 'quarter':
+        return [f'{period.year}-Q{period.quarter}' for period in index]
+    # days and weeks are labelled by their first day
+    return index.date
+
+
+def rollup(totals, bucket):
+    """Sum totals per bucket period, labelled for display.
+
+    totals is indexed by a DatetimeIndex (sorted, as resampling expects)
+    and has a Count column; periods without transactions are left out, so
+    day buckets hold exactly the days that have transactions.
+    """
+    rule, _ = BUCKETS[bucket]
+    rolled = totals.resample(rule, closed='left', label='left').sum()
+    rolled = rolled[rolled['Count'] > 0]
+    rolled.index = _labels(rolled.index, bucket)
+    return rolled
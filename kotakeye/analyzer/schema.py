@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+# Amounts and balances are held as integer paise, so sums are exact.
+PAISE_PER_RUPEE = 100
+
+# String columns become categoricals when at most this share of their
+# values is distinct. Mostly-unique columns (references, narrations that
+# embed a UPI id) are smaller as plain object arrays.
+CATEGORY_MAX_RATIO = 0.5
+
+
+def to_paise(values):
+    return np.round(np.asarray(values, dtype=np.float64) * PAISE_PER_RUPEE).astype(np.int64)
+
+
+def to_rupees(paise):
+    return np.asarray(paise) / PAISE_PER_RUPEE
+
+
+def compact_strings(values):
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    if len(uniques) > CATEGORY_MAX_RATIO * len(codes):
+        return np.asarray(values, dtype=object)
+    return pd.Categorical.from_codes(codes, categories=uniques)
+
+
+def compact_frame(dates, narrations, references, amounts, debits, balances):
+    """The transaction frame every part of the analyzer works on.
+
+    Columns: Date, Narration, Reference, Amount (signed paise, negative for
+    withdrawals), Debit (True for withdrawals) and Balance (paise). amounts
+    and balances are passed as unsigned paise.
+    """
+    debits = np.asarray(debits, dtype=bool)
+    amounts = np.asarray(amounts, dtype=np.int64)
+    return pd.DataFrame({
+        'Date': dates,
+        'Narration': compact_strings(narrations),
+        'Reference': compact_strings(references),
+        'Amount': np.where(debits, -amounts, amounts),
+        'Debit': debits,
+        'Balance': np.asarray(balances, dtype=np.int64),
+    })
+
+
+def from_legacy(df):
+    """Convert a frame with float Withdrawal/Deposit/Balance columns."""
+    withdrawals = to_paise(df['Withdrawal'])
+    deposits = to_paise(df['Deposit'])
+    debits = withdrawals > 0
+    return compact_frame(df['Date'].to_numpy(), df['Narration'], df['Reference'],
+                         np.where(debits, withdrawals, deposits), debits, to_paise(df['Balance']))
+
+
+def ensure_compact(df):
+    if df is None or 'Amount' in df.columns:
+        return df
+    return from_legacy(df)
+
+
+def withdrawals(df):
+    """Withdrawn paise per row, 0 for deposits."""
+    amounts = df['Amount'].to_numpy()
+    return np.where(amounts < 0, -amounts, 0)
+
+
+def deposits(df):
+    """Deposited paise per row, 0 for withdrawals."""
+    amounts = df['Amount'].to_numpy()
+    return np.where(amounts > 0, amounts, 0)
+
+
+def flows(df):
+    """Withdrawal and Deposit columns in rupees, for totals tables and charts."""
+    return pd.DataFrame({
+        'Withdrawal': to_rupees(withdrawals(df)),
+        'Deposit': to_rupees(deposits(df)),
+    }, index=df.index)
+
+
+def display_frame(df):
+    """df in the rupee Withdrawal/Deposit/Balance layout shown to users.
+
+    Used for transaction tables and CSV export; any extra columns (such as
+    Keyword) are kept.
+    """
+    columns = dict()
+    for column in df.columns:
+        if column == 'Amount':
+            columns.update(flows(df))
+        elif column == 'Debit':
+            continue
+        elif column == 'Balance':
+            columns['Balance'] = to_rupees(df['Balance'])
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            columns[column] = df[column].to_numpy(dtype=object)
+        else:
+            columns[column] = df[column]
+    return pd.DataFrame(columns, index=df.index)
+
+
+def records(df):
+    return display_frame(df).to_dict('records')
+
+
+def concat_frames(frames):
+    """pd.concat for transaction frames that keeps string columns categorical.
+
+    pd.concat turns categoricals with different categories into objects;
+    here their categories are unioned instead. Columns missing from some
+    frames (Category, for statements stored before it) are left out.
+    """
+    frames = [df for df in frames if df is not None]
+    if not frames:
+        return None
+
+    columns = dict()
+    for column in frames[0].columns:
+        if not all(column in df.columns for df in frames[1:]):
+            continue
+        parts = [df[column] for df in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            columns[column] = union_categoricals(parts)
+        elif any(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            columns[column] = np.concatenate([part.to_numpy(dtype=object) for part in parts])
+        else:
+            columns[column] = np.concatenate([part.to_numpy() for part in parts])
+    return pd.DataFrame(columns)
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from analyzer.categories import ensure_categories
+from analyzer.columnar import write_frame, read_frame, remove_frame
+from analyzer.merge import row_keys
+from analyzer.models import Statement, Transaction
+from analyzer.schema import ensure_compact, withdrawals, deposits
+
+
+# Transactions inserted per INSERT statement when a statement is first seen.
+INSERT_BATCH_SIZE = 2000
+
+
+HANDLE_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _statement_dir(handle):
+    if not HANDLE_PATTERN.match(handle):
+        raise ValueError(f'Invalid statement handle: {handle!r}')
+    return os.path.join(settings.STATEMENT_STORE_DIR, handle)
+
+
+def content_hash(df):
+    # categories are derived from the transactions, so they are left out
+    df = df.drop(columns=['Category'], errors='ignore')
+    digest = hashlib.sha256(','.join(df.columns).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:32]
+
+
+def _transactions(handle, df):
+    # the database keeps paise, like the column files
+    for position, (day, narration, reference, withdrawal, deposit, amount, balance, key, category) in enumerate(zip(
+            df['Date'].dt.date, df['Narration'], df['Reference'], withdrawals(df).tolist(),
+            deposits(df).tolist(), np.abs(df['Amount'].to_numpy()).tolist(),
+            df['Balance'].tolist(), row_keys(df).tolist(), df['Category'])):
+        yield Transaction(statement_id=handle, position=position, date=day, narration=narration,
+                          reference=reference, withdrawal=withdrawal, deposit=deposit,
+                          amount=amount, balance=balance, dedup_key=key, category=category)
+
+
+def save_statement(df):
+    """Store a parsed statement and return its handle.
+
+    The handle is a hash of the transactions, so a statement uploaded again,
+    from any session, is stored once: as memory-mappable column files for
+    in-memory analysis and as indexed Transaction rows for queries that are
+    pushed down to the database. Transactions are labelled with their
+    category (analyzer.categories) unless df has a Category column already.
+    Every call takes a reference that delete_statements gives back.
+    """
+    df = ensure_categories(ensure_compact(df))
+    handle = content_hash(df)
+    path = _statement_dir(handle)
+    if not os.path.isdir(path):
+        os.makedirs(settings.STATEMENT_STORE_DIR, exist_ok=True)
+        try:
+            write_frame(path, df)
+        except OSError:
+            # written by a concurrent upload of the same statement
+            if not os.path.isdir(path):
+                raise
+
+    with transaction.atomic():
+        statement, created = Statement.objects.select_for_update().get_or_create(
+            content_hash=handle, defaults={'row_count': len(df), 'reference_count': 1}
+        )
+        if created:
+            Transaction.objects.bulk_create(_transactions(handle, df), batch_size=INSERT_BATCH_SIZE)
+        else:
+            Statement.objects.filter(pk=handle).update(reference_count=F('reference_count') + 1,
+                                                       saved_at=timezone.now())
+    return handle
+
+
+def load_statement(handle):
+    # statements stored before amounts were kept in paise are converted on read
+    return ensure_compact(read_frame(_statement_dir(handle)))
+
+
+def _aggregate_dir(handle, name):
+    return f'{_statement_dir(handle)}.{name}'
+
+
+def save_aggregate(handle, name, df):
+    """Store a summary frame next to a statement; it is removed together with it."""
+    try:
+        write_frame(_aggregate_dir(handle, name), df)
+    except OSError:
+        # statements are immutable, so an existing aggregate is already current
+        if not os.path.isdir(_aggregate_dir(handle, name)):
+            raise
+
+
+def load_aggregate(handle, name):
+    return read_frame(_aggregate_dir(handle, name))
+
+
+def statement_aggregate(handle, name, build):
+    """Stored aggregate of a statement, built from it with build(df) on first use."""
+    try:
+        return load_aggregate(handle, name)
+    except (OSError, ValueError):
+        aggregate = build(load_statement(handle))
+        save_aggregate(handle, name, aggregate)
+        return aggregate
+
+
+def _remove_statement_files(handle):
+    prefix = f'{handle}.'
+    try:
+        entries = [entry.path for entry in os.scandir(settings.STATEMENT_STORE_DIR)
+                   if entry.name.startswith(prefix) and not entry.name.endswith('.tmp')]
+    except FileNotFoundError:
+        return
+    for path in [_statement_dir(handle)] + entries:
+        try:
+            remove_frame(path)
+        except FileNotFoundError:
+            pass
+
+
+def dataset_fingerprint(handles):
+    """Stable id for a combination of statements, usable in cache keys and URLs."""
+    return hashlib.sha1(','.join(handles).encode()).hexdigest()[:16]
+
+
+def statement_rows(handles):
+    """Transactions stored in the database for the given statements."""
+    if not handles:
+        return 0
+    return Statement.objects.filter(pk__in=set(handles)).aggregate(rows=Sum('row_count'))['rows'] or 0
+
+
+def should_push_down(handles):
+    """Whether queries over these statements should run as SQL instead of in memory."""
+    threshold = getattr(settings, 'SQL_PUSHDOWN_ROWS', None)
+    return threshold is not None and statement_rows(handles) >= threshold
+
+
+def delete_statements(handles):
+    """Give back one reference per handle and remove statements nobody holds."""
+    released = Counter(handles)
+    with transaction.atomic():
+        statements = list(Statement.objects.select_for_update().filter(pk__in=released))
+        unused = set()
+        for statement in statements:
+            remaining = statement.reference_count - released[statement.pk]
+            if remaining > 0:
+                Statement.objects.filter(pk=statement.pk).update(reference_count=remaining)
+            else:
+                unused.add(statement.pk)
+        Statement.objects.filter(pk__in=unused).delete()
+        known = {statement.pk for statement in statements}
+
+    # handles without a Statement row predate the database store
+    for handle in unused | (set(released) - known):
+        if HANDLE_PATTERN.match(handle):
+            _remove_statement_files(handle)
+
+
+def purge_statements(held, saved_before):
+    """Remove every stored statement not in held, and return how many were removed.
+
+    delete_statements only runs when a session is cleared; this catches
+    statements of sessions that expired. Statements saved after the
+    saved_before datetime are kept, as their upload may not have reached
+    a session yet.
+    """
+    held = set(held)
+    with transaction.atomic():
+        unused = set(Statement.objects.filter(saved_at__lt=saved_before)
+                     .exclude(pk__in=held).values_list('pk', flat=True))
+        Statement.objects.filter(pk__in=unused).delete()
+        known = set(Statement.objects.values_list('pk', flat=True))
+
+    # column files without a Statement row predate the database store
+    cutoff = saved_before.timestamp()
+    try:
+        entries = list(os.scandir(settings.STATEMENT_STORE_DIR))
+    except FileNotFoundError:
+        entries = []
+    unused |= {entry.name for entry in entries
+               if HANDLE_PATTERN.match(entry.name) and entry.name not in held | known
+               and entry.stat().st_mtime < cutoff}
+    for handle in unused:
+        _remove_statement_files(handle)
+    return len(unused)
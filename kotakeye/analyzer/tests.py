@@ -1,3 +1,693 @@
-from django.test import TestCase
+import gc
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import psutil
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from analyzer.aggregates import save_aggregates, category_totals
+from analyzer.amounts import AmountIndex
+from analyzer.categories import UNCATEGORIZED, RuleSet, NarrationClassifier, categorize
+from analyzer.charts import render_png, draw_daily_totals, figure_pool
+from analyzer.jobs import STALE_JOB_ERROR, run_upload, get_parse_cache
+from analyzer.merge import row_keys, duplicate_masks, balance_breaks
+from analyzer.models import Preset, UploadJob, Statement
+from analyzer.parser import parse_text, match_lines
+from analyzer.presets import preset_cache, presets_changed
+from analyzer.schema import compact_frame, display_frame, to_paise, to_rupees, withdrawals
+from analyzer.store import save_statement
+from benchmarks.bench_imports import TARGETS, HEAVY, import_times
+from benchmarks.synthetic import statement_lines, statement_text, statement_pdf
+
+
+class ChartRenderingTests(SimpleTestCase):
+    # a render takes ~50ms whatever the dpi, so this keeps the test to a few
+    # seconds; leaked figures are counted directly rather than left to show
+    # up in the resident size
+    RENDERS = 60
+
+    def setUp(self):
+        self.daily_totals = pd.DataFrame({
+            'Withdrawal': [100.0, 50.0, 0.0],
+            'Deposit': [0.0, 300.0, 25.0],
+        }, index=['2025-01-01', '2025-01-02', '2025-01-03'])
+
+    def render(self):
+        return render_png(draw_daily_totals, self.daily_totals, dpi=20)
+
+    def live_figures(self):
+        from matplotlib.figure import Figure
+        gc.collect()
+        return sum(isinstance(obj, Figure) for obj in gc.get_objects())
+
+    def test_repeated_renders_do_not_grow_memory(self):
+        process = psutil.Process()
+        for _ in range(10):
+            self.render()
+        figures = self.live_figures()
+        baseline = process.memory_info().rss
+
+        for _ in range(self.RENDERS):
+            self.render()
+
+        growth = process.memory_info().rss - baseline
+        self.assertLess(growth, 10 * 1024 * 1024)
+        self.assertEqual(self.live_figures(), figures)
+        self.assertLessEqual(figure_pool.created, figure_pool.size)
+        self.assertNotIn('matplotlib.pyplot', sys.modules)
+
+    def test_concurrent_renders_match_serial_output(self):
+        expected = self.render()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            charts = list(executor.map(lambda _: self.render(), range(32)))
+        self.assertTrue(all(chart == expected for chart in charts))
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_entry_points_do_not_import_heavy_modules(self):
+        for target, (cwd, code) in TARGETS.items():
+            with self.subTest(target):
+                modules = {name for name, *_ in import_times(code, cwd)}
+                self.assertFalse(modules & set(HEAVY))
+
+
+class PresetLookupTests(TestCase):
+    def setUp(self):
+        preset_cache.clear()
+
+    def add_presets(self, count):
+        start = Preset.objects.count()
+        Preset.objects.bulk_create([Preset(name=f'Preset {start + i}', preset_type=preset_type)
+                                    for i, preset_type in enumerate(['date_range', 'keyword', 'amount_filter'] * count)])
+        presets_changed()
+
+    def index_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('index')).status_code, 200)
+        return len(queries)
+
+    def test_index_query_count_does_not_grow_with_presets(self):
+        # the first request also creates the session
+        self.index_queries()
+        self.add_presets(1)
+        few = self.index_queries()
+        self.add_presets(20)
+        self.assertEqual(self.index_queries(), few)
+
+    def test_lookups_load_every_preset_in_one_query(self):
+        self.add_presets(10)
+        ids = list(Preset.objects.values_list('pk', flat=True))
+        with self.assertNumQueries(1):
+            found = preset_cache.in_bulk(ids + [0])
+        self.assertEqual(list(found), ids)
+        with self.assertNumQueries(0):
+            preset_cache.in_bulk(ids)
+            preset_cache.by_type()
+
+    def test_changes_reload_presets(self):
+        self.add_presets(1)
+        self.assertEqual(sum(map(len, preset_cache.by_type().values())), 3)
+        self.add_presets(1)
+        self.assertEqual(sum(map(len, preset_cache.by_type().values())), 6)
+
+
+class UploadJobTests(TestCase):
+    def job(self, status, age):
+        job = UploadJob.objects.create(file_count=1, status=status)
+        UploadJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(seconds=age))
+        session = self.client.session
+        session['upload_jobs'] = session.get('upload_jobs', []) + [str(job.pk)]
+        session.save()
+        return job
+
+    @override_settings(UPLOAD_JOB_TIMEOUT=60)
+    def test_jobs_lost_by_a_restart_fail_after_the_timeout(self):
+        stale = [self.job('pending', 120), self.job('running', 120)]
+        recent = self.job('pending', 10)
+        for job in stale:
+            status = self.client.get(reverse('job_status', args=[job.pk])).json()
+            self.assertEqual((status['status'], status['finished']), ('failed', True))
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, STALE_JOB_ERROR)
+        self.assertEqual(response.context['pending_jobs'], [str(recent.pk)])
+
+        # a stale job that reaches a worker after all is not run
+        run_upload(stale[0].pk, [])
+        self.assertEqual(UploadJob.objects.get(pk=stale[0].pk).errors, [STALE_JOB_ERROR])
+
+    @override_settings(PARSE_CACHE_DIR=None)
+    def test_parse_cache_can_be_turned_off(self):
+        job = self.job('pending', 0)
+        with mock.patch('analyzer.extraction.extract_statements', return_value=[]) as extract:
+            run_upload(job.pk, [])
+        self.assertIsNone(extract.call_args.args[3])
+        self.assertIsNone(get_parse_cache())
+
+
+class PdfExtractorTests(SimpleTestCase):
+    def setUp(self):
+        from django.conf import settings
+        path = os.path.join(os.path.dirname(settings.BASE_DIR), 'pdfextractor.py')
+        spec = importlib.util.spec_from_file_location('pdfextractor', path)
+        self.extractor = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.extractor)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.pdf = os.path.join(self.directory, 'statement.pdf')
+        with open(self.pdf, 'wb') as f:
+            f.write(statement_pdf(2, 60))
+
+    def test_pages_are_parsed_in_processes_started_without_fork(self):
+        from concurrent.futures import ProcessPoolExecutor
+        from analyzer import extraction
+        with open(self.pdf, 'wb') as f:
+            f.write(statement_pdf(extraction.PAGES_PER_TASK + 1, 90))
+        contexts = list()
+
+        def pool(*args, **kwargs):
+            contexts.append(kwargs['mp_context'].get_start_method())
+            return ProcessPoolExecutor(*args, **kwargs)
+
+        # from a thread, as upload jobs do
+        with mock.patch.object(extraction, 'ProcessPoolExecutor', pool), ThreadPoolExecutor(1) as threads:
+            (df, error), = threads.submit(extraction.extract_statements, [self.pdf], None, 2).result()
+        self.assertIsNone(error)
+        self.assertEqual(contexts, ['forkserver'])
+        serial, _ = extraction.extract_statements([self.pdf], None, 1)[0]
+        pd.testing.assert_frame_equal(df, serial)
+
+    def test_conversions_fill_the_cache(self):
+        cache_dir = os.path.join(self.directory, 'cache')
+        output = os.path.join(self.directory, 'statement.csv')
+        self.assertEqual(self.extractor.convert_file(self.pdf, output, cache_dir=cache_dir), 60)
+        with open(output) as f:
+            parsed = f.read()
+        os.remove(output)
+        with mock.patch('analyzer.extraction.iter_transactions', side_effect=AssertionError('parsed again')):
+            self.assertEqual(self.extractor.convert_file(self.pdf, output, cache_dir=cache_dir), 60)
+        with open(output) as f:
+            self.assertEqual(f.read(), parsed)
+
+    def test_failed_conversion_keeps_the_previous_output(self):
+        from analyzer.extraction import iter_transactions
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory)
+        self.extractor.run_single([self.pdf, '', 'statement', '--workers', '1', '--no-cache'])
+        output = os.path.join(self.directory, 'results', 'statement.csv')
+        with open(output) as f:
+            parsed = f.read()
+
+        def failing(*args, **kwargs):
+            # the first page, then an error
+            yield next(iter_transactions(*args, **kwargs, batch_rows=10))
+            raise RuntimeError('damaged page')
+
+        with mock.patch('analyzer.extraction.iter_transactions', failing), \
+                self.assertRaisesMessage(RuntimeError, 'damaged page'):
+            self.extractor.run_single([self.pdf, '', 'statement', '--workers', '1', '--no-cache'])
+        with open(output) as f:
+            self.assertEqual(f.read(), parsed)
+        self.assertEqual(os.listdir(os.path.dirname(output)), ['statement.csv'])
+
+
+class ParserTests(SimpleTestCase):
+    def parsed(self, text):
+        df = display_frame(parse_text(text))
+        return [(date.strftime('%d-%m-%Y'), narration, reference, withdrawal, deposit, balance)
+                for date, narration, reference, withdrawal, deposit, balance in df.itertuples(index=False)]
+
+    def test_statement_lines(self):
+        self.assertEqual(self.parsed('\n'.join([
+            'Date Narration Chq/Ref No Withdrawal (Dr)/ Deposit (Cr) Balance',
+            '01-04-2025 UPI/AMAZON/123456/Payment from Ph UPI-0000000001 1,234.50(Dr) 98,765.43(Cr)',
+            '2 02-04-2025 NEFT/ACME CORP SALARY NEFT-AB12 1,23,456.78(Cr) 2,22,222.21(Cr)',
+            '03-04-2025 ATM WDL/MG ROAD 000123 222,222.21(Dr) 0.00(Cr)',
+        ])), [
+            ('01-04-2025', 'UPI/AMAZON/123456/Payment from Ph', 'UPI-0000000001', 1234.5, 0.0, 98765.43),
+            ('02-04-2025', 'NEFT/ACME CORP SALARY', 'NEFT-AB12', 0.0, 123456.78, 222222.21),
+            ('03-04-2025', 'ATM WDL/MG ROAD', '000123', 222222.21, 0.0, 0.0),
+        ])
+
+    def test_negative_amounts(self):
+        self.assertEqual(self.parsed('\n'.join([
+            '01-04-2025 CHEQUE RETURN CHQ-1 -500.00(Dr) -1,500.00(Dr)',
+            '02-04-2025 REVERSAL CHQ-1 -500.00(Cr) -1,000.00(Dr)',
+        ])), [
+            ('01-04-2025', 'CHEQUE RETURN', 'CHQ-1', 500.0, 0.0, -1500.0),
+            ('02-04-2025', 'REVERSAL', 'CHQ-1', 0.0, 500.0, -1000.0),
+        ])
+
+    def test_wrapped_lines(self):
+        self.assertEqual(self.parsed('\n'.join([
+            '01-04-2025 UPI/SWIGGY/ORDER/9876543210/Payment',
+            'from Ph UPI-0000000002 450.00(Dr) 98,315.43(Cr)',
+            '02-04-2025 IMPS/PARENTS SUPPORT',
+            'IMPS-77',
+            '10,000.00(Dr)',
+            '88,315.43(Cr)',
+        ])), [
+            ('01-04-2025', 'UPI/SWIGGY/ORDER/9876543210/Payment from Ph', 'UPI-0000000002', 450.0, 0.0, 98315.43),
+            ('02-04-2025', 'IMPS/PARENTS SUPPORT', 'IMPS-77', 10000.0, 0.0, 88315.43),
+        ])
+
+    def test_wrapping_stops_at_the_next_transaction(self):
+        # a dated line without amounts is dropped rather than merged with the next one
+        self.assertEqual([row[:2] for row in match_lines('\n'.join([
+            '01-04-2025 OPENING BALANCE 1,00,000.00(Cr)',
+            '3 02-04-2025 UPI/RENT/MAY UPI-3 15,000.00(Dr) 85,000.00(Cr)',
+            'Statement generated on 30-04-2025',
+        ]))], [('02-04-2025', 'UPI/RENT/MAY')])
+
+
+class MergeTests(SimpleTestCase):
+    def setUp(self):
+        # a quarterly and a later statement sharing 80 transactions
+        self.first = parse_text('\n'.join(statement_lines(300)[:200]))
+        self.second = parse_text('\n'.join(statement_lines(300)[120:]))
+
+    def test_overlapping_rows_are_duplicates(self):
+        first, second = duplicate_masks([row_keys(self.first), row_keys(self.second)])
+        self.assertFalse(first.any())
+        self.assertEqual(second.tolist(), [True] * 80 + [False] * 100)
+
+    def test_repeated_rows_are_matched_one_for_one(self):
+        # two identical transactions in the first statement and three in the second
+        row = self.first.iloc[[10]]
+        first = pd.concat([self.first.iloc[:10], row, row])
+        second = pd.concat([row, row, row, self.second])
+        _, second = duplicate_masks([row_keys(first), row_keys(second)])
+        self.assertEqual(second[:4].tolist(), [True, True, False, False])
+
+    def test_balance_breaks(self):
+        first, second = duplicate_masks([row_keys(self.first), row_keys(self.second)])
+        merged = pd.concat([self.first[~first], self.second[~second]], ignore_index=True)
+        self.assertEqual(balance_breaks(merged), 0)
+        # a transaction missing from both statements
+        self.assertEqual(balance_breaks(merged.drop(index=150)), 1)
+        self.assertEqual(balance_breaks(merged.iloc[:1]), 0)
+
+
+@override_settings(CATEGORY_RULES=None, CATEGORY_TRAINING_FILE=None)
+class AmountIndexTests(SimpleTestCase):
+    def setUp(self):
+        # withdrawals are negative; the 0 row is a zero-value entry
+        self.index = AmountIndex(to_paise([-250, 100, 0, 250, 100.5, -1000, 100]))
+
+    def positions(self, *args):
+        return self.index.rows(self.index.span(*args)).tolist()
+
+    def test_equal(self):
+        self.assertEqual(self.positions(250, '='), [0, 3])
+        self.assertEqual(self.positions(100, 'eq'), [1, 6])
+        self.assertEqual(self.positions(1000, '='), [5])
+        self.assertEqual(self.positions(99.99, '='), [])
+        self.assertEqual(self.positions(0, '='), list(range(7)))
+
+    def test_lt_and_gt_exclude_the_amount(self):
+        self.assertEqual(self.positions(250, 'lt'), [1, 4, 6])
+        self.assertEqual(self.positions(100, 'lt'), [])
+        self.assertEqual(self.positions(250, 'gt'), [5])
+        self.assertEqual(self.positions(1000, 'gt'), [])
+        self.assertEqual(self.positions(0, 'gt'), [0, 1, 3, 4, 5, 6])
+
+    def test_between_includes_both_ends(self):
+        self.assertEqual(self.positions(100, 'between', 250), [0, 1, 3, 4, 6])
+        self.assertEqual(self.positions(100.5, 'between', 100.5), [4])
+        self.assertEqual(self.positions(250, 'between', 100), [])
+        self.assertIsNone(self.index.span(100, 'between'))
+
+    def test_unknown_comparison(self):
+        self.assertIsNone(self.index.span(100, 'ge'))
+        self.assertIsNone(self.index.span(None, 'lt'))
+
+    def test_mask_matches_rows(self):
+        span = self.index.span(100, 'between', 250)
+        mask = self.index.mask(span)
+        self.assertEqual(np.flatnonzero(mask).tolist(), self.index.rows(span).tolist())
+        self.assertEqual(mask.tolist(), [True, True, False, True, True, False, True])
+
+    def test_empty_index(self):
+        index = AmountIndex(np.array([], dtype=np.int64))
+        for args in [(0, '='), (100, '='), (100, 'lt'), (100, 'gt'), (100, 'between', 50)]:
+            span = index.span(*args)
+            self.assertEqual(len(index.rows(span)), 0)
+            self.assertEqual(index.mask(span).tolist(), [])
+
+
+class CategoryTests(SimpleTestCase):
+    def frame(self, transactions):
+        """Transactions given as (narration, rupees), negative for withdrawals."""
+        narrations, amounts = zip(*transactions)
+        amounts = to_paise(amounts)
+        return compact_frame(pd.to_datetime(['2025-01-01'] * len(amounts)), narrations,
+                             [''] * len(amounts), abs(amounts), amounts < 0, [0] * len(amounts))
+
+    def categories(self, transactions, **kwargs):
+        return list(categorize(self.frame(transactions), **kwargs))
+
+    def test_default_rules(self):
+        self.assertEqual(self.categories([
+            ('NEFT/ACME CORP SALARY', 50000),
+            ('UPI/SWIGGY/ORDER', -450),
+            ('ATM WDL/MG ROAD', -2000),
+            ('UPI/RENT/MAY', -15000),
+            ('NACH-DR-HDFC HOME', -12000),
+            ('UPI/JIO PREPAID', -299),
+        ]), ['Salary', 'Food', 'Cash', 'Rent', 'Loans', 'Bills'])
+
+    def test_keywords_match_whole_words(self):
+        self.assertEqual(self.categories([
+            ('NEFT TO OWN CURRENT A/C', -20000),
+            ('UPI/TORRENT POWER', -3000),
+            ('IMPS/PARENTS SUPPORT', -10000),
+            ('UPI/SPINACH STORE', -200),
+            ('UPI/JIOMART', -800),
+        ]), [UNCATEGORIZED] * 5)
+
+    def test_first_matching_rule_wins(self):
+        rules = RuleSet([
+            {'category': 'Fees', 'keywords': ['charges'], 'max_amount': 1000, 'debit': True},
+            {'category': 'Refunds', 'keywords': ['charges', 'refund'], 'debit': False},
+            {'category': 'Other'},
+        ])
+        self.assertEqual(self.categories([
+            ('SMS ALERT CHARGES', -15),
+            ('ANNUAL CHARGES', -1500),
+            ('CHARGES REVERSED', 15),
+            ('CASHBACK', 5),
+        ], rules=rules), ['Fees', 'Other', 'Refunds', 'Other'])
+
+    def test_classifier_labels_what_no_rule_matches(self):
+        classifier = NarrationClassifier(
+            ['CULT GYM MEMBERSHIP', 'GOLDS GYM FEES', 'APOLLO PHARMACY', 'MEDPLUS PHARMACY'],
+            ['Fitness', 'Fitness', 'Health', 'Health'])
+        self.assertEqual(classifier.classes[classifier.predict(['UPI/ANYTIME GYM', 'NETMEDS PHARMACY'])].tolist(),
+                         ['Fitness', 'Health'])
+        self.assertEqual(classifier.predict(['UPI/9876543210']).tolist(), [-1])
+        self.assertEqual(self.categories([
+            ('UPI/SWIGGY GYM', -300),
+            ('UPI/ANYTIME GYM', -1200),
+            ('UPI/9876543210', -100),
+        ], classifier=classifier), ['Food', 'Fitness', UNCATEGORIZED])
+
+    def test_category_totals(self):
+        df = self.frame([('UPI/SWIGGY', -450.5), ('UPI/ZOMATO', -200), ('SALARY', 50000), ('REFUND SWIGGY', 100)])
+        totals = category_totals(df).set_index('Category')
+        self.assertEqual(totals.loc['Food'].tolist(), [3, to_paise(650.5), to_paise(100)])
+        self.assertEqual(totals.loc['Salary'].tolist(), [1, 0, to_paise(50000)])
+
+
+class StoredStatementTestCase(TestCase):
+    """A session holding one synthetic statement, stored in a temporary directory."""
+    ROWS = 500
+
+    def setUp(self):
+        store = tempfile.TemporaryDirectory()
+        self.addCleanup(store.cleanup)
+        settings = override_settings(STATEMENT_STORE_DIR=store.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        preset_cache.clear()
+
+        self.df = parse_text('\n'.join(statement_text(self.ROWS)))
+        self.handle = save_statement(self.df)
+        save_aggregates(self.handle, self.df)
+        session = self.client.session
+        session['statements'] = [self.handle]
+        session.save()
+
+    def add_preset(self, **fields):
+        preset = Preset.objects.create(name=fields.pop('name', 'Preset'), **fields)
+        presets_changed()
+        return preset
+
+
+class ResultsPageTests(StoredStatementTestCase):
+    def results(self, *presets):
+        return self.client.get(reverse('results'), {'presets': ','.join(str(preset.pk) for preset in presets)})
+
+    def test_failed_analysis_still_renders(self):
+        preset = self.add_preset(preset_type='keyword', keywords='upi')
+        with mock.patch('analyzer.planner.evaluate_stored_presets', side_effect=RuntimeError('broken')):
+            response = self.results(preset)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['results'], [])
+        self.assertContains(response, 'Error analyzing presets: broken')
+
+    def test_failing_preset_does_not_hide_the_others(self):
+        from analyzer import planner
+        broken = self.add_preset(name='Broken', preset_type='keyword', keywords='upi')
+        working = self.add_preset(name='Working', preset_type='amount_filter', amount_value=0, comparison_type='gt')
+
+        def failing(evaluate):
+            # preset_totals and _query_preset both take the preset second
+            def wrapper(source, preset):
+                if preset.pk == broken.pk:
+                    raise RuntimeError('broken')
+                return evaluate(source, preset)
+            return wrapper
+
+        for pushed_down in [False, True]:
+            with self.subTest(pushed_down=pushed_down), \
+                    override_settings(SQL_PUSHDOWN_ROWS=1 if pushed_down else None), \
+                    mock.patch.object(planner, 'preset_totals', failing(planner.preset_totals)), \
+                    mock.patch.object(planner, '_query_preset', failing(planner._query_preset)):
+                response = self.results(broken, working)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([item['preset'] for item in response.context['results']], [working])
+                self.assertContains(response, 'Error analyzing with preset &#x27;Broken&#x27;: broken')
+
+    def test_missing_dates_leave_the_range_open(self):
+        middle = self.df['Date'].iloc[len(self.df) // 2]
+        for fields, expected in [({'start_date': middle.date()}, (self.df['Date'] >= middle).sum()),
+                                 ({'end_date': middle.date()}, (self.df['Date'] <= middle).sum()),
+                                 ({}, len(self.df))]:
+            preset = self.add_preset(preset_type='date_range', **fields)
+            for pushed_down in [False, True]:
+                with self.subTest(fields=fields, pushed_down=pushed_down), \
+                        override_settings(SQL_PUSHDOWN_ROWS=1 if pushed_down else None):
+                    response = self.results(preset)
+                    self.assertEqual(response.context['results'][0]['result']['transaction_count'], expected)
+                    export = self.client.get(reverse('export_transactions', args=[preset.pk]))
+                    self.assertEqual(export.status_code, 200)
+                    self.assertEqual(len(b''.join(export.streaming_content).splitlines()), expected + 1)
+                    for view in ['preset_transactions', 'preset_chart_data']:
+                        self.assertEqual(self.client.get(reverse(view, args=[preset.pk])).status_code, 200)
+
+    def test_transaction_views_use_the_preset_cache(self):
+        preset = self.add_preset(preset_type='keyword', keywords='upi')
+        preset_cache.get(preset.pk)
+        for view in ['preset_transactions', 'export_transactions']:
+            with self.subTest(view), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(view, args=[preset.pk]))
+                if view == 'export_transactions':
+                    b''.join(response.streaming_content)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse([query for query in queries if 'analyzer_preset' in query['sql']])
+                self.assertEqual(self.client.get(reverse(view, args=[preset.pk + 1])).status_code, 404)
+
+    def test_pushed_down_charts_match_the_aggregate_charts(self):
+        from analyzer.aggregates import render_aggregate_chart, render_query_chart
+        overlap = parse_text('\n'.join(statement_text(self.ROWS, seed=1))).iloc[self.ROWS // 2:]
+        handles = [self.handle, save_statement(pd.concat([self.df.iloc[self.ROWS // 2:], overlap]))]
+        middle = self.df['Date'].iloc[len(self.df) // 2].date()
+        for preset in [Preset(name='All', preset_type='date_range'),
+                       Preset(name='Later', preset_type='date_range', start_date=middle),
+                       Preset(name='Shopping', preset_type='keyword', keywords='amazon, swiggy, upi'),
+                       Preset(name='Between', preset_type='amount_filter', amount_value=99.99,
+                              comparison_type='between', amount_max=5000.01),
+                       Preset(name='None', preset_type='keyword', keywords='no such narration')]:
+            with self.subTest(preset.name):
+                expected = render_aggregate_chart(handles, preset, 'json')
+                with CaptureQueriesContext(connection) as queries:
+                    chart = render_query_chart(handles, preset, 'json')
+                self.assertEqual(chart, expected)
+                # aggregated in the database, never read row by row
+                self.assertFalse([query for query in queries
+                                  if 'analyzer_transaction' in query['sql'] and 'GROUP BY' not in query['sql']])
+
+    def test_pushed_down_totals_are_exact(self):
+        presets = [self.add_preset(name='All', preset_type='date_range'),
+                   self.add_preset(name='Shopping', preset_type='keyword', keywords='amazon, swiggy'),
+                   self.add_preset(name='Between', preset_type='amount_filter', amount_value=99.99,
+                                   comparison_type='between', amount_max=5000.01)]
+        responses = dict()
+        for pushed_down in [False, True]:
+            with override_settings(SQL_PUSHDOWN_ROWS=1 if pushed_down else None):
+                responses[pushed_down] = self.results(*presets).context
+        for stored, pushed in zip(responses[False]['results'], responses[True]['results']):
+            with self.subTest(stored['preset'].name):
+                for key in ['transaction_count', 'total_withdrawal', 'total_deposit', 'keyword_stats']:
+                    self.assertEqual(stored['result'].get(key), pushed['result'].get(key))
+        self.assertEqual(responses[True]['results'][0]['result']['total_withdrawal'],
+                         to_rupees(withdrawals(self.df).sum()))
+        self.assertEqual(responses[False]['categories'], responses[True]['categories'])
+
+    def test_pages_read_a_repeated_statement_once(self):
+        from analyzer import planner
+        handles = [self.handle, self.handle]
+        preset = Preset(name='All', preset_type='date_range')
+        for pushed_down in [False, True]:
+            with self.subTest(pushed_down=pushed_down), \
+                    override_settings(SQL_PUSHDOWN_ROWS=1 if pushed_down else None):
+                # bounded, so a cursor that stops advancing fails instead of hanging
+                pages = list(islice(planner.iter_transaction_pages(handles, preset, size=64), 20))
+                self.assertEqual(sum(len(page) for page in pages), len(self.df))
+
+    def test_failed_category_breakdown_still_renders(self):
+        preset = self.add_preset(preset_type='keyword', keywords='upi')
+        with mock.patch('analyzer.planner.category_breakdown', side_effect=RuntimeError('broken')):
+            response = self.results(preset)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['categories'], [])
+
+
+class SampleTests(StoredStatementTestCase):
+    def test_samples_match_the_first_page_of_each_preset(self):
+        from analyzer import planner
+        # a later statement overlapping the first one, so samples skip its repeated rows
+        overlap = parse_text('\n'.join(statement_text(self.ROWS, seed=1))).iloc[self.ROWS // 2:]
+        handles = [self.handle, save_statement(pd.concat([self.df.iloc[self.ROWS // 2:], overlap]))]
+        presets = [Preset(name='Shopping', preset_type='keyword', keywords='amazon, swiggy'),
+                   Preset(name='Amazon', preset_type='keyword', keywords='amazon'),
+                   Preset(name='Large', preset_type='amount_filter', amount_value=5000, comparison_type='gt'),
+                   Preset(name='All', preset_type='date_range')]
+
+        with mock.patch.object(planner, 'SAMPLE_CHUNK_ROWS', 64):
+            results = planner.evaluate_stored_presets(handles, presets, sample_size=40)
+        for preset, result in zip(presets, results):
+            with self.subTest(preset.name):
+                page, _ = planner.transaction_page(handles, preset, size=40)
+                self.assertEqual(len(result['transactions']), 40)
+                self.assertEqual(result['transactions'],
+                                 page.drop(columns=['Reference', 'Balance'] if preset.preset_type == 'keyword' else [])
+                                 .to_dict('records'))
+
+
+class UploadedStatementTests(StoredStatementTestCase):
+    def job(self, **fields):
+        job = UploadJob.objects.create(file_count=1, **fields)
+        session = self.client.session
+        session['upload_jobs'] = [str(job.pk)]
+        session.save()
+        return job
+
+    def test_statement_uploaded_again_is_held_once(self):
+        self.job(status='done', statements=[save_statement(self.df)])
+        self.client.get(reverse('index'))
+        self.assertEqual(self.client.session['statements'], [self.handle])
+        self.assertEqual(Statement.objects.get(pk=self.handle).reference_count, 1)
+
+    def test_clearing_the_session_releases_finished_jobs(self):
+        self.job(status='done', statements=[save_statement(self.df)])
+        self.client.get(reverse('clear'))
+        self.assertFalse(Statement.objects.filter(pk=self.handle).exists())
+
+    def test_clearing_the_session_releases_running_jobs(self):
+        job = self.job()
+        clear = lambda handle, df: self.client.get(reverse('clear'))
+        with mock.patch('analyzer.extraction.extract_statements', return_value=[(self.df, None)]), \
+                mock.patch('analyzer.aggregates.save_aggregates', side_effect=clear):
+            run_upload(job.pk, [('statement.pdf', b'')])
+        self.assertEqual(UploadJob.objects.get(pk=job.pk).status, 'failed')
+        self.assertFalse(Statement.objects.filter(pk=self.handle).exists())
+
+
+class PurgeStatementsTests(StoredStatementTestCase):
+    def purge(self):
+        call_command('purge_statements', stdout=StringIO())
+
+    def stored(self):
+        from django.conf import settings
+        return set(Statement.objects.values_list('pk', flat=True)), set(os.listdir(settings.STATEMENT_STORE_DIR))
+
+    def test_statements_of_expired_sessions_are_removed(self):
+        from django.conf import settings
+        unheld = save_statement(parse_text('\n'.join(statement_text(50, seed=2))))
+        recent = save_statement(parse_text('\n'.join(statement_text(50, seed=3))))
+        old = timezone.now() - timedelta(seconds=2 * settings.UPLOAD_JOB_TIMEOUT)
+        Statement.objects.exclude(pk=recent).update(saved_at=old)
+
+        self.purge()
+        statements, files = self.stored()
+        self.assertEqual(statements, {self.handle, recent})
+        self.assertFalse([name for name in files if name.startswith(unheld)])
+        self.assertIn(self.handle, files)
+
+        Session.objects.update(expire_date=old)
+        self.purge()
+        statements, files = self.stored()
+        self.assertEqual(statements, {recent})
+        self.assertFalse([name for name in files if name.startswith(self.handle)])
+
+
+class EvaluateApiTests(StoredStatementTestCase):
+    def evaluate(self, client=None, **payload):
+        return (client or self.client).post(reverse('evaluate_api'), json.dumps(payload),
+                                            content_type='application/json')
+
+    def lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_session_statements_are_evaluated(self):
+        preset = self.add_preset(preset_type='amount_filter', amount_value=0, comparison_type='gt')
+        lines = self.lines(self.evaluate(presets=[preset.pk], statements=[self.handle]))
+        self.assertEqual(lines[0]['result']['transaction_count'], len(self.df))
+
+    def test_other_sessions_statements_are_refused(self):
+        preset = self.add_preset(preset_type='amount_filter', amount_value=0, comparison_type='gt')
+        response = self.evaluate(self.client_class(), presets=[preset.pk], statements=[self.handle])
+        self.assertEqual(response.status_code, 404)
+
+    def test_inline_keywords_are_not_stored(self):
+        from django.conf import settings
+        before = sorted(os.listdir(settings.STATEMENT_STORE_DIR))
+        lines = self.lines(self.evaluate(presets=[{'preset_type': 'keyword', 'keywords': 'upi, neft'}]))
+        self.assertTrue(lines[0]['result']['transaction_count'])
+        self.assertEqual(sorted(os.listdir(settings.STATEMENT_STORE_DIR)), before)
+
+    def test_incomplete_definitions_are_refused(self):
+        for definition in [{'preset_type': 'date_range', 'start_date': '2025-01-01'},
+                           {'preset_type': 'keyword', 'keywords': ' '},
+                           {'preset_type': 'amount_filter', 'comparison_type': 'gt'},
+                           {'preset_type': 'amount_filter', 'amount_value': 10, 'comparison_type': 'between'}]:
+            with self.subTest(definition):
+                response = self.evaluate(presets=[definition])
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('presets[0]', response.json()['error'])
+
+    def test_failing_preset_gets_its_own_error_line(self):
+        from analyzer import planner
+        preset_totals = planner.preset_totals
+
+        def totals(handles, preset):
+            if preset.preset_type == 'keyword':
+                raise RuntimeError('broken')
+            return preset_totals(handles, preset)
+
+        with mock.patch.object(planner, 'preset_totals', totals):
+            lines = self.lines(self.evaluate(presets=[
+                {'preset_type': 'keyword', 'keywords': 'upi'},
+                {'preset_type': 'amount_filter', 'amount_value': 0, 'comparison_type': 'gt'},
+            ]))
+        self.assertEqual([line['index'] for line in lines], [0, 1])
+        self.assertEqual((lines[0]['error'], lines[0]['result']), ('broken', None))
+        self.assertEqual(lines[1]['result']['transaction_count'], len(self.df))
@@ -1,10 +1,18 @@
 from django.urls import path
-from analyzer.views import IndexView, CreatePresetView, delete_preset, results, clear_session
+from analyzer.views import (IndexView, CreatePresetView, delete_preset, results, clear_session, job_status,
+                            preset_chart, preset_chart_data, preset_transactions, export_transactions,
+                            evaluate_api)
 
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
     path('create_preset/<str:preset_type>/', CreatePresetView.as_view(), name='create_preset'),
     path('delete_preset/<int:id>/', delete_preset, name='delete_preset'),
     path('results/', results, name='results'),
-    path('c/', clear_session, name='clear')
+    path('c/', clear_session, name='clear'),
+    path('jobs/<uuid:job_id>/', job_status, name='job_status'),
+    path('charts/<int:preset_id>.png', preset_chart, name='preset_chart'),
+    path('charts/<int:preset_id>.json', preset_chart_data, name='preset_chart_data'),
+    path('transactions/<int:preset_id>/', preset_transactions, name='preset_transactions'),
+    path('transactions/<int:preset_id>.csv', export_transactions, name='export_transactions'),
+    path('api/evaluate/', evaluate_api, name='evaluate_api')
 ]
\ No newline at end of file
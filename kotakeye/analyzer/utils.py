@@ -1,81 +1,170 @@
-from io import BytesIO
 from datetime import date
-import pdfplumber
+import numpy as np
 import pandas as pd
-import re
 import base64
+from analyzer.extraction import extract_statements
+from analyzer.matching import keyword_matcher
+from analyzer.amounts import AmountIndex, EQUAL, histogram
+from analyzer.rollups import choose_bucket, rollup
+from analyzer.schema import to_rupees, withdrawals, deposits, flows, records
+from analyzer.instrumentation import timed
+from analyzer.charts import render_chart, draw_daily_totals, draw_keyword_distribution, draw_amount_histogram
 
 
-def get_pdf_df(pdf_file, password=None):
-    pdf = pdfplumber.open(pdf_file, password=password)
-    transactions = list()
-    
-    for page in pdf.pages:
-        text = page.extract_text()
-        
-        pattern = r'(\d{2}-\d{2}-\d{4})\s+(.*?)\s+(\S+?)\s+([0-9,.]+\([DrC]+\))\s+([0-9,.]+\([DrC]+\))'
-        
-        matches = re.findall(pattern, text)
-        
-        for match in matches:
-            date, narration, reference, amount, balance = match
-            
-            amount_val = float(amount.split('(')[0].replace(',',''))
-            is_withdrawal = '(Dr)' in amount
-            withdrawal = amount_val if is_withdrawal else 0
-            deposit = amount_val if not is_withdrawal else 0
-            
-            balance_val = float(balance.split('(')[0].replace(',',''))
-            
-            transactions.append({
-                'Date': date,
-                'Narration': narration.strip(),
-                'Reference': reference,
-                'Withdrawal': withdrawal,
-                'Deposit': deposit,
-                'Balance': balance_val
-            })
-    pdf.close()
-    
-    if not transactions:
-        return None
-    
-    df = pd.DataFrame(transactions)
-    df['Date'] = pd.to_datetime(df['Date'], format='%d-%m-%Y')
+def get_pdf_df(pdf_file, password=None, workers=1, cache=None):
+    df, error = extract_statements([pdf_file], password, workers, cache)[0]
+    if error is not None:
+        raise error
     return df
 
+def date_range_mask(df, start_date, end_date):
+    # a missing date leaves that end of the range open
+    mask = np.ones(len(df), dtype=bool)
+    if start_date is not None:
+        if isinstance(start_date, date):
+            start_date = pd.to_datetime(start_date, format='%d-%m-%Y')
+        mask &= (df['Date'] >= start_date).to_numpy()
+    if end_date is not None:
+        if isinstance(end_date, date):
+            end_date = pd.to_datetime(end_date, format='%d-%m-%Y')
+        mask &= (df['Date'] <= end_date).to_numpy()
+    return mask
+
 def filter_date_range(df, start_date, end_date):
-    if isinstance(start_date, date):
-        start_date = pd.to_datetime(start_date, format='%d-%m-%Y')
-    if isinstance(end_date, date):
-        end_date = pd.to_datetime(end_date, format='%d-%m-%Y')
-    
-    return df[(df['Date'] >= start_date) & (df['Date'] <= end_date)]
+    return df[date_range_mask(df, start_date, end_date)]
 
-def filter_keyword(df, keywords):
-    ret_df = df[df['Narration'].str.contains('|'.join(keywords), case=False)].copy()
-    ret_df['Keyword'] = ret_df['Narration'].apply(lambda x: ', '.join([k for k in keywords if k.lower() in x.lower()]))
-    ret_df = ret_df.drop(['Reference', 'Balance'], axis=1) 
+def match_keywords(df, keywords):
+    return keyword_matcher(tuple(keywords)).match(df['Narration'])
+
+def filter_keyword(df, keywords, matched=None):
+    hits, labels = matched if matched is not None else match_keywords(df, keywords)
+    mask = hits.any(axis=1)
+    ret_df = df[mask].drop(['Reference', 'Balance'], axis=1)
+    ret_df['Keyword'] = labels[mask]
     return ret_df
 
 
-def amount_filter(df, amount, comparison_type):
-      if comparison_type == 'eq':
-        return (df[(df['Withdrawal'] == amount) | (df['Deposit'] == amount)], 
-                f"equal to {amount}")
-        
-      elif comparison_type == 'lt':
-          return (df[(df['Withdrawal'] < amount) & (df['Withdrawal'] > 0) | 
-                          (df['Deposit'] < amount) & (df['Deposit'] > 0)],
-                  f"less than {amount}")
-      elif comparison_type == 'gt':
-          return (df[(df['Withdrawal'] > amount) | (df['Deposit'] > amount)],
-                  f"greater than {amount}")
-      else:
-          return None
+def comparison_text(amount, comparison_type, amount_max=None):
+    if comparison_type in EQUAL:
+        return f"equal to {amount}"
+    elif comparison_type == 'lt':
+        return f"less than {amount}"
+    elif comparison_type == 'gt':
+        return f"greater than {amount}"
+    elif comparison_type == 'between':
+        return f"between {amount} and {amount_max}"
+    else:
+        return None
+
+
+def amount_mask(df, amount, comparison_type, amount_max=None, index=None):
+    """(mask, comparison_text) for rows moving an amount that matches, or None.
+
+    index is the AmountIndex of df; pass it when one is kept for the data
+    set so df's amounts are not sorted again.
+    """
+    if index is None:
+        index = AmountIndex(df['Amount'].to_numpy())
+    span = index.span(amount, comparison_type, amount_max)
+    if span is None:
+        return None
+    return index.mask(span), comparison_text(amount, comparison_type, amount_max)
+
+
+def amount_filter(df, amount, comparison_type, amount_max=None):
+    index = AmountIndex(df['Amount'].to_numpy())
+    span = index.span(amount, comparison_type, amount_max)
+    if span is None:
+        return None
+    return df.iloc[index.rows(span)], comparison_text(amount, comparison_type, amount_max)
+      
+      
+def plot_daily_totals(daily_totals, bucket='day', chart_format='png'):
+    return render_chart(draw_daily_totals, daily_totals, bucket, chart_format=chart_format)
+
+
+def plot_date_range(filtered_df, start_date, end_date, chart_format='png'):
+    # long ranges are drawn per week, month or quarter instead of per day
+    bucket = choose_bucket(start_date or filtered_df['Date'].min(), end_date or filtered_df['Date'].max())
+    totals = flows(filtered_df).assign(Count=1).set_index(filtered_df['Date']).sort_index()
+    rolled = rollup(totals, bucket)
+    return plot_daily_totals(rolled[['Withdrawal', 'Deposit']], bucket, chart_format)
+
+
+def plot_keywords(distribution, chart_format='png'):
+    return render_chart(draw_keyword_distribution, distribution, chart_format=chart_format)
+
+
+def plot_amounts(filtered_df, amount, comparison_text, chart_format='png'):
+    counts, edges = histogram(np.abs(filtered_df['Amount'].to_numpy()))
+    return plot_amount_histogram(counts, edges, amount, comparison_text, chart_format)
+
+
+def plot_amount_histogram(counts, edges, amount, comparison_text, chart_format='png'):
+    return render_chart(draw_amount_histogram, counts, edges, amount, comparison_text, chart_format=chart_format)
+
+
+def keyword_distribution(filtered_df):
+    return flows(filtered_df).groupby(filtered_df['Keyword']).agg({
+    'Withdrawal': 'sum',
+    'Deposit': 'sum'
+    })
+
+
+def parse_keywords(keywords):
+    return [k.strip().lower() for k in (keywords or '').split(',') if k.strip()]
+
+
+def render_preset_chart(df, preset, chart_format='png'):
+    """PNG bytes of the chart for a preset, or None if nothing matches it.
+    
+    chart_format 'json' returns the chart's series instead (see
+    analyzer.charts.render_chart).
+    """
+    if df is None or df.empty:
+        return None
+    
+    if preset.preset_type == 'date_range':
+        filtered_df = filter_date_range(df, preset.start_date, preset.end_date)
+        if filtered_df.empty:
+            return None
+        return plot_date_range(filtered_df, preset.start_date, preset.end_date, chart_format)
+    
+    elif preset.preset_type == 'keyword':
+        keyword_list = parse_keywords(preset.keywords)
+        if not keyword_list:
+            return None
+        filtered_df = filter_keyword(df, keyword_list)
+        return plot_keywords(keyword_distribution(filtered_df), chart_format) if not filtered_df.empty else None
+    
+    elif preset.preset_type == 'amount_filter':
+        filtered = amount_filter(df, preset.amount_value, preset.comparison_type, preset.amount_max)
+        if filtered is None or filtered[0].empty:
+            return None
+        return plot_amounts(filtered[0], preset.amount_value, filtered[1], chart_format)
+    
+    return None
+
+
+def inline_chart(chart):
+    # JSON series are embedded as they are, PNGs as base64
+    if not isinstance(chart, bytes):
+        return chart
+    return base64.b64encode(chart).decode('utf-8')
       
       
-def analyze_date_range(df, start, end):
+def _totals(filtered_df):
+    withdrawal = to_rupees(withdrawals(filtered_df).sum())
+    deposit = to_rupees(deposits(filtered_df).sum())
+    return {
+        'total_withdrawal': withdrawal,
+        'total_deposit': deposit,
+        'net_flow': deposit - withdrawal,
+    }
+
+
+@timed('analyze_date_range')
+def analyze_date_range(df, start, end, chart=True, chart_format='png'):
     if df is None or df.empty:
         return None
     
@@ -87,52 +176,30 @@ def analyze_date_range(df, start, end):
             'total_withdrawal': 0,
             'total_deposit': 0,
             'net_flow': 0,
-            'transactions': filtered_df.to_dict('records'),
+            'transactions': [],
             'chart': None
         }
     
-    daily_totals = filtered_df.groupby(filtered_df['Date'].dt.date).agg({
-        'Withdrawal': 'sum',
-        'Deposit': 'sum'
-    })
-
-    ax = daily_totals.plot.bar(
-        width=0.8,
-        figsize=(10, 5),
-        alpha=0.6,
-        stacked=False  
-    )
-
-    ax.set_title('Daily Transaction Flow')
-    ax.set_xlabel('Date')
-    ax.set_ylabel('Amount')
-    ax.legend(['Deposits', 'Withdrawals'])
-    
-    buffer = BytesIO()
-    ax.figure.savefig(buffer, format='png')
-    buffer.seek(0)
-    chart_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    
     return {
         'transaction_count': len(filtered_df),
-        'total_withdrawal': filtered_df['Withdrawal'].sum(),
-        'total_deposit': filtered_df['Deposit'].sum(),
-        'net_flow': filtered_df['Deposit'].sum() - filtered_df['Withdrawal'].sum(),
-        'transactions': filtered_df.to_dict('records')[:10],
-        'chart': chart_image
+        **_totals(filtered_df),
+        'transactions': records(filtered_df.head(10)),
+        'chart': inline_chart(plot_date_range(filtered_df, start, end, chart_format)) if chart else None
     }
     
 
-def analyze_keywords(df, keywords:str):
+@timed('analyze_keywords')
+def analyze_keywords(df, keywords:str, chart=True, chart_format='png'):
     if df is None or df.empty or not keywords:
         return None
     
-    keyword_list = [k.strip().lower() for k in keywords.split(',') if k.strip()]
+    keyword_list = parse_keywords(keywords)
     
     if not keyword_list:
         return None
     
-    filtered_df = filter_keyword(df, keyword_list)
+    hits, labels = match_keywords(df, keyword_list)
+    filtered_df = filter_keyword(df, keyword_list, (hits, labels))
     
     if filtered_df.empty:
         return {
@@ -145,54 +212,37 @@ def analyze_keywords(df, keywords:str):
             'chart': None
         }
     
-    distribution = filtered_df.groupby('Keyword').agg({
-    'Withdrawal': 'sum',
-    'Deposit': 'sum'
-    })  
-    
-    ax = distribution.plot.bar(
-    width=0.8,
-    figsize=(10, 5),
-    alpha=0.6,
-    stacked=False,
-    color = ['red', 'blue']
-    )
-
-    ax.set_title('Daily Transaction Flow')
-    ax.set_xlabel('Keyword')
-    ax.set_ylabel('Amount')
-    
-    buffer = BytesIO()
-    ax.figure.savefig(buffer, format='png')
-    buffer.seek(0)
-    chart_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    distribution = keyword_distribution(filtered_df)
     
+    # paise sums stay exact in float64 well past any statement's total
+    keyword_totals = to_rupees(hits.T.astype(np.float64) @ np.column_stack([withdrawals(df), deposits(df)]))
     keyword_stats = [{
         'keyword': keyword,
-        'count': len(filtered_df[filtered_df['Keyword'] == keyword]),
-        'withdrawal': distribution.loc[keyword, 'Withdrawal'],
-        'deposit': distribution.loc[keyword, 'Deposit']
-    } for keyword in keyword_list]
+        'count': int(count),
+        'withdrawal': withdrawal,
+        'deposit': deposit
+    } for keyword, count, (withdrawal, deposit) in zip(keyword_list, hits.sum(axis=0), keyword_totals)]
             
     return {
         'transaction_count': len(filtered_df),
-        'total_withdrawal': filtered_df['Withdrawal'].sum(),
-        'total_deposit': filtered_df['Deposit'].sum(),
-        'net_flow': filtered_df['Deposit'].sum() - filtered_df['Withdrawal'].sum(),
+        **_totals(filtered_df),
         'keywords': keyword_list,
         'keyword_stats': keyword_stats,
-        'transactions': filtered_df.to_dict('records')[:10],
-        'chart': chart_image
+        'transactions': records(filtered_df.head(10)),
+        'chart': inline_chart(plot_keywords(distribution, chart_format)) if chart else None
     }
     
     
-def analyze_amount_filter(df, amount, comparison_type):
+@timed('analyze_amount_filter')
+def analyze_amount_filter(df, amount, comparison_type, chart=True, amount_max=None, chart_format='png'):
     if df is None or df.empty:
         return None
-    try:
-        filtered_df, comparison_text = amount_filter(df, amount, comparison_type)
-    except TypeError:
+    index = AmountIndex(df['Amount'].to_numpy())
+    span = index.span(amount, comparison_type, amount_max)
+    if span is None:
         return None
+    filtered_df = df.iloc[index.rows(span)]
+    text = comparison_text(amount, comparison_type, amount_max)
     
     if filtered_df.empty:
         return {
@@ -200,37 +250,16 @@ def analyze_amount_filter(df, amount, comparison_type):
             'total_withdrawal': 0,
             'total_deposit': 0,
             'net_flow': 0,
-            'comparison_text': comparison_text,
+            'comparison_text': text,
             'transactions': [],
             'chart': None
         }
-    all_amounts = []
-    all_amounts.extend(filtered_df[filtered_df['Withdrawal'] > 0]['Withdrawal'].tolist())
-    all_amounts.extend(filtered_df[filtered_df['Deposit'] > 0]['Deposit'].tolist())
-
-    amounts_series = pd.DataFrame(all_amounts)
-    # ax = filtered_df[['Withdrawal', 'Deposit']].plot.hist(alpha=0.7, figsize=(10, 5), stacked=False)
-    # print(filtered_df[['Withdrawal', 'Deposit']])
-    ax = amounts_series.plot.hist(bins=20, alpha=0.7, figsize=(10, 5), legend=False)
-
-    ax.axvline(x=amount, color='r', linestyle='--', label=f'Filter amount: {amount}')
-    ax.set_title(f'Distribution of Transaction Amounts {comparison_text}')
-    ax.set_xlabel('Amount')
-    ax.set_ylabel('Frequency')
-    handles, labels = ax.get_legend_handles_labels()
-    ax.legend(handles=handles[1:], labels=labels[1:])
-    
-    buffer = BytesIO()
-    ax.figure.savefig(buffer, format='png')
-    buffer.seek(0)
-    chart_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
     
     return {
         'transaction_count': len(filtered_df),
-        'total_withdrawal': filtered_df['Withdrawal'].sum(),
-        'total_deposit': filtered_df['Deposit'].sum(),
-        'net_flow': filtered_df['Deposit'].sum() - filtered_df['Withdrawal'].sum(),
-        'comparison_text': comparison_text,
-        'transactions': filtered_df.to_dict('records')[:10],
-        'chart': chart_image
+        **_totals(filtered_df),
+        'comparison_text': text,
+        'transactions': records(filtered_df.head(10)),
+        'chart': (inline_chart(plot_amount_histogram(*index.histogram(span), amount, text, chart_format))
+                  if chart else None)
     }
\ No newline at end of file
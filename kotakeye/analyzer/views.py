@@ -1,69 +1,83 @@
+import json
+from itertools import chain
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.views import View
 from django.views.generic import CreateView
-from django.http import Http404
-from analyzer.models import Preset
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.text import slugify
+from django.conf import settings
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+from analyzer.models import Preset, UploadJob, Statement
 from analyzer.forms import DateRangePresetForm, KeywordSearchPresetForm, AmountFilterPresetForm
-from analyzer.utils import get_pdf_df, analyze_amount_filter, analyze_date_range, analyze_keywords
-import json
-import pandas as pd
+from analyzer.jobs import submit_upload, attach_finished_jobs, fail_stale_jobs, discard_jobs
+from analyzer.charts import ChartCache, chart_key, preset_fingerprint
+from analyzer.presets import preset_cache, presets_changed, preset_from_definition
+from analyzer.instrumentation import stage
+
+# pandas, matplotlib and pdfplumber are imported by the views that use
+# them, so management commands and light pages start without them; see
+# analyzer.preload for loading them up front in production workers.
+
+chart_cache = ChartCache(settings.CHART_CACHE_MAX_BYTES)
+
+
+def report_finished_jobs(request):
+    from analyzer.store import dataset_fingerprint
+    previous_handles = request.session.get('statements', [])
+    jobs = attach_finished_jobs(request.session)
+    if jobs and previous_handles:
+        chart_cache.invalidate(dataset=dataset_fingerprint(previous_handles))
+    for job in jobs:
+        for error in job.errors:
+            messages.error(request, error, extra_tags='danger')
+        if job.statements:
+            messages.success(request, f'Successfully processed {len(job.statements)} statement(s)')
+        elif not job.errors:
+            messages.warning(request, "No valid data was extracted from the uploaded files")
+    return jobs
+
 
 class IndexView(View):
     def get(self, request, *args, **kwargs):
-        request.session.setdefault('dataframes', list())
+        request.session.setdefault('statements', list())
+        report_finished_jobs(request)
         
-        date_range_presets = Preset.objects.filter(preset_type='date_range').order_by('name')
-        keyword_presets = Preset.objects.filter(preset_type='keyword').order_by('name')
-        amount_filter_presets = Preset.objects.filter(preset_type='amount_filter').order_by('name')
-        pdf_count = len(request.session.get('dataframes', []))
+        presets = preset_cache.by_type()
+        pdf_count = len(request.session.get('statements', []))
 
         context = {
             'pdf_count': pdf_count,
-            'date_range_presets': date_range_presets,
-            'amount_presets': amount_filter_presets,
-            'keyword_presets': keyword_presets
+            'date_range_presets': presets['date_range'],
+            'amount_presets': presets['amount_filter'],
+            'keyword_presets': presets['keyword'],
+            'pending_jobs': request.session.get('upload_jobs', [])
         }
         return render(request, 'index.html', context)
 
     def post(self, request, *args, **kwargs):
-        password = request.POST.get('password', None)
-        uploaded_files = request.FILES.getlist('pdf_files')
-        dfs = request.session.get('dataframes', [])
-        pdf_count = len(dfs)
+        with stage('read_upload'):
+            password = request.POST.get('password', None)
+            uploaded_files = request.FILES.getlist('pdf_files')
         
-        for pdf_file in uploaded_files:
-            try:
-                df = get_pdf_df(pdf_file, password)
-                if df is not None:
-                    df_json = df.to_json(orient='records', date_format='iso')
-                    print(df_json)
-                    dfs.append(json.loads(df_json))
-                    pdf_count += 1
-            except Exception as e:
-                messages.error(request,
-                               f'Error processing {pdf_file.name}: {str(e)}\nDid you enter the correct password?',
-                               extra_tags='danger')
-
-        request.session['dataframes'] = dfs
+        if not uploaded_files:
+            messages.warning(request, "No files were selected for upload")
+            return redirect('index')
         
-        date_range_presets = Preset.objects.filter(preset_type='date_range').order_by('name')
-        keyword_presets = Preset.objects.filter(preset_type='keyword').order_by('name')
-        amount_filter_presets = Preset.objects.filter(preset_type='amount_filter').order_by('name')
-
-        context = {
-            'pdf_count': pdf_count,
-            'date_range_presets': date_range_presets,
-            'amount_filter_presets': amount_filter_presets,
-            'keyword_presets': keyword_presets
-        }
+        with stage('submit'):
+            job = submit_upload(uploaded_files, password)
+        with stage('session'):
+            request.session['upload_jobs'] = request.session.get('upload_jobs', []) + [str(job.pk)]
         
-        if pdf_count > 0:
-            messages.success(request, f'Successfully processed {pdf_count} statement(s)')
-            return render(request, 'index.html', context)
-        else:
-            messages.warning(request, "No valid data was extracted from the uploaded files")
-            return redirect('index')
+        if not job.finished:
+            messages.info(request, f'Processing {job.file_count} statement(s) in the background')
+        return redirect('index')
         
 
 class CreatePresetView(CreateView):
@@ -99,6 +113,7 @@ class CreatePresetView(CreateView):
         preset = form.save(commit=False)
         preset.preset_type = self.preset_type if self.preset_type != 'keyword_search' else 'keyword'
         preset.save()
+        presets_changed()
         messages.success(self.request, f"Preset '{preset.name}' created successfully")
         return redirect('index')
 
@@ -108,19 +123,49 @@ def delete_preset(request, id):
     try:
         preset = get_object_or_404(Preset, pk=id)
         preset.delete()
+        presets_changed()
+        chart_cache.invalidate(preset_id=id)
     except Http404:
         messages.error(request, f"Preset does not exist with id: {id}", extra_tags='danger')
     return redirect('index')
 
 
 def clear_session(request):
-    request.session.pop('dataframes')
+    from analyzer.store import delete_statements, dataset_fingerprint
+    handles = request.session.pop('statements', [])
+    if handles:
+        chart_cache.invalidate(dataset=dataset_fingerprint(handles))
+    delete_statements(handles)
+    discard_jobs(request.session.pop('upload_jobs', []))
     return redirect('index')
     
     
+def job_status(request, job_id):
+    report_finished_jobs(request)
+    fail_stale_jobs([job_id])
+    job = get_object_or_404(UploadJob, pk=job_id)
+    return JsonResponse({
+        'id': str(job.pk),
+        'status': job.status,
+        'finished': job.finished,
+        'file_count': job.file_count,
+        'statement_count': len(job.statements),
+    })
+    
+    
+def _chart_format(preset):
+    """'png' or 'json': whether results show a preset's chart as an image or draw it in the browser."""
+    return preset.chart_mode or settings.CHART_MODE
+
+
 def results(request):
-    session_dataframes = request.session.get('dataframes', [])
-    if not session_dataframes:
+    from analyzer.planner import evaluate_stored_presets, evaluate_presets_in_db, category_breakdown
+    from analyzer.aggregates import merge_report
+    from analyzer.store import dataset_fingerprint, should_push_down
+    with stage('session'):
+        report_finished_jobs(request)
+        handles = request.session.get('statements', [])
+    if not handles:
         messages.warning(request, "No bank statements have been uploaded yet")
         return redirect('index')
     
@@ -131,56 +176,297 @@ def results(request):
         messages.warning(request, "No presets selected for analysis")
         return redirect('index')
     
-    dataframes = []
-    for df_dict in session_dataframes:
-        df = pd.DataFrame.from_dict(df_dict)
-        if 'Date' in df.columns:
-            df['Date'] = pd.to_datetime(df['Date'])
-        dataframes.append(df)
+    dataset = dataset_fingerprint(handles)
+    results = []
+    
+    with stage('presets'):
+        found = preset_cache.in_bulk(selected_preset_ids)
+        for preset_id in selected_preset_ids:
+            if preset_id not in found:
+                messages.warning(request, f"Preset does not exist with id: {preset_id}")
+        presets = list(found.values())
     
-    if dataframes:
-        combined_df = pd.concat(dataframes, ignore_index=True)
-    else:
+    report = {'duplicates': 0, 'balance_breaks': 0}
+    categories = []
+    try:
+        # large data sets are queried in the database; otherwise totals come
+        # from the per-statement aggregates and only sample rows are read
+        with stage('evaluate'):
+            if should_push_down(handles):
+                analysis_results = evaluate_presets_in_db(handles, presets)
+            else:
+                analysis_results = evaluate_stored_presets(handles, presets)
+        with stage('merge_report'):
+            report = merge_report(handles)
+        with stage('categories'):
+            categories = category_breakdown(handles)
+    except (OSError, ValueError):
         messages.error(request, "Error reconstructing transaction data", extra_tags='danger')
         return redirect('index')
+    except Exception as e:
+        messages.error(request, f"Error analyzing presets: {str(e)}", extra_tags='danger')
+        analysis_results = []
     
-    results = []
+    for preset, analysis_result in zip(presets, analysis_results):
+        if analysis_result and 'error' in analysis_result:
+            # the other presets were still evaluated
+            messages.error(request, f"Error analyzing with preset '{preset.name}': {analysis_result['error']}",
+                           extra_tags='danger')
+        elif analysis_result:
+            chart_url = None
+            if analysis_result['transaction_count']:
+                # the query string changes with the data and the preset,
+                # so browsers can keep the chart for as long as it is valid
+                view = 'preset_chart' if _chart_format(preset) == 'png' else 'preset_chart_data'
+                chart_url = (f"{reverse(view, args=[preset.pk])}"
+                             f"?d={dataset}&v={preset_fingerprint(preset)}")
+            results.append({
+                'preset': preset,
+                'result': analysis_result,
+                'chart_url': chart_url,
+                'chart_format': _chart_format(preset),
+            })
     
-    for preset_id in selected_preset_ids:
-        try:
-            preset = get_object_or_404(Preset, pk=preset_id)
-            
-            if preset.preset_type == 'date_range':
-                analysis_result = analyze_date_range(
-                    combined_df, preset.start_date, preset.end_date
-                )
-                
-            elif preset.preset_type == 'keyword':
-                analysis_result = analyze_keywords(combined_df, preset.keywords)
-                
-            elif preset.preset_type == 'amount_filter':
-                analysis_result = analyze_amount_filter(
-                    combined_df, preset.amount_value, preset.comparison_type
-                )
-                
-            
-            if analysis_result:
-                results.append({
-                    'preset': preset,
-                    'result': analysis_result,
-                })
-            
-        except Http404:
-            messages.warning(request, f"Preset does not exist with id: {preset_id}")
-        except Exception as e:
-            messages.error(request, f"Error analyzing with preset '{preset.name}': {str(e)}", extra_tags='danger')
     
+    if report['balance_breaks']:
+        messages.warning(request, f"{report['balance_breaks']} transaction(s) do not follow the running balance; "
+                                  "a statement may be missing")
     
     context = {
         'results': results,
-        'pdf_count': len(session_dataframes)
+        'pdf_count': len(handles),
+        'duplicate_count': report['duplicates'],
+        'categories': categories,
+        'json_charts': any(item['chart_url'] and item['chart_format'] == 'json' for item in results),
+    }
+    
+    with stage('render'):
+        return render(request, 'results.html', context)
+
+
+def _chart_etag(request, preset_id):
+    from analyzer.store import dataset_fingerprint
+    handles = request.session.get('statements', [])
+    preset = preset_cache.get(preset_id)
+    if not handles or preset is None:
+        return None
+    dataset, pk, fingerprint, _ = chart_key(dataset_fingerprint(handles), preset)
+    return f'{dataset}-{pk}-{fingerprint}'
+
+
+def _chart_body(request, preset_id, chart_format):
+    from analyzer.aggregates import render_aggregate_chart, render_query_chart
+    from analyzer.store import dataset_fingerprint, should_push_down
+    handles = request.session.get('statements', [])
+    if not handles:
+        raise Http404
+    
+    preset = preset_cache.get(preset_id)
+    if preset is None:
+        raise Http404
+    key = chart_key(dataset_fingerprint(handles), preset, chart_format)
+    
+    body = chart_cache.get(key)
+    if body is None:
+        with stage('chart'):
+            if should_push_down(handles):
+                chart = render_query_chart(handles, preset, chart_format)
+            else:
+                chart = render_aggregate_chart(handles, preset, chart_format)
+        if chart is None:
+            raise Http404
+        body = chart if chart_format == 'png' else json.dumps(chart, separators=(',', ':')).encode()
+        chart_cache.put(key, body)
+    return body
+
+
+@condition(etag_func=_chart_etag)
+@cache_control(private=True, max_age=settings.CHART_MAX_AGE)
+def preset_chart(request, preset_id):
+    return HttpResponse(_chart_body(request, preset_id, 'png'), content_type='image/png')
+
+
+@condition(etag_func=_chart_etag)
+@cache_control(private=True, max_age=settings.CHART_MAX_AGE)
+def preset_chart_data(request, preset_id):
+    return HttpResponse(_chart_body(request, preset_id, 'json'), content_type='application/json')
+
+
+def _parse_cursor(value):
+    if not value:
+        return None
+    index, _, position = value.partition('.')
+    return int(index), int(position)
+
+
+def _format_cursor(cursor):
+    return f'{cursor[0]}.{cursor[1]}' if cursor is not None else None
+
+
+def preset_transactions(request, preset_id):
+    from analyzer.planner import transaction_page
+    handles = request.session.get('statements', [])
+    if not handles:
+        raise Http404
+    
+    preset = preset_cache.get(preset_id)
+    if preset is None:
+        raise Http404
+    try:
+        page = transaction_page(handles, preset, _parse_cursor(request.GET.get('after')))
+    except ValueError:
+        raise Http404
+    if page is None:
+        raise Http404
+    
+    frame, next_cursor = page
+    context = {
+        'preset': preset,
+        'transactions': frame.to_dict('records'),
+        'show_keywords': 'Keyword' in frame.columns,
+        'next_cursor': _format_cursor(next_cursor),
+        'first_page': not request.GET.get('after'),
     }
+    return render(request, 'transactions.html', context)
+
+
+def _csv_chunks(frames):
+    header = True
+    for frame in frames:
+        yield frame.to_csv(index=False, header=header, date_format='%Y-%m-%d')
+        header = False
+
+
+def export_transactions(request, preset_id):
+    from analyzer.planner import iter_transaction_pages
+    handles = request.session.get('statements', [])
+    if not handles:
+        raise Http404
+    
+    preset = preset_cache.get(preset_id)
+    if preset is None:
+        raise Http404
+    pages = iter_transaction_pages(handles, preset)
+    # the first page is read up front so a preset that cannot be evaluated
+    # gets a 404 instead of an empty download
+    first = next(pages, None)
+    if first is None:
+        raise Http404
+    
+    response = StreamingHttpResponse(_csv_chunks(chain([first], pages)), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{slugify(preset.name) or "transactions"}.csv"'
+    return response
+
+
+def _api_error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _api_presets(items):
+    """Presets for the ids and inline definitions of an API request.
+
+    Raises ValidationError naming the first item that is neither a saved
+    preset's id nor a valid definition.
+    """
+    saved = preset_cache.in_bulk([item for item in items if isinstance(item, int)])
+    presets = list()
+    for index, item in enumerate(items):
+        if isinstance(item, bool):
+            raise ValidationError(f'presets[{index}]: not a preset id or definition')
+        if isinstance(item, int):
+            if item not in saved:
+                raise ValidationError(f'presets[{index}]: preset {item} does not exist')
+            presets.append(saved[item])
+            continue
+        try:
+            presets.append(preset_from_definition(item))
+        except ValidationError as e:
+            raise ValidationError(f'presets[{index}]: {"; ".join(e.messages)}')
+    return presets
+
+
+def _api_lines(handles, presets, sample_size):
+    from analyzer.planner import evaluate_stored_presets, evaluate_presets_in_db
+    from analyzer.store import should_push_down
+    evaluate = evaluate_presets_in_db if should_push_down(handles) else evaluate_stored_presets
+    batch_size = settings.API_BATCH_SIZE
+    
+    for start in range(0, len(presets), batch_size):
+        batch = presets[start:start + batch_size]
+        try:
+            analysis_results = evaluate(handles, batch, sample_size)
+        except (OSError, ValueError):
+            # the response has started, so errors are reported on each line
+            analysis_results = [{'error': 'Error reconstructing transaction data'} for _ in batch]
+        for index, (preset, result) in enumerate(zip(batch, analysis_results), start):
+            line = {
+                'index': index,
+                'preset': preset.pk,
+                'name': preset.name,
+                'preset_type': preset.preset_type,
+                'result': result,
+            }
+            if result is not None and 'error' in result:
+                line['result'], line['error'] = None, result['error']
+            elif result is not None:
+                result.pop('chart', None)
+            yield json.dumps(line, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+
+
+# Scripts post JSON without a CSRF token. Evaluating presets changes nothing,
+# and a cross-site page cannot read the response.
+@csrf_exempt
+@require_POST
+def evaluate_api(request):
+    """analyze_*-style totals (without charts) for many presets, one JSON line each.
+
+    The body is a JSON object with "presets", a list of saved preset ids or
+    inline preset definitions (objects of preset fields), and optionally
+    "statements", handles of statements uploaded in this session (all of
+    them by default), and "sample_size", the number of matching
+    transactions to include per preset. Presets are evaluated in batches of API_BATCH_SIZE and each
+    batch is streamed as soon as it is done, as newline-delimited JSON in
+    the order the presets were given. A preset that fails has an "error"
+    on its line instead of a result.
+    """
+    from analyzer.planner import SAMPLE_SIZE, PAGE_SIZE
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return _api_error('The request body must be JSON')
+    if not isinstance(payload, dict):
+        return _api_error('The request body must be a JSON object')
+    
+    items = payload.get('presets')
+    if not isinstance(items, list) or not items:
+        return _api_error('"presets" must be a non-empty list')
+    if len(items) > settings.API_MAX_PRESETS:
+        return _api_error(f'At most {settings.API_MAX_PRESETS} presets can be evaluated per request')
+    
+    sample_size = payload.get('sample_size', SAMPLE_SIZE)
+    if isinstance(sample_size, bool) or not isinstance(sample_size, int) or not 0 <= sample_size <= PAGE_SIZE:
+        return _api_error(f'"sample_size" must be a whole number from 0 to {PAGE_SIZE}')
+    
+    owned = request.session.get('statements', [])
+    handles = payload.get('statements', owned)
+    if not isinstance(handles, list) or not all(isinstance(handle, str) for handle in handles):
+        return _api_error('"statements" must be a list of statement handles')
+    handles = list(dict.fromkeys(handles))
+    if not handles:
+        return _api_error('No statements given and none uploaded in this session')
+    with stage('statements'):
+        # handles are content hashes, shared by every session that uploaded
+        # the same statement, so only this session's own can be read
+        if not set(handles) <= set(owned) or \
+                Statement.objects.filter(content_hash__in=handles).count() != len(handles):
+            return _api_error('Unknown statement handle', status=404)
+    
+    with stage('presets'):
+        try:
+            presets = _api_presets(items)
+        except ValidationError as e:
+            return _api_error('; '.join(e.messages))
     
-    return render(request, 'results.html', context)
+    return StreamingHttpResponse(_api_lines(handles, presets, sample_size), content_type='application/x-ndjson')
 
 #618278372
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""Amount preset filtering on synthetic statements.
+
+Compares comparisons answered from a prebuilt AmountIndex (two binary
+searches, then a mask or histogram over the selected run) against the
+per-call withdrawal/deposit masks and list-built histogram they replaced.
+Run from the kotakeye directory:
+
+    python -m benchmarks.bench_amounts [rows]
+"""
+import sys
+import time
+
+import numpy as np
+
+from analyzer.amounts import AmountIndex
+from analyzer.parser import parse_text
+from analyzer.schema import to_paise, to_rupees, withdrawals, deposits
+from benchmarks.synthetic import statement_text
+
+
+COMPARISONS = [(1000, 'lt'), (15000, 'gt'), (5000, '='), (500, 'between', 2000)]
+
+
+def legacy_filter(df, amount, comparison_type, amount_max=None):
+    withdrawal = withdrawals(df)
+    deposit = deposits(df)
+    amount_paise = to_paise(amount)
+    if comparison_type == 'lt':
+        mask = (withdrawal < amount_paise) & (withdrawal > 0) | (deposit < amount_paise) & (deposit > 0)
+    elif comparison_type == 'gt':
+        mask = (withdrawal > amount_paise) | (deposit > amount_paise)
+    elif comparison_type == 'between':
+        # written the same way; the legacy code had no range comparison
+        upper = to_paise(amount_max)
+        mask = ((withdrawal >= amount_paise) & (withdrawal <= upper)
+                | (deposit >= amount_paise) & (deposit <= upper))
+    else:
+        mask = (withdrawal == amount_paise) | (deposit == amount_paise)
+    filtered = df[mask]
+    all_amounts = withdrawals(filtered)[withdrawals(filtered) > 0].tolist()
+    all_amounts.extend(deposits(filtered)[deposits(filtered) > 0].tolist())
+    return mask, np.histogram(to_rupees(all_amounts), bins=20)
+
+
+def indexed_filter(index, amount, comparison_type, amount_max=None):
+    span = index.span(amount, comparison_type, amount_max)
+    return index.mask(span), index.histogram(span)
+
+
+def best_of(func, *args, repeat=5):
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(rows=200000):
+    df = parse_text('\n'.join(statement_text(rows)))
+    build_time = best_of(AmountIndex, df['Amount'].to_numpy())
+    index = AmountIndex(df['Amount'].to_numpy())
+
+    results = list()
+    for amount, comparison_type, *amount_max in COMPARISONS:
+        legacy_time = best_of(legacy_filter, df, amount, comparison_type, *amount_max)
+        indexed_time = best_of(indexed_filter, index, amount, comparison_type, *amount_max)
+        results.append({
+            'rows': len(df),
+            'comparison': comparison_type,
+            'build_seconds': build_time,
+            'legacy_seconds': legacy_time,
+            'indexed_seconds': indexed_time,
+            'speedup': legacy_time / indexed_time,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    for result in run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000):
+        print(f"{result['rows']} rows, {result['comparison']}: "
+              f"legacy {result['legacy_seconds'] * 1000:.2f}ms, "
+              f"indexed {result['indexed_seconds'] * 1000:.2f}ms "
+              f"(index built once in {result['build_seconds'] * 1000:.1f}ms), "
+              f"speedup {result['speedup']:.1f}x")
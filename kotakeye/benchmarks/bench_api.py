@@ -0,0 +1,101 @@
+"""Throughput of the JSON preset evaluation API.
+
+Posts batches of presets for a synthetic statement to /api/evaluate/
+through Django's test client, on a test database, and reports requests
+and presets evaluated per second for each batch size, with and without
+sample transactions in the results. Run from the kotakeye directory:
+
+    python -m benchmarks.bench_api [rows] [seconds]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kotakeye.settings')
+django.setup()
+
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment, setup_databases, teardown_databases
+
+from analyzer.aggregates import save_aggregates
+from analyzer.parser import parse_text
+from analyzer.presets import presets_changed
+from analyzer.store import save_statement, delete_statements
+from benchmarks.suite import PRESETS
+from benchmarks.synthetic import statement_text
+
+
+BATCH_SIZES = [1, 10, 100]
+
+
+def throughput(post, seconds):
+    """Calls of post per second, over at least the given time."""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        post()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+
+
+def run(rows=20000, seconds=2.0):
+    df = parse_text('\n'.join(statement_text(rows)))
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+    try:
+        with tempfile.TemporaryDirectory() as store, override_settings(STATEMENT_STORE_DIR=store):
+            presets = [type(preset).objects.create(**{field.name: getattr(preset, field.name)
+                                                      for field in preset._meta.concrete_fields if field.name != 'id'})
+                       for preset in PRESETS]
+            presets_changed()
+            handle = save_statement(df)
+            save_aggregates(handle, df)
+            client = Client()
+            session = client.session
+            session['statements'] = [handle]
+            session.save()
+
+            results = list()
+            for batch_size in BATCH_SIZES:
+                for sample_size in [10, 0]:
+                    body = json.dumps({
+                        'statements': [handle],
+                        'presets': [presets[i % len(presets)].pk for i in range(batch_size)],
+                        'sample_size': sample_size,
+                    })
+
+                    def post():
+                        response = client.post('/api/evaluate/', body, content_type='application/json')
+                        assert response.status_code == 200, response.status_code
+                        lines = b''.join(response.streaming_content).splitlines()
+                        assert len(lines) == batch_size, lines[-1]
+
+                    post()
+                    rate = throughput(post, seconds)
+                    results.append({
+                        'rows': len(df),
+                        'batch_size': batch_size,
+                        'sample_size': sample_size,
+                        'requests_per_sec': rate,
+                        'presets_per_sec': rate * batch_size,
+                    })
+            delete_statements([handle])
+    finally:
+        teardown_databases(databases, verbosity=0)
+        teardown_test_environment()
+    return results
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    for result in run(rows, seconds):
+        print(f"{result['rows']} rows, {result['batch_size']:>3} preset(s) per request, "
+              f"{result['sample_size']:>2} sample rows: "
+              f"{result['requests_per_sec']:8.1f} requests/s, {result['presets_per_sec']:8.1f} presets/s")
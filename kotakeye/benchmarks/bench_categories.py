@@ -0,0 +1,66 @@
+"""Category totals on synthetic statements.
+
+Compares totals per category taken from labels stored with the statement
+(one groupby) against one keyword preset per category, each scanning the
+narrations again, and reports the one-off cost of labelling at ingest.
+Run from the kotakeye directory:
+
+    python -m benchmarks.bench_categories [rows]
+"""
+import os
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kotakeye.settings')
+django.setup()
+
+from analyzer.aggregates import category_totals
+from analyzer.categories import DEFAULT_RULES, categorize
+from analyzer.matching import KeywordMatcher
+from analyzer.parser import parse_text
+from analyzer.schema import withdrawals, deposits
+from benchmarks.synthetic import statement_text
+
+
+def per_category_scans(df):
+    # what a keyword preset per category costs: every narration is scanned
+    # once per category
+    totals = dict()
+    for rule in DEFAULT_RULES:
+        hits, _ = KeywordMatcher(rule['keywords']).match(df['Narration'])
+        matched = hits.any(axis=1)
+        totals[rule['category']] = (int(matched.sum()), withdrawals(df)[matched].sum(), deposits(df)[matched].sum())
+    return totals
+
+
+def best_of(func, *args, repeat=3):
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(rows=200000):
+    df = parse_text('\n'.join(statement_text(rows)))
+    label_time = best_of(categorize, df)
+    labelled = df.assign(Category=categorize(df))
+    return {
+        'rows': len(df),
+        'categories': len(DEFAULT_RULES),
+        'label_seconds': label_time,
+        'scan_seconds': best_of(per_category_scans, df),
+        'groupby_seconds': best_of(category_totals, labelled),
+    }
+
+
+if __name__ == '__main__':
+    result = run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
+    print(f"{result['rows']} rows, {result['categories']} categories: "
+          f"one scan per category {result['scan_seconds'] * 1000:.1f}ms, "
+          f"groupby of stored labels {result['groupby_seconds'] * 1000:.1f}ms "
+          f"(labelled once at ingest in {result['label_seconds'] * 1000:.1f}ms), "
+          f"speedup {result['scan_seconds'] / result['groupby_seconds']:.1f}x")
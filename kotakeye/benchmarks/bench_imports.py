@@ -0,0 +1,88 @@
+"""Import time of the web application, its management commands and the pdfextractor CLI.
+
+Runs each entry point in a fresh interpreter under python -X importtime and
+reports the total import time and the slowest imports made directly by
+the modules it loads. No entry point may import the heavy dependencies
+that the analyzer loads lazily, so the run fails if pandas, numpy,
+matplotlib or pdfplumber show up, or if the median total exceeds --max-ms.
+Run from the kotakeye directory:
+
+    python -m benchmarks.bench_imports --max-ms 500
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUP = "import os, django; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kotakeye.settings'); django.setup(); "
+
+TARGETS = {
+    # what a worker or management command loads before handling anything;
+    # kotakeye.wsgi is left out because it preloads on purpose
+    'urls': (ROOT, SETUP + "import kotakeye.urls"),
+    # system checks import the URLconf and views; showmigrations (like
+    # migrate --plan) imports every migration module
+    'check': (ROOT, SETUP + "from django.core.management import call_command; call_command('check')"),
+    'showmigrations': (ROOT, SETUP + "from django.core.management import call_command; "
+                                     "call_command('showmigrations', 'analyzer')"),
+    'pdfextractor': (os.path.dirname(ROOT), 'import pdfextractor'),
+}
+
+HEAVY = ['pandas', 'numpy', 'matplotlib', 'pdfplumber', 'pdfminer']
+
+
+def import_times(code, cwd):
+    """(module, self µs, cumulative µs, depth) per import reported by -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=cwd,
+                            capture_output=True, text=True, check=True)
+    imports = list()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        # a single space, then two more per level of nesting
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(own), int(cumulative), depth))
+    return imports
+
+
+def measure(code, cwd, repeat):
+    runs = [import_times(code, cwd) for _ in range(repeat)]
+    totals = [sum(own for _, own, _, _ in imports) / 1000 for imports in runs]
+    imports = runs[-1]
+    top = sorted((entry for entry in imports if entry[3] == 1), key=lambda entry: -entry[2])
+    return {
+        'total_ms': statistics.median(totals),
+        'modules': len(imports),
+        'heavy': [name for name, *_ in imports if name in HEAVY],
+        'top': [(name, cumulative / 1000) for name, _, cumulative, _ in top[:10]],
+    }
+
+
+def run(repeat=3):
+    return {target: measure(code, cwd, repeat) for target, (cwd, code) in TARGETS.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure import time of the app and the CLI')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per target; the median total is reported')
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if any target takes longer than this to import')
+    args = parser.parse_args()
+
+    failures = list()
+    for target, result in run(args.repeat).items():
+        print(f"{target}: {result['total_ms']:.1f} ms, {result['modules']} modules")
+        for name, milliseconds in result['top']:
+            print(f'  {name:<40}{milliseconds:8.1f} ms')
+        if result['heavy']:
+            failures.append(f"{target} imports {', '.join(result['heavy'])}")
+        if args.max_ms is not None and result['total_ms'] > args.max_ms:
+            failures.append(f"{target} took {result['total_ms']:.1f} ms (limit {args.max_ms:.0f} ms)")
+
+    if failures:
+        sys.exit('\n'.join(failures))
@@ -0,0 +1,78 @@
+"""Keyword preset matching on synthetic statements.
+
+Compares the Aho–Corasick matcher in analyzer.matching against the regex
+filter, per-row apply and per-keyword re-filtering it replaced, for a
+growing number of keywords. Run from the kotakeye directory:
+
+    python -m benchmarks.bench_keywords [rows]
+"""
+import random
+import string
+import sys
+import time
+
+import numpy as np
+
+from analyzer.matching import KeywordMatcher
+from analyzer.parser import parse_text
+from analyzer.schema import withdrawals, deposits, display_frame
+from benchmarks.synthetic import MERCHANTS, statement_text
+
+
+def legacy_match(df, keywords):
+    ret_df = df[df['Narration'].str.contains('|'.join(keywords), case=False)].copy()
+    ret_df['Keyword'] = ret_df['Narration'].apply(lambda x: ', '.join([k for k in keywords if k.lower() in x.lower()]))
+    distribution = ret_df.groupby('Keyword').agg({'Withdrawal': 'sum', 'Deposit': 'sum'})
+    return [len(ret_df[ret_df['Keyword'] == keyword]) for keyword in keywords], distribution
+
+
+def matcher_match(df, keywords):
+    # compiled per call so the timing includes building the automaton
+    hits, labels = KeywordMatcher(keywords).match(df['Narration'])
+    totals = hits.T.astype(np.float64) @ np.column_stack([withdrawals(df), deposits(df)])
+    return hits.sum(axis=0), totals
+
+
+def keyword_list(count, seed=0):
+    rng = random.Random(seed)
+    keywords = [merchant.lower() for merchant in MERCHANTS[:count]]
+    while len(keywords) < count:
+        keywords.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+    return keywords
+
+
+def best_of(func, *args, repeat=3):
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(rows=20000, keyword_counts=(4, 32, 256)):
+    df = parse_text('\n'.join(statement_text(rows)))
+    # the legacy code ran on rupee columns and plain object strings
+    legacy_df = display_frame(df)
+    results = list()
+
+    for count in keyword_counts:
+        keywords = keyword_list(count)
+        legacy_time = best_of(legacy_match, legacy_df, keywords)
+        matcher_time = best_of(matcher_match, df, keywords)
+        results.append({
+            'rows': len(df),
+            'keywords': count,
+            'legacy_seconds': legacy_time,
+            'matcher_seconds': matcher_time,
+            'speedup': legacy_time / matcher_time,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    for result in run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000):
+        print(f"{result['rows']} rows, {result['keywords']} keywords: "
+              f"legacy {result['legacy_seconds']:.3f}s, "
+              f"matcher {result['matcher_seconds']:.3f}s, "
+              f"speedup {result['speedup']:.1f}x")
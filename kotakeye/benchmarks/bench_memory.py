@@ -0,0 +1,48 @@
+"""Memory footprint of parsed statements, per column.
+
+Compares the compact layout built by analyzer.parser (paise integers, a
+debit flag, categorical strings where values repeat) against the float and
+object columns it replaced, for narrations that are almost all distinct and
+for narrations that repeat. Run from the kotakeye directory:
+
+    python -m benchmarks.bench_memory [rows]
+"""
+import sys
+
+from analyzer.parser import parse_text
+from analyzer.schema import display_frame
+from benchmarks.synthetic import statement_text
+
+
+def column_bytes(df):
+    return {column: int(size) for column, size in df.memory_usage(deep=True, index=False).items()}
+
+
+def run(rows=100000, payees=(None, 50)):
+    results = list()
+    for count in payees:
+        df = parse_text('\n'.join(statement_text(rows, payees=count)))
+        # the previous layout: float rupee columns and object strings
+        legacy = column_bytes(display_frame(df))
+        compact = column_bytes(df)
+        results.append({
+            'rows': len(df),
+            'distinct_narrations': df['Narration'].nunique(),
+            'legacy': legacy,
+            'compact': compact,
+            'legacy_total': sum(legacy.values()),
+            'compact_total': sum(compact.values()),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    for result in run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000):
+        print(f"{result['rows']} rows, {result['distinct_narrations']} distinct narrations:")
+        for column, size in result['legacy'].items():
+            print(f"  legacy  {column:<12}{size / 2**20:8.2f} MiB")
+        for column, size in result['compact'].items():
+            print(f"  compact {column:<12}{size / 2**20:8.2f} MiB")
+        print(f"  total: legacy {result['legacy_total'] / 2**20:.2f} MiB, "
+              f"compact {result['compact_total'] / 2**20:.2f} MiB, "
+              f"{result['legacy_total'] / result['compact_total']:.1f}x smaller")
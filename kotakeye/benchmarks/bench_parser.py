@@ -0,0 +1,79 @@
+"""Parser throughput on synthetic statements.
+
+Compares analyzer.parser against the per-row regex parser it replaced, on
+statement text split into pages the way pdfplumber returns it. Run from the
+kotakeye directory:
+
+    python -m benchmarks.bench_parser [rows]
+"""
+import re
+import sys
+import time
+
+import pandas as pd
+
+from analyzer.parser import match_lines, build_frame
+from analyzer.schema import display_frame
+from benchmarks.synthetic import statement_text
+
+
+def legacy_parse(pages):
+    transactions = list()
+
+    for text in pages:
+        pattern = r'(\d{2}-\d{2}-\d{4})\s+(.*?)\s+(\S+?)\s+([0-9,.]+\([DrC]+\))\s+([0-9,.]+\([DrC]+\))'
+
+        for date, narration, reference, amount, balance in re.findall(pattern, text):
+            amount_val = float(amount.split('(')[0].replace(',',''))
+            is_withdrawal = '(Dr)' in amount
+            transactions.append({
+                'Date': date,
+                'Narration': narration.strip(),
+                'Reference': reference,
+                'Withdrawal': amount_val if is_withdrawal else 0,
+                'Deposit': amount_val if not is_withdrawal else 0,
+                'Balance': float(balance.split('(')[0].replace(',',''))
+            })
+
+    df = pd.DataFrame(transactions)
+    df['Date'] = pd.to_datetime(df['Date'], format='%d-%m-%Y')
+    return df
+
+
+def fast_parse(pages):
+    rows = list()
+    for text in pages:
+        rows.extend(match_lines(text))
+    return build_frame(rows)
+
+
+def best_of(func, pages, repeat=5):
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(pages)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run(rows=10000):
+    pages = statement_text(rows)
+    legacy_time, legacy_df = best_of(legacy_parse, pages)
+    fast_time, fast_df = best_of(fast_parse, pages)
+    pd.testing.assert_frame_equal(legacy_df, display_frame(fast_df), check_dtype=False)
+
+    return {
+        'rows': len(fast_df),
+        'pages': len(pages),
+        'legacy_rows_per_sec': len(legacy_df) / legacy_time,
+        'fast_rows_per_sec': len(fast_df) / fast_time,
+        'speedup': legacy_time / fast_time,
+    }
+
+
+if __name__ == '__main__':
+    result = run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
+    print(f"{result['rows']} rows over {result['pages']} pages: "
+          f"legacy {result['legacy_rows_per_sec']:,.0f} rows/s, "
+          f"fast {result['fast_rows_per_sec']:,.0f} rows/s, "
+          f"speedup {result['speedup']:.1f}x")
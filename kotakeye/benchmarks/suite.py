@@ -0,0 +1,275 @@
+"""End-to-end benchmark suite with a JSON report.
+
+Generates a synthetic statement PDF and measures parse throughput, analysis
+and chart latency per preset type, peak RSS and the latency of the results
+page and its charts through Django's test client. Charts are measured as
+server-rendered PNGs and as the JSON series drawn in the browser, with their
+payload sizes. The report can be saved and later runs compared against it.
+Run from the kotakeye directory:
+
+    python -m benchmarks.suite --pages 20 --rows 2000 --output report.json
+    python -m benchmarks.suite --baseline report.json
+
+Comparing exits with status 1 if any metric is worse than the baseline by
+more than --tolerance.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import django
+import psutil
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kotakeye.settings')
+django.setup()
+
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.test.utils import setup_test_environment, teardown_test_environment, setup_databases, teardown_databases
+
+from analyzer.aggregates import save_aggregates
+from analyzer.models import Preset
+from analyzer.presets import presets_changed
+from analyzer.store import save_statement, delete_statements, dataset_fingerprint
+from analyzer.views import chart_cache
+from analyzer.utils import (get_pdf_df, analyze_date_range, analyze_keywords, analyze_amount_filter,
+                            render_preset_chart)
+from benchmarks.synthetic import statement_pdf
+
+
+# Presets measured by the analysis, chart and results benchmarks.
+PRESETS = [
+    Preset(name='First half', preset_type='date_range',
+           start_date=datetime.date(2025, 1, 1), end_date=datetime.date(2025, 6, 30)),
+    Preset(name='Shopping', preset_type='keyword', keywords='amazon, swiggy, zomato'),
+    Preset(name='Large', preset_type='amount_filter', amount_value=15000, comparison_type='gt'),
+]
+
+
+class PeakRss:
+    """Highest resident memory of this process and its children while active."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _rss(self):
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss())
+
+    def __enter__(self):
+        self.peak = self._rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+
+def median_time(func, repeat):
+    """Median seconds over repeat calls of func, and its last result."""
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def metric(value, unit, better='lower'):
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def bench_parse(data, pages, workers, repeat):
+    metrics = dict()
+    for label, count in [('serial', 1), ('parallel', workers)]:
+        with PeakRss() as rss:
+            seconds, df = median_time(lambda: get_pdf_df(data, workers=count), repeat)
+        metrics[f'parse.{label}.rows_per_sec'] = metric(len(df) / seconds, 'rows/s', 'higher')
+        metrics[f'parse.{label}.pages_per_sec'] = metric(pages / seconds, 'pages/s', 'higher')
+        metrics[f'parse.{label}.peak_rss_mb'] = metric(rss.peak / 2**20, 'MiB')
+    return df, metrics
+
+
+def encode_chart(data):
+    # as the chart data view sends it
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def bench_analysis(df, repeat):
+    date_range, keyword, amount = PRESETS
+    runs = {
+        'date_range': lambda: analyze_date_range(df, date_range.start_date, date_range.end_date, chart=False),
+        'keyword': lambda: analyze_keywords(df, keyword.keywords, chart=False),
+        'amount_filter': lambda: analyze_amount_filter(df, amount.amount_value, amount.comparison_type,
+                                                       chart=False),
+    }
+    metrics = dict()
+    with PeakRss() as rss:
+        for preset_type, run in runs.items():
+            metrics[f'analysis.{preset_type}_ms'] = metric(median_time(run, repeat)[0] * 1000, 'ms')
+        for preset in PRESETS:
+            seconds, png = median_time(lambda: render_preset_chart(df, preset), repeat)
+            metrics[f'chart.{preset.preset_type}_ms'] = metric(seconds * 1000, 'ms')
+            metrics[f'chart.{preset.preset_type}_bytes'] = metric(len(png), 'B')
+            seconds, data = median_time(lambda: encode_chart(render_preset_chart(df, preset, chart_format='json')),
+                                        repeat)
+            metrics[f'chart_json.{preset.preset_type}_ms'] = metric(seconds * 1000, 'ms')
+            metrics[f'chart_json.{preset.preset_type}_bytes'] = metric(len(data), 'B')
+    metrics['analysis.peak_rss_mb'] = metric(rss.peak / 2**20, 'MiB')
+    return metrics
+
+
+def bench_results(df, repeat):
+    """Latency of the results page for a session holding df, on a test database."""
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+    try:
+        with tempfile.TemporaryDirectory() as store, override_settings(STATEMENT_STORE_DIR=store):
+            presets = [Preset.objects.create(**{field.name: getattr(preset, field.name)
+                                                for field in Preset._meta.concrete_fields if field.name != 'id'})
+                       for preset in PRESETS]
+            presets_changed()
+            handle = save_statement(df)
+            save_aggregates(handle, df)
+
+            client = Client()
+            session = client.session
+            session['statements'] = [handle]
+            session.save()
+            url = '/results/?presets=' + ','.join(str(preset.pk) for preset in presets)
+
+            def get():
+                response = client.get(url)
+                assert response.status_code == 200, response.status_code
+
+            with PeakRss() as rss:
+                cold, _ = median_time(get, 1)
+                warm, _ = median_time(get, repeat)
+
+            # every chart of the page, rendered afresh, in both modes
+            charts = dict()
+            for chart_format, view in [('png', 'preset_chart'), ('json', 'preset_chart_data')]:
+                def get_charts():
+                    chart_cache.invalidate(dataset=dataset_fingerprint([handle]))
+                    payload = 0
+                    for preset in presets:
+                        response = client.get(reverse(view, args=[preset.pk]))
+                        assert response.status_code == 200, response.status_code
+                        payload += len(response.content)
+                    return payload
+                charts[chart_format] = median_time(get_charts, repeat)
+            delete_statements([handle])
+    finally:
+        teardown_databases(databases, verbosity=0)
+        teardown_test_environment()
+
+    return {
+        'results.cold_ms': metric(cold * 1000, 'ms'),
+        'results.warm_ms': metric(warm * 1000, 'ms'),
+        'results.peak_rss_mb': metric(rss.peak / 2**20, 'MiB'),
+        'results.charts_png_ms': metric(charts['png'][0] * 1000, 'ms'),
+        'results.charts_png_bytes': metric(charts['png'][1], 'B'),
+        'results.charts_json_ms': metric(charts['json'][0] * 1000, 'ms'),
+        'results.charts_json_bytes': metric(charts['json'][1], 'B'),
+    }
+
+
+def run(pages=20, rows=2000, workers=None, repeat=3):
+    workers = workers or os.cpu_count() or 1
+    data = statement_pdf(pages, rows)
+
+    df, metrics = bench_parse(data, pages, workers, repeat)
+    metrics.update(bench_analysis(df, repeat))
+    metrics.update(bench_results(df, repeat))
+
+    return {
+        'meta': {
+            'pages': pages,
+            'rows': len(df),
+            'workers': workers,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        },
+        'metrics': metrics,
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    """Per metric of both reports: (name, baseline, current, change, regressed).
+
+    change is the relative difference, positive when the current run is
+    better; a metric regresses when it is worse by more than tolerance.
+    """
+    rows = list()
+    for name, current in report['metrics'].items():
+        previous = baseline['metrics'].get(name)
+        if previous is None or not previous['value']:
+            continue
+        change = current['value'] / previous['value'] - 1
+        if current['better'] == 'lower':
+            change = -change
+        rows.append((name, previous['value'], current['value'], change, change < -tolerance))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark parsing, analysis and the results page')
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes for the parallel parse (default: all cores)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement; the median is reported')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--baseline', help='JSON report to compare this run against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slowdown allowed before a metric counts as a regression')
+    args = parser.parse_args()
+
+    # pdfminer warns about every generated page lacking a CropBox
+    logging.getLogger('pdfminer').setLevel(logging.ERROR)
+
+    report = run(args.pages, args.rows, args.workers, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    for name, value in report['metrics'].items():
+        print(f"{name:<36}{value['value']:>14,.2f} {value['unit']}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = 0
+        print()
+        for name, previous, current, change, regressed in compare(report, baseline, args.tolerance):
+            regressions += regressed
+            print(f"{name:<36}{previous:>14,.2f} -> {current:>14,.2f} {change:+7.1%}"
+                  f"{'  REGRESSED' if regressed else ''}")
+        if regressions:
+            sys.exit(f'{regressions} metric(s) regressed by more than {args.tolerance:.0%}')
@@ -0,0 +1,80 @@
+import math
+import random
+from io import BytesIO
+
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+
+MERCHANTS = ['AMAZON', 'NETFLIX', 'SWIGGY', 'ZOMATO', 'UBER', 'SALARY ACME CORP', 'RENT', 'ELECTRICITY BOARD']
+
+
+def statement_lines(rows, seed=0, year=2025, payees=None):
+    """Kotak-format transaction lines with a consistent running balance.
+
+    Narrations carry a random six-digit payee id, so almost all of them are
+    distinct; with payees set, ids are drawn from that many per merchant,
+    like an account paying the same people every month.
+    """
+    rng = random.Random(seed)
+    balance = 500000.0
+    lines = list()
+
+    for i in range(rows):
+        amount = round(rng.uniform(10, 20000), 2)
+        is_withdrawal = rng.random() < 0.7
+        balance += -amount if is_withdrawal else amount
+        merchant = rng.choice(MERCHANTS)
+        payee = rng.randint(100000, 999999)
+        if payees:
+            payee = 100000 + payee % payees
+        day = 1 + i * 365 // max(rows, 1)
+        month, day = divmod(day - 1, 31)
+        lines.append(
+            f'{min(day + 1, 28):02d}-{month % 12 + 1:02d}-{year} '
+            f'UPI/{merchant}/{payee}/Payment from Ph '
+            f'UPI-{i:010d} {amount:,.2f}({"Dr" if is_withdrawal else "Cr"}) '
+            f'{abs(balance):,.2f}({"Cr" if balance >= 0 else "Dr"})'
+        )
+    return lines
+
+
+def statement_text(rows, seed=0, rows_per_page=40, payees=None):
+    """Text of a statement split into pages, as pdfplumber would extract it."""
+    lines = statement_lines(rows, seed, payees=payees)
+    return [
+        '\n'.join(['Statement of Account', 'Date Narration Chq/Ref No Withdrawal (Dr)/ Deposit (Cr) Balance']
+                  + lines[start:start + rows_per_page])
+        for start in range(0, len(lines), rows_per_page)
+    ]
+
+
+# A4 in inches, and the text size and line spacing of the generated pages
+PAGE_SIZE = (8.27, 11.69)
+FONT_SIZE = 7
+LINE_SPACING = 1.4
+
+
+def statement_pdf(pages, rows, seed=0):
+    """PDF bytes of a Kotak-format statement with rows spread over pages.
+
+    Every line is drawn as real text, so pdfplumber extracts it the way it
+    does a bank's statement. Pages are made taller when they hold more
+    lines than fit on A4.
+    """
+    rows_per_page = max(math.ceil(rows / pages), 1)
+    texts = statement_text(rows, seed, rows_per_page)
+    texts += ['Statement of Account'] * (pages - len(texts))
+
+    line_height = FONT_SIZE * LINE_SPACING / 72
+    output = BytesIO()
+    with PdfPages(output) as pdf:
+        for text in texts:
+            lines = text.split('\n')
+            height = max(PAGE_SIZE[1], (len(lines) + 4) * line_height)
+            figure = Figure(figsize=(PAGE_SIZE[0], height))
+            for index, line in enumerate(lines):
+                figure.text(0.04, 1 - (index + 2) * line_height / height, line,
+                            fontsize=FONT_SIZE, family='monospace')
+            pdf.savefig(figure)
+    return output.getvalue()
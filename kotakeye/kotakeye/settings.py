@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'analyzer.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -121,6 +122,103 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Parsed statements are kept server-side as memory-mapped column files;
+# the session only stores their handles.
+STATEMENT_STORE_DIR = BASE_DIR / 'statements'
+
+# Statements are also stored as indexed Transaction rows. Once the
+# statements of a session hold at least this many transactions, presets are
+# evaluated with SQL queries instead of loading every row into memory.
+SQL_PUSHDOWN_ROWS = 200_000
+
+# Processes used to parse uploaded PDFs. 1 parses in the upload job's
+# thread (see UPLOAD_JOB_THREADS), None uses every available core.
+EXTRACTION_WORKERS = 4
+
+# Parsed statements keyed by a hash of the PDF (and its password), so
+# re-uploads skip parsing. Entries outlive the sessions that uploaded them
+# and are only evicted, least recently used first, past
+# PARSE_CACHE_MAX_BYTES. None turns the cache off.
+PARSE_CACHE_DIR = BASE_DIR / 'cache' / 'parsed'
+
+PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Threads that parse uploads in the background while the index page polls
+# for their status. 0 parses inside the upload request instead.
+UPLOAD_JOB_THREADS = 2
+
+# Seconds after which an upload that has not finished parsing is reported as
+# failed. Jobs run inside the server process, so a restart loses them, and
+# without this the index page would keep polling for them.
+UPLOAD_JOB_TIMEOUT = 30 * 60
+
+# Transactions are labelled with a category when a statement is stored.
+# CATEGORY_RULES replaces analyzer.categories.DEFAULT_RULES (same format)
+# when set. Narrations no rule matches are labelled by a naive Bayes
+# classifier trained on CATEGORY_TRAINING_FILE, a CSV file with narration
+# and category columns, if one is given.
+CATEGORY_RULES = None
+
+CATEGORY_TRAINING_FILE = None
+
+# The JSON evaluation API (analyzer.views.evaluate_api) evaluates at most
+# this many presets per request, streaming the results of each batch of
+# API_BATCH_SIZE as soon as it is done.
+API_MAX_PRESETS = 1000
+
+API_BATCH_SIZE = 50
+
+# Presets are served from a copy kept by each server process; a version
+# stamp in this cache tells the processes when to reload it, so it must be
+# shared by all of them. Files work for processes on one host; use memcached
+# or redis when serving from several.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'django',
+    }
+}
+
+# Rendered preset charts kept in memory by each server process, and how long
+# browsers may reuse a chart URL (its query string changes with the data).
+CHART_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+CHART_MAX_AGE = 24 * 60 * 60
+
+# How the results page shows charts unless a preset picks its own: 'png'
+# renders them with matplotlib on the server, 'json' sends the aggregated
+# series (daily totals, keyword totals, histogram bins) and draws them in
+# the browser, where they can be zoomed and re-bucketed.
+CHART_MODE = 'png'
+
+# Per-request stage timings, sent as Server-Timing headers and logged as
+# JSON on the analyzer.instrumentation logger. A PROFILE_SAMPLE_RATE share
+# of requests is also profiled with PROFILER ('cprofile' or 'pyinstrument')
+# and the profile written to PROFILE_DIR. Off, it adds no work to requests.
+INSTRUMENTATION_ENABLED = False
+
+PROFILE_SAMPLE_RATE = 0.0
+
+PROFILER = 'cprofile'
+
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+# Load pandas, matplotlib and pdfplumber when the WSGI application starts
+# (see analyzer.preload) rather than on the first request that needs them.
+# Management commands never load them up front either way.
+PRELOAD_ANALYZER = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'analyzer.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -1,54 +1,274 @@
-import pdfplumber
-import pandas as pd
-import re
+import argparse
+import glob
+import importlib.util
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kotakeye'))
+# analyzer modules (and with them pandas and pdfplumber) are imported where
+# they are first needed, so -h and up-to-date checks return at once
 
-def get_pdf_df(pdf_file, password=None):
-    pdf = pdfplumber.open(pdf_file, password=password)
-    transactions = list()
-    
-    for page in pdf.pages:
-        text = page.extract_text()
-        
-        pattern = r'(\d{2}-\d{2}-\d{4})\s+(.*?)\s+(\S+?)\s+([0-9,.]+\([DrC]+\))\s+([0-9,.]+\([DrC]+\))'
-        
-        matches = re.findall(pattern, text)
-        
-        for match in matches:
-            date, narration, reference, amount, balance = match
-            
-            amount_val = float(amount.split('(')[0].replace(',',''))
-            is_withdrawal = '(Dr)' in amount
-            withdrawal = amount_val if is_withdrawal else 0
-            deposit = amount_val if not is_withdrawal else 0
-            
-            balance_val = float(balance.split('(')[0].replace(',',''))
-            
-            transactions.append({
-                'Date': date,
-                'Narration': narration.strip(),
-                'Reference': reference,
-                'Withdrawal': withdrawal,
-                'Deposit': deposit,
-                'Balance': balance_val
-            })
-    pdf.close()
-    
-    if not transactions:
-        return None
-    
-    df = pd.DataFrame(transactions)
-    df['Date'] = pd.to_datetime(df['Date'], format='%d-%m-%Y')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'kotakeye')
+
+FORMATS = ['csv', 'parquet']
+
+
+def get_pdf_df(pdf_file, password=None, workers=1, cache=None):
+    from analyzer.extraction import extract_statements
+
+    df, error = extract_statements([pdf_file], password, workers, cache)[0]
+    if error is not None:
+        raise error
     return df
 
 
-if __name__ == '__main__':
-    import os
-    import sys
+def iter_batches(pdf_file, password=None, workers=1, cache=None):
+    # parsing serially without a cache never needs the whole statement in memory
+    if workers == 1 and cache is None:
+        from analyzer.extraction import iter_transactions
+
+        yield from iter_transactions(pdf_file, password)
+        return
+
+    df = get_pdf_df(pdf_file, password, workers, cache)
+    if df is not None:
+        yield df
+
+
+def write_csv(batches, path):
+    from analyzer.schema import display_frame
+
+    rows = 0
+    with open(path, 'w', newline='') as f:
+        for batch in batches:
+            batch = display_frame(batch)
+            batch.index += rows
+            batch.to_csv(f, header=rows == 0)
+            rows += len(batch)
+    return rows
+
+
+def write_parquet(batches, path):
+    """Write batches to a Parquet file, one row group per batch."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('Parquet output needs pyarrow (pip install pyarrow)')
+    from analyzer.schema import display_frame
+
+    rows = 0
+    writer = None
+    try:
+        for batch in batches:
+            table = pyarrow.Table.from_pandas(display_frame(batch), preserve_index=False)
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet}
+
+
+def expand_sources(patterns):
+    """PDF paths named by files, directories and glob patterns, without repeats."""
+    sources = list()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.pdf')))
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        sources += [match for match in matches if match not in sources]
+    return sources
+
+
+def output_path(source, output_dir, output_format):
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(output_dir, f'{name}.{output_format}')
+
+
+def is_up_to_date(source, output):
+    try:
+        return os.path.getmtime(output) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+
+def write_replacing(write, batches, output):
+    """Write batches with write(batches, path) and return the row count.
+
+    They go to a temporary file that replaces output only once complete, so
+    a failed or interrupted run never leaves a truncated output that looks
+    up to date. Nothing is written for statements without transactions.
+    """
+    tmp_path = f'{output}.{os.getpid()}.tmp'
+    try:
+        rows = write(batches, tmp_path)
+        if rows:
+            os.replace(tmp_path, output)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+
+def _collected(batches, parsed):
+    for batch in batches:
+        parsed.append(batch)
+        yield batch
+
+
+def convert_file(source, output, password=None, output_format='csv', cache_dir=None):
+    """Write the transactions of one statement to output and return the row count.
+
+    Pages are parsed and written a batch at a time (see write_replacing).
+    With a cache_dir, statements parsed before are written from the cache,
+    and others are stored in it once written, which keeps the whole
+    statement in memory.
+    """
+    from analyzer.extraction import iter_transactions, read_source, build_df
+    from analyzer.cache import ParseCache
+
+    parsed = None
+    cached = None
+    if cache_dir is not None:
+        cache = ParseCache(cache_dir)
+        key = cache.key(read_source(source), password)
+        cached = cache.get(key)
+        parsed = list() if cached is None else None
+
+    if cached is not None:
+        batches = [cached]
+    elif parsed is not None:
+        batches = _collected(iter_transactions(source, password), parsed)
+    else:
+        batches = iter_transactions(source, password)
+
+    rows = write_replacing(WRITERS[output_format], batches, output)
+    if rows and parsed is not None:
+        cache.put(key, build_df(parsed))
+    return rows
+
+
+def _convert(task):
+    try:
+        return task, convert_file(*task), None
+    except Exception as e:
+        return task, None, e
+
+
+def convert_files(tasks, workers):
+    """Run convert_file over (source, output, ...) tasks, yielding (task, rows, error) as they finish.
+
+    Each worker process converts whole files, so the imports and pdfplumber
+    setup are paid once per worker rather than once per file.
+    """
+    if workers > 1 and len(tasks) > 1:
+        finished = set()
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                futures = {pool.submit(_convert, task): task for task in tasks}
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        # a worker died, taking the files in flight with it
+                        result = futures[future], None, e
+                    finished.add(futures[future])
+                    yield result
+            return
+        except (OSError, NotImplementedError):
+            # no process pool on this platform
+            tasks = [task for task in tasks if task not in finished]
+
+    for task in tasks:
+        yield _convert(task)
+
+
+def run_batch(argv):
+    parser = argparse.ArgumentParser(prog='pdfextractor.py batch',
+                                     description='Convert many Kotak statement PDFs, in parallel')
+    parser.add_argument('sources', nargs='+', help='PDF files, directories or glob patterns')
+    parser.add_argument('--crn', default=None, help='password of the PDFs, if protected')
+    parser.add_argument('--output-dir', default='results')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='files converted at once (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='convert files whose output is up to date')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='parsed statements found here are written without re-parsing (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true', help='always re-parse the PDFs')
+    args = parser.parse_args(argv)
+    if args.format == 'parquet':
+        if importlib.util.find_spec('pyarrow') is None:
+            parser.error('Parquet output needs pyarrow (pip install pyarrow)')
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    cache_dir = None if args.no_cache else args.cache_dir
+
+    tasks = list()
+    outputs = dict()
+    failed = 0
+    for source in expand_sources(args.sources):
+        output = output_path(source, args.output_dir, args.format)
+        if output in outputs:
+            print(f'{source}: skipped, writes the same file as {outputs[output]}', file=sys.stderr)
+            failed += 1
+            continue
+        outputs[output] = source
+        if not args.force and is_up_to_date(source, output):
+            print(f'{source}: up to date')
+            continue
+        tasks.append((source, output, args.crn, args.format, cache_dir))
+
+    for (source, output, *_), rows, error in convert_files(tasks, args.workers or os.cpu_count() or 1):
+        if error is not None:
+            print(f'{source}: {error}', file=sys.stderr)
+            failed += 1
+        elif not rows:
+            print(f'{source}: no transactions found', file=sys.stderr)
+            failed += 1
+        else:
+            print(f'{source}: {rows} transactions -> {output}')
+
+    if failed:
+        sys.exit(f'{failed} file(s) not converted')
+
+
+def run_single(argv):
+    parser = argparse.ArgumentParser(description='Convert a Kotak statement PDF to CSV '
+                                                 '(or run "pdfextractor.py batch -h" for many files)')
+    parser.add_argument('file')
+    parser.add_argument('crn')
+    parser.add_argument('result_name')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes used to parse pages (default: all cores, 1 for serial)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='where parsed statements are cached (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true', help='always re-parse the PDF')
+    args = parser.parse_args(argv)
     
     os.makedirs('results', exist_ok=True)
     
-    _, file, crn, result_name = sys.argv
-    
-    df = get_pdf_df(file, crn)
-    df.to_csv(f'results/{result_name}.csv')
\ No newline at end of file
+    from analyzer.cache import ParseCache
+
+    cache = None if args.no_cache else ParseCache(args.cache_dir)
+    batches = iter_batches(args.file, args.crn, args.workers, cache)
+    output = f'results/{args.result_name}.csv'
+    if not write_replacing(write_csv, batches, output):
+        sys.exit(f'No transactions found in {args.file}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['batch']:
+        run_batch(sys.argv[2:])
+    else:
+        run_single(sys.argv[1:])